@@ -0,0 +1,528 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Local stand-in for the Globus Transfer, Auth and Groups APIs used by gdauth, to measure and debug gdauth
+without a Globus account or network access. The collection is an in-memory tree; the server
+answers the routes gdauth calls:
+
+    Transfer  GET  /v0.10/operation/endpoint/{id}/ls      (paged with offset / limit)
+              POST /v0.10/operation/endpoint/{id}/mkdir
+              GET  /v0.10/endpoint/{id}
+              GET  /v0.10/endpoint_search                 (paged with offset / limit)
+              GET  /v0.10/endpoint/{id}/access_list
+              POST /v0.10/endpoint/{id}/access
+              DELETE /v0.10/endpoint/{id}/access/{rule id}
+    Auth      GET  /v2/api/identities
+              POST /v2/oauth2/token                       (refresh token grant)
+    Groups    POST /v2/groups
+              GET  /v2/groups/my_groups
+              GET  /v2/groups/{id}                        (include=memberships)
+              POST /v2/groups/{id}                        (batch membership add)
+
+Each request can be delayed (--latency), failed with a 503 (--error-rate) and rejected with a
+429 and a Retry-After header above a request rate (--rate-limit). Requests are counted per route.
+
+Point gdauth at the server with the globus_sdk service URL variables and seed a token for the
+collection, the server accepts any bearer token::
+
+    $ python benchmarks/fake_globus.py --port 8765 --tree /data:1000:10 --seed-tokens ~/.gdauth/tokens.json
+    $ export GLOBUS_SDK_SERVICE_URL_TRANSFER=http://127.0.0.1:8765/
+    $ export GLOBUS_SDK_SERVICE_URL_AUTH=http://127.0.0.1:8765/
+    $ export GLOBUS_SDK_SERVICE_URL_GROUPS=http://127.0.0.1:8765/
+    $ gdauth links --dir data
+
+See benchmarks/globus_load.py for the benchmark suite running on top of it.
+
+"""
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import random
+import signal
+import argparse
+import threading
+import collections
+import urllib.parse
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+APP_UUID = '2f1fd715-ee09-43f9-9b48-1f06810bcc70'
+EP_UUID  = 'b07f6a40-672c-4ae8-b420-83eb6e925381'
+
+HTTPS_SERVER = 'https://g-fake00.fa4e.data.globus.org'
+
+# largest page returned by operation_ls, as the Transfer API
+LS_MAX_LIMIT = 100000
+
+
+def _normalize(path):
+    """
+    Absolute folder path ending with /, relative paths start at the collection root
+    """
+
+    path = '/' + '/'.join(p for p in urllib.parse.unquote(path or '/').split('/') if p and p != '~')
+
+    return path if path == '/' else path + '/'
+
+
+def _parent(path):
+    return path[:-1].rsplit('/', 1)[0] + '/'
+
+
+def seed_tokens(token_file, app_uuid=APP_UUID, ep_uuid=EP_UUID, lifetime=30 * 24 * 3600):
+    """
+    Save tokens accepted by the fake server in a gdauth JSON token store, so gdauth does not ask to login,
+    as after gdauth login --groups
+
+    Parameters
+    ----------
+    token_file : Name of the JSON token store, e.g. ~/.gdauth/tokens.json
+    app_uuid   : Globus App / Client UUID
+    ep_uuid    : Collection UUID
+    lifetime   : Seconds before the tokens expire
+    """
+
+    try:
+        with open(token_file) as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        data = {}
+    expires_at = int(time.time() + lifetime)
+    data.setdefault(app_uuid, {}).update({
+        resource_server: {'access_token': 'fake-access-' + resource_server, 'refresh_token': 'fake-refresh-' + resource_server,
+                          'expires_at_seconds': expires_at, 'scope': scope, 'token_type': 'Bearer'}
+        for resource_server, scope in (('transfer.api.globus.org', 'urn:globus:auth:scope:transfer.api.globus.org:all'),
+                                       ('groups.api.globus.org', 'urn:globus:auth:scope:groups.api.globus.org:all'),
+                                       (ep_uuid, 'https://auth.globus.org/scopes/%s/https' % ep_uuid))})
+    os.makedirs(os.path.dirname(os.path.abspath(token_file)), exist_ok=True)
+    with open(os.open(token_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'w') as f:
+        json.dump(data, f, indent=2)
+
+
+class FakeGlobus(object):
+    """
+    In-memory Transfer collection, identities, ACL rules and groups served over HTTP on a background thread
+
+    Parameters
+    ----------
+    port       : TCP port, 0 picks a free port
+    latency    : Seconds added to each response
+    error_rate : Fraction of the requests failing with a 503
+    rate_limit : Requests per second accepted before answering 429 with Retry-After, None is no limit
+    ep_uuid    : Collection UUID
+    seed       : Seed of the error injection
+
+    default_directory is the folder listed for an empty path or a path starting with ~, the root by default
+    """
+
+    def __init__(self, port=0, latency=0.0, error_rate=0.0, rate_limit=None, ep_uuid=EP_UUID, seed=0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.ep_uuid = ep_uuid
+        self.default_directory = '/'
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.reset()
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), _Handler)
+        self.server.daemon_threads = True
+        self.server.fake = self
+        self.thread = None
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:%d/' % self.server.server_address[1]
+
+    def env(self):
+        """
+        Environment variables sending the globus_sdk requests to this server
+        """
+        return {'GLOBUS_SDK_SERVICE_URL_TRANSFER': self.url, 'GLOBUS_SDK_SERVICE_URL_AUTH': self.url,
+                'GLOBUS_SDK_SERVICE_URL_GROUPS': self.url}
+
+    def reset(self):
+        """
+        Empty the collection, the ACL rules, the groups and the request counters
+        """
+        with self.lock:
+            self.tree = {'/': {}}
+            self.rules = []
+            self.identities = {}
+            self.groups = {}
+            self.counts = collections.Counter()
+            self.errors = collections.Counter()
+            self.window = (0, 0)
+
+    def add_tree(self, path, files=0, folders=0, size=1024):
+        """
+        Create path, its parents, files files and folders empty subfolders
+
+        Parameters
+        ----------
+        path    : Folder of the collection
+        files   : Number of files created in path
+        folders : Number of subfolders created in path
+        size    : Size of each file in bytes
+        """
+        with self.lock:
+            path = _normalize(path)
+            self._mkdir(path, parents=True)
+            entries = self.tree[path]
+            for i in range(files):
+                entries['file_%06d.h5' % i] = self._entry('file_%06d.h5' % i, 'file', size)
+            for i in range(folders):
+                self._mkdir(path + 'folder_%06d/' % i, parents=True)
+
+    def _entry(self, name, kind, size=0):
+        return {'DATA_TYPE': 'file', 'name': name, 'type': kind, 'size': size, 'permissions': '0755',
+                'last_modified': '2024-07-01 12:00:00+00:00', 'user': 'gdauth', 'group': 'gdauth', 'link_target': None}
+
+    def _mkdir(self, path, parents=False):
+        if path in self.tree:
+            return 'exists'
+        parent = _parent(path)
+        if parent not in self.tree:
+            if not parents:
+                return 'missing'
+            self._mkdir(parent, parents=True)
+        self.tree[path] = {}
+        name = path[:-1].rsplit('/', 1)[1]
+        self.tree[parent][name] = self._entry(name, 'dir', 4096)
+        return 'created'
+
+    def identity(self, username):
+        """
+        Identity id of a username, the same for each call
+        """
+        with self.lock:
+            if username not in self.identities:
+                self.identities[username] = str(uuid.uuid5(uuid.NAMESPACE_URL, 'fake-globus:' + username))
+            return self.identities[username]
+
+    def start(self):
+        """
+        Serve on a background thread
+        """
+        self.thread = threading.Thread(target=self.server.serve_forever, name='fake-globus', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _admit(self):
+        """
+        Status code injected for the next request: 429, 503 or None
+        """
+        with self.lock:
+            if self.rate_limit:
+                second = int(time.monotonic())
+                start, n = self.window
+                self.window = (second, n + 1) if second == start else (second, 1)
+                if self.window[1] > self.rate_limit:
+                    return 429
+            if self.error_rate and self.random.random() < self.error_rate:
+                return 503
+        return None
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body, headers=None):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _error(self, status, code, message, headers=None):
+        self._send(status, {'code': code, 'message': message, 'request_id': uuid.uuid4().hex[:9]}, headers)
+
+    def _dispatch(self, method):
+        fake = self.server.fake
+        url = urllib.parse.urlsplit(self.path)
+        query = dict(urllib.parse.parse_qsl(url.query))
+        length = int(self.headers.get('Content-Length') or 0)
+        body = json.loads(self.rfile.read(length) or b'{}') if length else {}
+
+        for route_method, pattern, name, func in ROUTES:
+            match = pattern.match(url.path)
+            if route_method == method and match:
+                break
+        else:
+            with fake.lock:
+                fake.counts[method + ' ' + url.path] += 1
+            return self._error(404, 'ClientError.NotFound', 'No route %s %s' % (method, url.path))
+
+        with fake.lock:
+            fake.counts[name] += 1
+        if fake.latency:
+            time.sleep(fake.latency)
+        if name != 'POST /v2/oauth2/token' and not (self.headers.get('Authorization') or '').startswith('Bearer '):
+            return self._error(401, 'AuthenticationFailed', 'Missing bearer token')
+        injected = fake._admit()
+        if injected is not None:
+            with fake.lock:
+                fake.errors[name + ' ' + str(injected)] += 1
+            if injected == 429:
+                return self._error(429, 'RequestLimitExceeded', 'Rate limit exceeded', {'Retry-After': '1'})
+            return self._error(503, 'ServiceUnavailable', 'Injected error')
+
+        status, response = func(fake, query, body, *match.groups())
+        if status >= 400:
+            return self._error(status, *response)
+        self._send(status, response)
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def do_DELETE(self):
+        self._dispatch('DELETE')
+
+
+def _check_endpoint(fake, ep_uuid):
+    if ep_uuid != fake.ep_uuid:
+        return 404, ('EndpointNotFound', 'No such endpoint %s' % ep_uuid)
+    return None
+
+
+def _ls(fake, query, body, ep_uuid):
+    error = _check_endpoint(fake, ep_uuid)
+    if error:
+        return error
+    # as Globus, an empty path is the default directory of the collection
+    path = query.get('path') or '~'
+    path = _normalize(fake.default_directory + path[1:] if path.startswith('~') else path)
+    offset = int(query.get('offset', 0))
+    limit = min(int(query.get('limit', LS_MAX_LIMIT)), LS_MAX_LIMIT)
+    with fake.lock:
+        if path not in fake.tree:
+            return 404, ('ClientError.NotFound', "Directory '%s' not found on endpoint %s" % (path, ep_uuid))
+        entries = list(fake.tree[path].values())
+    return 200, {'DATA_TYPE': 'file_list', 'path': path, 'endpoint': ep_uuid, 'offset': offset, 'limit': limit,
+                 'total': len(entries), 'length': len(entries[offset:offset + limit]), 'DATA': entries[offset:offset + limit]}
+
+
+def _mkdir(fake, query, body, ep_uuid):
+    error = _check_endpoint(fake, ep_uuid)
+    if error:
+        return error
+    path = _normalize(body.get('path'))
+    with fake.lock:
+        status = fake._mkdir(path)
+    if status == 'exists':
+        return 502, ('ExternalError.MkdirFailed.Exists', "Path already exists, Error Path '%s' exists" % path)
+    if status == 'missing':
+        return 404, ('ClientError.NotFound', "Directory '%s' not found" % _parent(path))
+    return 202, {'DATA_TYPE': 'mkdir_result', 'code': 'DirectoryCreated', 'message': 'The directory was created successfully'}
+
+
+def _endpoint_document(fake):
+    return {'DATA_TYPE': 'endpoint', 'id': fake.ep_uuid, 'display_name': 'gdauth fake collection',
+            'https_server': HTTPS_SERVER, 'tlsftp_server': None, 'owner_string': 'gdauth@globusid.org'}
+
+
+def _get_endpoint(fake, query, body, ep_uuid):
+    error = _check_endpoint(fake, ep_uuid)
+    return error or (200, _endpoint_document(fake))
+
+
+def _endpoint_search(fake, query, body):
+    offset = int(query.get('offset', 0))
+    limit = int(query.get('limit', 25))
+    found = [_endpoint_document(fake)] if query.get('filter_scope') in ('my-endpoints', 'shared-by-me') else []
+    return 200, {'DATA_TYPE': 'endpoint_list', 'offset': offset, 'limit': limit,
+                 'has_next_page': offset + limit < len(found), 'DATA': found[offset:offset + limit]}
+
+
+def _access_list(fake, query, body, ep_uuid):
+    error = _check_endpoint(fake, ep_uuid)
+    if error:
+        return error
+    with fake.lock:
+        rules = list(fake.rules)
+    return 200, {'DATA_TYPE': 'access_list', 'endpoint': ep_uuid, 'length': len(rules), 'DATA': rules}
+
+
+def _add_access(fake, query, body, ep_uuid):
+    error = _check_endpoint(fake, ep_uuid)
+    if error:
+        return error
+    path = _normalize(body.get('path'))
+    with fake.lock:
+        if path not in fake.tree:
+            return 404, ('ClientError.NotFound', "Directory '%s' not found" % path)
+        for rule in fake.rules:
+            if (rule['principal_type'], rule['principal'], rule['path']) == (body.get('principal_type'), body.get('principal'), path):
+                return 409, ('Exists', "Rule for '%s' already exists" % path)
+        access_id = str(uuid.uuid4())
+        fake.rules.append({'DATA_TYPE': 'access', 'id': access_id, 'path': path, 'principal_type': body.get('principal_type'),
+                           'principal': body.get('principal'), 'permissions': body.get('permissions', 'r'), 'role_id': None})
+    return 201, {'DATA_TYPE': 'access_create_result', 'code': 'Created', 'access_id': access_id,
+                 'message': 'Access rule created successfully.', 'resource': '/endpoint/%s/access' % ep_uuid}
+
+
+def _delete_access(fake, query, body, ep_uuid, rule_id):
+    error = _check_endpoint(fake, ep_uuid)
+    if error:
+        return error
+    with fake.lock:
+        rules = [rule for rule in fake.rules if rule['id'] != rule_id]
+        if len(rules) == len(fake.rules):
+            return 404, ('AccessRuleNotFound', 'Access rule %s not found' % rule_id)
+        fake.rules = rules
+    return 200, {'DATA_TYPE': 'result', 'code': 'Deleted', 'message': 'Access rule %s deleted successfully' % rule_id,
+                 'resource': '/endpoint/%s/access/%s' % (ep_uuid, rule_id)}
+
+
+def _identities(fake, query, body):
+    usernames = [u for u in query.get('usernames', '').split(',') if u]
+    if not usernames and not query.get('ids'):
+        return 400, ('MISSING_PARAMETERS', 'usernames or ids is required')
+    # addresses without @ have no identity, as an unknown email
+    identities = [{'id': fake.identity(u.lower()), 'username': u.lower(), 'status': 'unused', 'email': u,
+                   'name': None, 'organization': None, 'identity_provider': str(uuid.UUID(int=0))}
+                  for u in usernames if '@' in u]
+    return 200, {'identities': identities}
+
+
+# identity of the user of the bearer token, admin of the groups it creates
+ADMIN_IDENTITY = str(uuid.uuid5(uuid.NAMESPACE_URL, 'fake-globus:admin'))
+
+
+def _group_document(group, memberships=False):
+    document = {'id': group['id'], 'name': group['name'], 'description': group['description'], 'group_type': 'regular',
+                'parent_id': None, 'enforce_session': False, 'my_memberships': [group['members'][ADMIN_IDENTITY]]}
+    if memberships:
+        document['memberships'] = list(group['members'].values())
+    return document
+
+
+def _create_group(fake, query, body):
+    if not body.get('name'):
+        return 400, ('INVALID_REQUEST', 'name is required')
+    group_id = str(uuid.uuid4())
+    group = {'id': group_id, 'name': body['name'], 'description': body.get('description', ''),
+             'members': {ADMIN_IDENTITY: {'group_id': group_id, 'identity_id': ADMIN_IDENTITY, 'role': 'admin', 'status': 'active'}}}
+    with fake.lock:
+        fake.groups[group_id] = group
+        return 201, _group_document(group)
+
+
+def _my_groups(fake, query, body):
+    with fake.lock:
+        return 200, [_group_document(group) for group in fake.groups.values()]
+
+
+def _get_group(fake, query, body, group_id):
+    with fake.lock:
+        if group_id not in fake.groups:
+            return 404, ('NOT_FOUND', 'Group %s not found' % group_id)
+        return 200, _group_document(fake.groups[group_id], 'memberships' in query.get('include', ''))
+
+
+def _group_actions(fake, query, body, group_id):
+    added, errors = [], []
+    with fake.lock:
+        if group_id not in fake.groups:
+            return 404, ('NOT_FOUND', 'Group %s not found' % group_id)
+        members = fake.groups[group_id]['members']
+        for member in body.get('add') or []:
+            identity_id = str(member.get('identity_id'))
+            try:
+                uuid.UUID(identity_id)
+            except ValueError:
+                errors.append({'identity_id': identity_id, 'code': 'INVALID_IDENTITY', 'detail': 'Invalid identity id'})
+                continue
+            if identity_id in members:
+                errors.append({'identity_id': identity_id, 'code': 'ALREADY_ACTIVE', 'detail': 'Identity is already a member'})
+                continue
+            members[identity_id] = {'group_id': group_id, 'identity_id': identity_id, 'role': member.get('role', 'member'), 'status': 'active'}
+            added.append(members[identity_id])
+    return 200, {'group_id': group_id, 'add': added, 'errors': {'add': errors}}
+
+
+def _token(fake, query, body):
+    return 200, {'access_token': 'fake-access-' + uuid.uuid4().hex, 'expires_in': 172800, 'resource_server': 'transfer.api.globus.org',
+                 'refresh_token': 'fake-refresh-transfer', 'scope': 'urn:globus:auth:scope:transfer.api.globus.org:all',
+                 'token_type': 'Bearer', 'other_tokens': []}
+
+
+_UUID = '([0-9a-fA-F-]{36})'
+
+# (method, path pattern, route name counted by the server, handler)
+ROUTES = [(method, re.compile('^' + pattern + '$'), method + ' ' + name, func) for method, pattern, name, func in (
+    ('GET',  '/v0.10/operation/endpoint/%s/ls' % _UUID,    '/operation/endpoint/{id}/ls',    _ls),
+    ('POST', '/v0.10/operation/endpoint/%s/mkdir' % _UUID, '/operation/endpoint/{id}/mkdir', _mkdir),
+    ('GET',  '/v0.10/endpoint/%s' % _UUID,                 '/endpoint/{id}',                 _get_endpoint),
+    ('GET',  '/v0.10/endpoint_search',                      '/endpoint_search',               _endpoint_search),
+    ('GET',  '/v0.10/endpoint/%s/access_list' % _UUID,     '/endpoint/{id}/access_list',     _access_list),
+    ('POST', '/v0.10/endpoint/%s/access' % _UUID,          '/endpoint/{id}/access',          _add_access),
+    ('DELETE', '/v0.10/endpoint/%s/access/([^/]+)' % _UUID, '/endpoint/{id}/access/{id}',    _delete_access),
+    ('GET',  '/v2/api/identities',                          '/v2/api/identities',             _identities),
+    ('POST', '/v2/oauth2/token',                            '/v2/oauth2/token',               _token),
+    ('POST', '/v2/groups',                                  '/v2/groups',                     _create_group),
+    ('GET',  '/v2/groups/my_groups',                        '/v2/groups/my_groups',           _my_groups),
+    ('GET',  '/v2/groups/%s' % _UUID,                       '/v2/groups/{id}',                _get_group),
+    ('POST', '/v2/groups/%s' % _UUID,                       '/v2/groups/{id}',                _group_actions),
+)]
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Fake Globus Transfer and Auth server")
+    parser.add_argument('--port', type=int, default=8765, help='TCP port, 0 picks a free port')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to each response')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of the requests failing with a 503')
+    parser.add_argument('--rate-limit', type=float, default=None, help='requests per second before answering 429')
+    parser.add_argument('--ep-uuid', default=EP_UUID, help='collection UUID')
+    parser.add_argument('--tree', nargs='+', default=[], metavar='PATH:FILES:FOLDERS',
+                        help='folders to create, each with a number of files and of empty subfolders')
+    parser.add_argument('--seed-tokens', metavar='FILE', help='save tokens for the collection in this gdauth JSON token store')
+    args = parser.parse_args()
+
+    fake = FakeGlobus(args.port, args.latency, args.error_rate, args.rate_limit, args.ep_uuid)
+    for spec in args.tree:
+        path, files, folders = (spec.split(':') + ['0', '0'])[:3]
+        fake.add_tree(path, int(files or 0), int(folders or 0))
+    if args.seed_tokens:
+        seed_tokens(args.seed_tokens, ep_uuid=args.ep_uuid)
+
+    for name, value in fake.env().items():
+        print('export %s=%s' % (name, value))
+    sys.stdout.flush()
+    # stop and print the request counts on kill as on Ctrl-C
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    try:
+        fake.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        fake.server.server_close()
+        for route, n in sorted(fake.counts.items()):
+            print('{:>8}  {}'.format(n, route))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Load benchmark: run the gdauth create, share and links commands against the fake Globus server
+(benchmarks/fake_globus.py) for 1, 1k and 100k items and report, for each command, the number of
+Globus API calls, the wall time and the throughput. Each command runs twice in the same home
+directory: cold (empty caches) then warm (caches of the first run).
+
+Usage::
+
+    $ python benchmarks/globus_load.py --sizes 1 1000 --save baseline.json
+    $ python benchmarks/globus_load.py --sizes 1 1000 --baseline baseline.json --tolerance 0.25
+    $ python benchmarks/globus_load.py --commands links --sizes 100000 --latency 0.02 --error-rate 0.01
+
+Exit status is 1 when a command fails or, with --baseline, when a command makes more API calls
+than in the baseline or is slower by more than --tolerance.
+
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_globus import FakeGlobus, seed_tokens, APP_UUID, EP_UUID
+
+SIZES = (1, 1000, 100000)
+COMMANDS = ('create', 'share', 'links')
+
+# folders per parent in the create and share trees
+FANOUT = 1000
+
+
+def _dirs(size):
+    return ['bench/batch_%03d/item_%06d' % (i // FANOUT, i) for i in range(size)]
+
+
+def prepare_create(fake, work, size):
+    """
+    Empty collection, create the size folders of _dirs with their parents
+    """
+
+    if size == 1:
+        return ['create', '--dir', _dirs(1)[0], '--parents']
+    file_name = os.path.join(work, 'dirs.txt')
+    with open(file_name, 'w') as f:
+        f.write('\n'.join(_dirs(size)) + '\n')
+    return ['create', '--from-file', file_name, '--parents']
+
+
+def prepare_share(fake, work, size):
+    """
+    Existing folders, share each one with a different user
+    """
+
+    dirs = _dirs(size)
+    for directory in dirs:
+        fake.add_tree(directory)
+    if size == 1:
+        return ['share', '--dir', dirs[0], '--email', 'user_000000@example.org']
+    file_name = os.path.join(work, 'pairs.csv')
+    with open(file_name, 'w') as f:
+        f.write(''.join('%s,user_%06d@example.org\n' % (directory, i) for i, directory in enumerate(dirs)))
+    return ['share', '--from-csv', file_name, '--report', os.path.join(work, 'report.jsonl')]
+
+
+def prepare_links(fake, work, size):
+    """
+    One folder of size files, links written to a JSON Lines file
+    """
+
+    fake.add_tree('bench', files=size)
+    return ['links', '--dir', 'bench', '--output', os.path.join(work, 'links.jsonl')]
+
+
+PREPARE = {'create': prepare_create, 'share': prepare_share, 'links': prepare_links}
+
+
+def run_command(fake, home, argv, args):
+
+    env = dict(os.environ, HOME=home, PYTHONPATH=ROOT + os.pathsep + os.environ.get('PYTHONPATH', ''), **fake.env())
+    cmd = [sys.executable, '-m', 'gdauth'] + argv + [
+           '--config', os.path.join(home, 'gdauth.conf'), '--app-uuid', APP_UUID, '--ep-uuid', EP_UUID,
+           '--workers', str(args.workers), '--no-daemon']
+    if not args.client_rate:
+        cmd += ['--transfer-rate', '0', '--auth-rate', '0']
+
+    before = fake.counts.copy()
+    start = time.perf_counter()
+    result = subprocess.run(cmd, env=env, cwd=home, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    seconds = time.perf_counter() - start
+    routes = fake.counts - before
+
+    if result.returncode and args.verbose:
+        sys.stderr.write(result.stderr.decode(errors='replace')[-2000:])
+    return {'seconds': seconds, 'calls': sum(routes.values()), 'routes': dict(routes), 'status': result.returncode}
+
+
+def run_benchmark(fake, command, size, args):
+    """
+    Run command on size items, cold then warm
+
+    Returns
+    -------
+    list : [result of each run]
+    """
+
+    home = tempfile.mkdtemp(prefix='gdauth-bench-')
+    try:
+        fake.reset()
+        seed_tokens(os.path.join(home, '.gdauth', 'tokens.json'))
+        argv = PREPARE[command](fake, home, size)
+        results = []
+        for run in ('cold', 'warm'):
+            result = run_command(fake, home, argv, args)
+            result.update(command=command, size=size, run=run, items_per_s=size / result['seconds'])
+            results.append(result)
+        return results
+    finally:
+        shutil.rmtree(home, ignore_errors=True)
+
+
+def compare(results, baseline, tolerance):
+    """
+    Regressions of results against a baseline, as messages
+    """
+
+    previous = {(r['command'], r['size'], r['run']): r for r in baseline}
+    regressions = []
+    for r in results:
+        key = (r['command'], r['size'], r['run'])
+        if key not in previous:
+            continue
+        b = previous[key]
+        if r['calls'] > b['calls']:
+            regressions.append('%s %d %s: %d API calls, %d in baseline' % (key + (r['calls'], b['calls'])))
+        if r['seconds'] > b['seconds'] * (1 + tolerance):
+            regressions.append('%s %d %s: %.3f s, %.3f s in baseline' % (key + (r['seconds'], b['seconds'])))
+
+    return regressions
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="gdauth load benchmark on a fake Globus server")
+    parser.add_argument('--commands', nargs='+', default=list(COMMANDS), choices=COMMANDS, help='commands to run')
+    parser.add_argument('--sizes', nargs='+', type=int, default=list(SIZES), help='numbers of items')
+    parser.add_argument('--workers', type=int, default=8, help='gdauth --workers')
+    parser.add_argument('--client-rate', action='store_true', help='keep the gdauth default rate limits, default is no limit')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added by the server to each response')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of the requests failing with a 503')
+    parser.add_argument('--rate-limit', type=float, default=None, help='server requests per second before answering 429')
+    parser.add_argument('--save', metavar='FILE', help='save the results to this JSON file')
+    parser.add_argument('--baseline', metavar='FILE', help='compare the results with this JSON file saved by --save')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='slow down accepted before a command is a regression')
+    parser.add_argument('--verbose', action='store_true', help='print the calls per route and the errors of failed commands')
+    args = parser.parse_args()
+
+    results = []
+    failed = False
+    print('{:<8} {:>8} {:<5} {:>8} {:>9} {:>10}  {}'.format('command', 'items', 'run', 'calls', 'wall s', 'items/s', 'status'))
+    with FakeGlobus(latency=args.latency, error_rate=args.error_rate, rate_limit=args.rate_limit) as fake:
+        for command in args.commands:
+            for size in args.sizes:
+                for r in run_benchmark(fake, command, size, args):
+                    results.append(r)
+                    failed = failed or r['status'] != 0
+                    print('{:<8} {:>8} {:<5} {:>8} {:>9.3f} {:>10.1f}  {}'.format(
+                          command, size, r['run'], r['calls'], r['seconds'], r['items_per_s'], 'ok' if r['status'] == 0 else 'FAILED'))
+                    if args.verbose:
+                        for route, n in sorted(r['routes'].items()):
+                            print('{:>35} {}'.format(n, route))
+                    sys.stdout.flush()
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'latency': args.latency, 'error_rate': args.error_rate, 'rate_limit': args.rate_limit,
+                       'workers': args.workers, 'results': results}, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f)['results'], args.tolerance)
+        for message in regressions:
+            print('REGRESSION ' + message)
+        failed = failed or bool(regressions)
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
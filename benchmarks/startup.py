@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Startup benchmark: time the gdauth commands that never touch the network and check that they
+stay within an import time budget and do not import globus_sdk or numpy.
+
+Usage::
+
+    $ python benchmarks/startup.py --budget 0.25 --repeat 10
+
+Exit status is 1 when a command exceeds the budget or loads a heavy dependency.
+
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY_MODULES = ('globus_sdk', 'numpy', 'requests', 'cryptography')
+
+COMMANDS = {
+    'import gdauth':  [sys.executable, '-c', 'import gdauth'],
+    'gdauth --help':  [sys.executable, '-m', 'gdauth', '--help'],
+    'gdauth share -h': [sys.executable, '-m', 'gdauth', 'share', '--help'],
+}
+
+# imports gdauth the way the CLI does, then lists the heavy modules that got loaded
+CHECK_HEAVY = ("import sys, gdauth, gdauth.__main__, gdauth.config\n"
+               "print(' '.join(m for m in {} if m in sys.modules))".format(HEAVY_MODULES))
+
+
+def time_command(cmd, repeat):
+
+    env = dict(os.environ, PYTHONPATH=ROOT + os.pathsep + os.environ.get('PYTHONPATH', ''))
+    times = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(cmd, env=env, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        times.append(time.perf_counter() - start)
+
+    return statistics.median(times)
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="gdauth startup benchmark")
+    parser.add_argument('--budget', type=float, default=0.25, help='maximum median wall time per command in seconds')
+    parser.add_argument('--repeat', type=int, default=10, help='number of runs per command')
+    args = parser.parse_args()
+
+    failed = False
+    baseline = time_command([sys.executable, '-c', 'pass'], args.repeat)
+    print('{:<20} {:>8.3f} s'.format('python (baseline)', baseline))
+    for name, cmd in COMMANDS.items():
+        median = time_command(cmd, args.repeat)
+        status = 'ok' if median <= args.budget else 'OVER BUDGET'
+        failed = failed or median > args.budget
+        print('{:<20} {:>8.3f} s  {}'.format(name, median, status))
+
+    env = dict(os.environ, PYTHONPATH=ROOT + os.pathsep + os.environ.get('PYTHONPATH', ''))
+    heavy = subprocess.run([sys.executable, '-c', CHECK_HEAVY], env=env, capture_output=True, text=True, check=True).stdout.split()
+    if heavy:
+        failed = True
+        print('heavy modules imported at startup: %s' % ', '.join(heavy))
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
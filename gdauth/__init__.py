@@ -46,4 +46,22 @@
 # POSSIBILITY OF SUCH DAMAGE.                                             #
 # #########################################################################
 
-from gdauth.globus import *
\ No newline at end of file
+import importlib.util
+
+# The gdauth.globus functions are exported here, gdauth.globus (and globus_sdk) is only
+# imported the first time one of them is used
+
+
+def __getattr__(name):
+    if name.startswith('_') or importlib.util.find_spec(__name__ + '.' + name) is not None:
+        # let the import system load gdauth submodules
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+    from gdauth import globus
+    if name not in globus.__all__:
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+    return getattr(globus, name)
+
+
+def __dir__():
+    from gdauth import globus
+    return sorted(set(globals()) | set(globus.__all__))
@@ -53,14 +53,15 @@ directories and share them with users.
 """
 import os
 import sys
-import pathlib
 import argparse
 
 from gdauth import log
 from gdauth import config
-from gdauth import globus
 from gdauth import utils
 
+# gdauth.globus, gdauth.bulk and gdauth.walk import globus_sdk: they are imported by the
+# commands that use them so that --help, init and config-only paths start fast
+
 def init(args):
     if not os.path.exists(str(args.config)):
         config.write(str(args.config))
@@ -77,30 +78,37 @@ def select(args):
     args.app_uuid : Globus App / Client UUID
     args.ep_uuid  : Endpoint UUID
     """
-    my_endpoints, endpoints_shared_with_me, endpoints_shared_by_me = globus.find_endpoints(args.app_uuid, args.ep_uuid)
+    from gdauth import globus
+
+    # show the endpoint index at once, the session is only created to search the endpoints
+    cached = globus.cached_endpoints(args.app_uuid)
+    found = cached or globus.find_endpoints(args.app_uuid, args.ep_uuid, use_cache=False)
+    my_endpoints, endpoints_shared_with_me, endpoints_shared_by_me = found
 
     log.info('Show all endpoints shared and owned by my globus user credentials')
 
     log.info("*** Endpoints owned with me:")
-    for key, value in my_endpoints.items():
-        log.info("*** *** '{}' {}".format(key, value))
+    for ep_id, name in my_endpoints.items():
+        log.info("*** *** '{}' {}".format(name, ep_id))
 
     log.info("*** Endpoints shared with me:")
-    for key, value in endpoints_shared_with_me.items():
-        log.info("*** *** '{}' {}".format(key, value))
+    for ep_id, name in endpoints_shared_with_me.items():
+        log.info("*** *** '{}' {}".format(name, ep_id))
 
     log.info("*** Endpoints shared by me:")
-    for key, value in endpoints_shared_by_me.items():
-        if value == args.ep_uuid:
-            log.warning("Active: '{}' {}".format(key, value))
+    for ep_id, name in endpoints_shared_by_me.items():
+        if ep_id == args.ep_uuid:
+            log.warning("Active: '{}' {}".format(name, ep_id))
         else:
-            log.info("*** *** '{}' {}".format(key, value))
-        # endpoints[ep['display_name']] = ep['id']
+            log.info("*** *** '{}' {}".format(name, ep_id))
+
+    # refresh the endpoint index shown from cache while the user makes a choice
+    refresh = globus.refresh_endpoints(args.app_uuid, args.ep_uuid) if cached is not None else None
 
     if utils.yes_or_no("Do you want to select a different collection ?"):
 
-        for index, (key, value) in enumerate(endpoints_shared_by_me.items()):
-            log.warning(f'{index}: {key}: {value}')
+        for index, (ep_id, name) in enumerate(endpoints_shared_by_me.items()):
+            log.warning(f'{index}: {name}: {ep_id}')
 
         log.error("Select a collection by entering its index")
         # Prompt the user to select an index
@@ -110,13 +118,11 @@ def select(args):
         try:
             selected_index = int(user_input)
             if 0 <= selected_index < len(endpoints_shared_by_me):
-                selected_key = list(endpoints_shared_by_me.keys())[selected_index]
-                selected_value = endpoints_shared_by_me[selected_key]
-                log.warning(f'You selected index {selected_index}: {selected_key}: {selected_value}')
-                args.ep_uuid = selected_value
-                # Update token file
-                os.remove(os.path.join(str(pathlib.Path.home()), 'token.npy'))
-                log.error("A new token will be generated next time you run GDAuth")
+                selected_id, selected_name = list(endpoints_shared_by_me.items())[selected_index]
+                log.warning(f'You selected index {selected_index}: {selected_name}: {selected_id}')
+                args.ep_uuid = selected_id
+                if not globus.has_token(args.app_uuid, args.ep_uuid):
+                    log.error("A token for this collection will be requested next time you run GDAuth")
             else:
                 log.warning("Invalid index. Please select a valid index.")
                 log.warning("No collection/endpoint change. Endpoint is %s " % args.ep_uuid)
@@ -125,33 +131,110 @@ def select(args):
     else:
         log.warning("No collection/endpoint change. Endpoint is %s " % args.ep_uuid)
 
+    if refresh is not None:
+        refresh.join()
+
+
+def login(args):
+    """
+    Login to Globus requesting access to several collections at once
+
+    Parameters
+    ----------
+    args.app_uuid    : Globus App / Client UUID
+    args.ep_uuid     : Endpoint UUID
+    args.collections : Other collection UUIDs to request access to in the same login
+    args.groups      : Also request access to Globus Groups
+    """
+    from gdauth import globus
+
+    ep_uuids = list(dict.fromkeys([args.ep_uuid] + (args.collections or [])))
+    globus_tokens = globus.login(args.app_uuid, ep_uuids, groups=args.groups)
+    for ep_uuid in ep_uuids:
+        if ep_uuid in globus_tokens:
+            log.info('*** Token saved for collection %s' % ep_uuid)
+        else:
+            log.error('*** No token received for collection %s' % ep_uuid)
+    if args.groups:
+        if globus.GROUPS_RESOURCE_SERVER in globus_tokens:
+            log.info('*** Token saved for Globus Groups')
+        else:
+            log.error('*** No token received for Globus Groups')
+
 
 def create(args):
     """
-    Create a directory in a Globus endpoint    
+    Create a directory in a Globus endpoint. With --from-file create all the directories
+    listed in the file, with --parents also create the missing parent directories
 
     Parameters
     ----------
-    args.dir      : Directory to be created in the share
-    args.app_uuid : Globus App / Client UUID
-    args.ep_uuid  : Endpoint UUID
+    args.dir       : Directory to be created in the share
+    args.app_uuid  : Globus App / Client UUID
+    args.ep_uuid   : Endpoint UUID
+    args.parents   : Also create the missing parent directories
+    args.from_file : Text file listing one directory per line
+    args.workers   : Number of concurrent Globus requests
+    args.journal   : Journal of the directories created from --from-file
+    args.resume    : Journal of an interrupted --from-file run to resume
     """
+    from gdauth import globus
+    from gdauth import journal
+
+    if args.from_file:
+        with open(args.from_file) as f:
+            dirs = [line.strip() for line in f if line.strip() and not line.strip().startswith('#')]
+        with journal.open_journal('create', args.journal, args.resume) as j:
+            status = globus.create_dirs(dirs, args.app_uuid, args.ep_uuid, parents=args.parents, workers=args.workers, journal=j)
+        if 'error' in status.values():
+            raise RuntimeError('%d folders could not be created' % list(status.values()).count('error'))
+        return
+
     # ep_uuid = globus.find_endpoint_uuid(args.app_uuid, args.ep_name)
     globus.create_dir(args.dir,       # Directory to be created in the share
                       args.app_uuid,  # Globus App / Client UUID
-                      args.ep_uuid)   # Endpoint UUID
+                      args.ep_uuid,   # Endpoint UUID
+                      parents=args.parents)
 
 def share(args):
     """
-    Create a directory in a Globus endpoint and share it with a user email address
+    Create a directory in a Globus endpoint and share it with a user email address or, with --group,
+    with a Globus group. With --from-csv share all the (directory, email) pairs listed in the CSV file
 
     Parameters
     ----------
     args.dir      : Directory to be created in the share
     args.email    : User email address
+    args.group    : Globus group UUID, shared instead of the email address
     args.app_uuid : Globus App / Client UUID
     args.ep_uuid  : Endpoint UUID
+    args.from_csv : CSV file of (directory, email) pairs
+    args.report   : JSON Lines file receiving one result per pair
+    args.workers  : Number of concurrent Globus requests
+    args.journal  : Journal of the pairs shared from --from-csv
+    args.resume   : Journal of an interrupted --from-csv run to resume
     """
+    from gdauth import globus
+    from gdauth import bulk
+    from gdauth import groups
+    from gdauth import journal
+
+    if args.group:
+        if not groups.share(args.dir, args.group, args.app_uuid, args.ep_uuid):
+            raise RuntimeError('Cannot share %s with group %s' % (args.dir, args.group))
+        return
+
+    if args.from_csv:
+        pairs = bulk.read_pairs(args.from_csv)
+        with journal.open_journal('share', args.journal, args.resume) as j:
+            bulk.share_many(pairs,          # List of (directory, email) pairs
+                            args.app_uuid,  # Globus App / Client UUID
+                            args.ep_uuid,   # Endpoint UUID
+                            workers=args.workers,
+                            report=args.report,
+                            journal=j)
+        return
+
     globus.share(args.dir,      # Directory to be created in the share
                  args.email,    # User email address
                  args.app_uuid, # Globus App / Client UUID
@@ -164,21 +247,235 @@ def links(args):
 
     Parameters
     ----------
-    args.dir      : Directory to be created in the share
-    args.app_uuid : Globus App / Client UUID
-    args.ep_uuid  : Endpoint UUID
+    args.dir       : Directory to be created in the share
+    args.app_uuid  : Globus App / Client UUID
+    args.ep_uuid   : Endpoint UUID
+    args.recursive : Create the links of all subdirectories
+    args.output    : Write the links to this file instead of the log
+    args.format    : Format of the output file: jsonl, csv or txt
+    args.gzip      : Compress the output file with gzip
+    args.since_last: Only list the links of the items added, changed or removed since the last run
     """
 
+    from gdauth import globus
+    from gdauth import walk
+
+    if args.since_last:
+        _links_since_last(args)
+        return
+
     # ep_uuid = globus.find_endpoint_uuid(args.app_uuid, args.ep_name)
 
-    file_links, folder_links = globus.create_links(args.dir,       # Directory to be created in the share
-                                                   args.app_uuid,  # Globus App / Client UUID
-                                                   args.ep_uuid)   # Endpoint UUID
+    if args.recursive:
+        links = walk.walk_links(args.dir, args.app_uuid, args.ep_uuid, **_walk_options(args))
+    else:
+        links = globus.iter_links(args.dir,       # Directory to be created in the share
+                                  args.app_uuid,  # Globus App / Client UUID
+                                  args.ep_uuid)   # Endpoint UUID
+    if args.output:
+        from gdauth import export
+        export.write_links(links, args.output, args.format, args.gzip)
+        return
+    for link in links:
+        log.warning(link.url)
+
+def _links_since_last(args):
+    from gdauth import walk
+    from gdauth import export
+    from gdauth import snapshot
+
+    options = _walk_options(args)
+    if not args.recursive:
+        options['max_depth'] = 1
+    snap = snapshot.Snapshot(args.ep_uuid, args.dir, {k: options[k] for k in ('max_depth', 'include', 'exclude')})
+    # a delta must compare the snapshot with the current listing, never with a cached one
+    entries = walk.walk(args.dir, args.app_uuid, args.ep_uuid, use_cache=False, **options)
+    deltas = snap.links(entries, args.app_uuid, args.ep_uuid)
+    if args.output:
+        export.write_links(deltas, args.output, args.format, args.gzip, snapshot.delta_record, snapshot.DELTA_FIELDS)
+    else:
+        for delta in deltas:
+            log.warning('%s %s' % (delta.change, delta.link.url))
+    snap.save()
+
+def du(args):
+    """
+    Show number of files, folders and bytes of a Collection folder and of each of its subfolders
+
+    Parameters
+    ----------
+    args.dir       : Top directory
+    args.app_uuid  : Globus App / Client UUID
+    args.ep_uuid   : Endpoint UUID
+    args.recursive : Walk all subdirectories, default is to count the top directory items only
+    """
+
+    from gdauth import walk
+
+    options = _walk_options(args)
+    if not args.recursive:
+        options['max_depth'] = 1
+    usage = walk.disk_usage(args.dir, args.app_uuid, args.ep_uuid, **options)
+
+    total = usage.pop('.', {'files': 0, 'folders': 0, 'bytes': 0, 'errors': 0})
+    for name, value in sorted(usage.items()):
+        log.info("{:>16} bytes {:>8} files {:>8} folders  {}".format(value['bytes'], value['files'], value['folders'], name))
+    log.warning("{:>16} bytes {:>8} files {:>8} folders  {}".format(total['bytes'], total['files'], total['folders'], args.dir))
+    if total['errors']:
+        log.error('%d folders could not be listed' % total['errors'])
+
+def plan(args):
+    """
+    Show the changes making the Collection match a manifest of folders and readers
+
+    Parameters
+    ----------
+    args.manifest : YAML or JSON manifest file
+    args.app_uuid : Globus App / Client UUID
+    args.ep_uuid  : Endpoint UUID, unless set in the manifest
+    args.prune    : Also delete (True) or keep (False) the read rules of the manifest folders given to users not listed
+                    as readers, default (None) is prune in the manifest
+    args.workers  : Number of concurrent Globus requests
+    """
+    from gdauth import manifest
+
+    try:
+        desired = manifest.load(args.manifest)
+    except ValueError as e:
+        raise RuntimeError(str(e))
+    ep_uuid = desired.collection or args.ep_uuid
+    changes = manifest.plan(desired, args.app_uuid, ep_uuid, prune=args.prune, workers=args.workers)
+    changes.log()
+
+    return desired, ep_uuid, changes
+
+def apply(args):
+    """
+    Make the changes shown by plan: create the missing folders, add and, with --prune, delete read rules
+
+    Parameters
+    ----------
+    args.manifest : YAML or JSON manifest file
+    args.app_uuid : Globus App / Client UUID
+    args.ep_uuid  : Endpoint UUID, unless set in the manifest
+    args.prune    : Also delete (True) or keep (False) the read rules of the manifest folders given to users not listed
+                    as readers, default (None) is prune in the manifest
+    args.workers  : Number of concurrent Globus requests
+    args.journal  : Journal of the changes made
+    args.resume   : Journal of an interrupted run to append to, the plan already skips the changes made
+    """
+    from gdauth import manifest
+    from gdauth import journal
+
+    desired, ep_uuid, changes = plan(args)
+    if not len(changes):
+        log.info('*** Collection %s matches %s' % (ep_uuid, args.manifest))
+        return
+    with journal.open_journal('apply', args.journal, args.resume) as j:
+        results = manifest.apply(changes, args.app_uuid, ep_uuid, message=desired.message, workers=args.workers, journal=j)
+    errors = sum(1 for result in results if result['status'] == 'error')
+    if errors:
+        raise RuntimeError('%d changes failed' % errors)
+
+def migrate(args):
+    """
+    Replace the per-user read rules of the folders shared with many users by one Globus group rule per folder
+
+    Parameters
+    ----------
+    args.app_uuid  : Globus App / Client UUID
+    args.ep_uuid   : Endpoint UUID
+    args.min_users : Only migrate the folders shared with at least this number of users
+    args.dry_run   : Only show the groups and the rules to migrate
+    args.workers   : Number of concurrent Globus requests
+    args.journal   : Journal of the folders migrated
+    args.resume    : Journal of an interrupted run to resume
+    """
+    from gdauth import groups
+    from gdauth import journal
+
+    planned = groups.plan_migration(args.app_uuid, args.ep_uuid, min_users=args.min_users)
+    for group in planned:
+        log.info('  + group %s: %d members, %d folders, %d identity rules' % (group.name, len(group.members), len(group.paths), len(group.rules)))
+    rules = sum(len(group.rules) for group in planned)
+    paths = sum(len(group.paths) for group in planned)
+    log.info('*** Migration: %d groups, %d identity rules to replace by %d group rules' % (len(planned), rules, paths))
+    if args.dry_run or not planned:
+        return
+    with journal.open_journal('migrate', args.journal, args.resume) as j:
+        results = groups.migrate(planned, args.app_uuid, args.ep_uuid, workers=args.workers, journal=j)
+    errors = sum(1 for result in results if result['status'] == 'error')
+    if errors:
+        raise RuntimeError('%d folders could not be migrated' % errors)
+
+def serve(args):
+    """
+    Run a daemon keeping the Globus session, the caches and the connection pool warm.
+    While it runs the create, share, links and du commands are forwarded to it
+
+    Parameters
+    ----------
+    args.app_uuid : Globus App / Client UUID
+    args.ep_uuid  : Endpoint UUID
+    args.socket   : Unix socket the daemon listens on
+    """
+    from gdauth import globus
+    from gdauth import tokens
+    from gdauth import daemon
+    from gdauth import scheduler
+
+    # the daemon outlives the tokens and any command deadline: renew the tokens in the background
+    tokens.configure(args.token_store, args.token_file, args.refresh_margin, True)
+    scheduler.configure(deadline=None)
+    globus.get_session(args.app_uuid, args.ep_uuid)
+    # no terminal is attached to the commands run by the daemon
+    globus.INTERACTIVE_LOGIN = False
+    settings = {key: getattr(args, key) for key in daemon.SETTINGS}
+    settings.update(deadline=None, token_file=args.token_file and os.path.abspath(args.token_file))
+    daemon.serve(FORWARDED, args.socket or daemon.SOCKET_FILE, settings)
+
+# commands run by gdauth serve when it is running
+FORWARDED = {'create': create, 'share': share, 'links': links, 'du': du}
+
+def _forward(args):
+    """
+    Run the command in gdauth serve if it is running, return False to run it in this process
+    """
+    if args._cmd not in FORWARDED or args.no_daemon or getattr(args, 'output', None) == '-':
+        return False
+    from gdauth import daemon
+
+    status = daemon.forward(args._cmd, args, args.socket or daemon.SOCKET_FILE)
+    if status is None:
+        return False
+    if status:
+        sys.exit(status)
+    return True
+
+def _walk_options(args):
+    return {'max_depth': args.max_depth,
+            'include':   args.include,
+            'exclude':   args.exclude,
+            'workers':   args.workers}
+
+def _profile_report(args):
+    """
+    Log and save the operation metrics recorded by the command
+    """
+
+    from gdauth import metrics
+    if args.profile:
+        metrics.log_table()
+    try:
+        if args.profile_json:
+            metrics.write_json(args.profile_json)
+            log.info('*** Profile saved to %s' % args.profile_json)
+        if args.prometheus_file:
+            metrics.write_prometheus(args.prometheus_file)
+            log.info('*** Metrics saved to %s' % args.prometheus_file)
+    except OSError as e:
+        log.error('Cannot save the profile: %s' % e)
 
-    for file_link in file_links:
-        log.warning(file_link)
-    for folder_link in folder_links:
-        log.warning(folder_link)
 
 def main():
     # Set up custom logger for cleaner output
@@ -189,17 +486,29 @@ def main():
 
     # Define subcommand parameters
     select_params = config.SELECT_PARAMS
+    login_params = config.LOGIN_PARAMS
     create_params = config.CREATE_PARAMS
     share_params = config.SHARE_PARAMS
     links_params = config.LINKS_PARAMS
+    du_params = config.DU_PARAMS
+    serve_params = config.SERVE_PARAMS
+    plan_params = config.PLAN_PARAMS
+    apply_params = config.APPLY_PARAMS
+    migrate_params = config.MIGRATE_PARAMS
 
     # Subcommands setup
     cmd_parsers = [
         ('init',        init,           (),               "Create configuration file"),
         ('select',      select,         select_params,    "Select a Collection on the Globus server"),
+        ('login',       login,          login_params,     "Login to Globus and save tokens for one or more Collections"),
         ('create',      create,         create_params,    "Create a folder in the Collection"),
         ('share',       share,          share_params,     "Share a Collection folder with a user email address"),
         ('links',       links,          links_params,     "Create download links for all items (folder and files) listed in a Collection folder"),
+        ('du',          du,             du_params,        "Show number of files, folders and bytes in a Collection folder"),
+        ('plan',        plan,           plan_params,      "Show the folders and read rules to change for the Collection to match a manifest"),
+        ('apply',       apply,          apply_params,     "Create the folders and change the read rules for the Collection to match a manifest"),
+        ('migrate',     migrate,        migrate_params,   "Replace the read rules of the folders shared with many users by Globus group rules"),
+        ('serve',       serve,          serve_params,     "Run a daemon serving the create, share, links and du commands from warm Globus clients"),
     ]
 
     subparsers = parser.add_subparsers(title="Commands", metavar='')
@@ -208,7 +517,9 @@ def main():
         cmd_params = config.Params(sections=sections)
         cmd_parser = subparsers.add_parser(cmd, help=text, formatter_class=argparse.ArgumentDefaultsHelpFormatter)
         cmd_parser = cmd_params.add_arguments(cmd_parser)
-        cmd_parser.set_defaults(_func=func)
+        if 'manifest' in sections:
+            cmd_parser.add_argument('manifest', type=str, help='YAML or JSON manifest of the folders and of their readers', metavar='MANIFEST')
+        cmd_parser.set_defaults(_func=func, _cmd=cmd)
 
     # Parse arguments
     args = parser.parse_args()
@@ -218,16 +529,44 @@ def main():
         parser.print_help()
         sys.exit(1)
 
-    try:
-        # Run the associated function for the subcommand
-        args._func(args)
-        config.log_values(args)
+    if hasattr(args, 'token_store'):
+        from gdauth import tokens
+        tokens.configure(args.token_store, args.token_file, args.refresh_margin, args.background_refresh)
+
+    if hasattr(args, 'max_retries'):
+        from gdauth import scheduler
+        scheduler.configure({'transfer': args.transfer_rate, 'auth': args.auth_rate}, args.max_retries, args.deadline)
 
-        # Update the configuration file if needed
-        sections = config.GDAUTH_PARAMS
-        config.write(args.config, args=args, sections=sections)
+    if hasattr(args, 'listing_ttl'):
+        from gdauth import listing
+        listing.configure(args.listing_ttl, args.listing_cache_size, args.listing_cache_disk)
+
+    if hasattr(args, 'workers'):
+        from gdauth import pool
+        pool.configure(args.pool_size or args.workers)
+
+    from gdauth import metrics
+    profile = getattr(args, 'profile', False) or getattr(args, 'profile_json', None) or getattr(args, 'prometheus_file', None)
+    if profile:
+        metrics.enable()
+
+    try:
+        # Run the associated function for the subcommand, in gdauth serve if it is running
+        if profile:
+            # the operations are only measured when the command runs in this process
+            with metrics.timer('command ' + args._cmd):
+                args._func(args)
+        elif not _forward(args):
+            args._func(args)
+        # Update the configuration file if needed, measured with the command when profiling
+        with metrics.timer('config write'):
+            config.log_values(args)
+            config.write(args.config, args=args, sections=config.GDAUTH_PARAMS)
     except RuntimeError as e:
         log.error(str(e))
         sys.exit(1)
+    finally:
+        if profile:
+            _profile_report(args)
 if __name__ == '__main__':
     main()
@@ -0,0 +1,210 @@
+import threading
+import globus_sdk
+
+from gdauth import log
+from gdauth import cache
+
+
+__author__ = "Francesco De Carlo"
+__copyright__ = "Copyright (c) 2024, UChicago Argonne, LLC."
+__docformat__ = 'restructuredtext en'
+__all__ = ['AclIndex',
+           'get_acl_index',
+           'normalize_path',
+           'add_rule',
+           'delete_rule',
+           ]
+
+# the access rules of a collection are fetched again after ACL_INDEX_TTL seconds, rules
+# changed outside gdauth (e.g. in the Globus web app) are seen after at most this delay
+ACL_INDEX_TTL = 900
+
+_acl_cache = cache.DiskCache('acl_index', ACL_INDEX_TTL)
+
+
+def normalize_path(path):
+    """
+    Access rule path of a folder: /path/to/folder/
+    """
+
+    path = str(path).strip('/')
+
+    return '/' + path + '/' if path else '/'
+
+
+class AclIndex(object):
+    """
+    Local index of the access rules of one collection keyed by (principal, path, permissions).
+    It is built from one endpoint_acl_list call, saved in ~/.gdauth/acl_index.json and updated
+    when gdauth adds or deletes rules, so a share can be checked without calling the Transfer API.
+
+    Parameters
+    ----------
+    ep_uuid : Collection UUID
+    rules   : List of access rules as returned by endpoint_acl_list
+    """
+
+    def __init__(self, ep_uuid, rules=()):
+        self.ep_uuid = ep_uuid
+        self.lock = threading.Lock()
+        self.rules = {}
+        for rule in rules:
+            self._add(rule)
+
+    def _add(self, rule):
+        key = (rule['principal'], normalize_path(rule['path']), rule['permissions'])
+        self.rules[key] = {'id': rule.get('id'), 'principal_type': rule['principal_type'], 'principal': rule['principal'],
+                           'path': normalize_path(rule['path']), 'permissions': rule['permissions']}
+
+    def contains(self, principal, path, permissions='r'):
+        """
+        True if a rule gives permissions on path to principal
+        """
+        with self.lock:
+            return (principal, normalize_path(path), permissions) in self.rules
+
+    def add(self, rule, rule_id=None, save=False):
+        """
+        Record a rule added to the collection, call save() once the rules of a command are added or with save=True
+        """
+        with self.lock:
+            self._add(dict(rule, id=rule_id or rule.get('id')))
+        if save:
+            self.save()
+
+    def remove(self, rule_id, save=False):
+        """
+        Forget a rule deleted from the collection, call save() once the rules of a command are removed or with save=True
+        """
+        with self.lock:
+            self.rules = {k: v for k, v in self.rules.items() if v['id'] != rule_id}
+        if save:
+            self.save()
+
+    def by_path(self):
+        """
+        Rules grouped by path
+
+        Returns
+        -------
+        dictionary : {path : [rule]}
+        """
+        with self.lock:
+            paths = {}
+            for rule in self.rules.values():
+                paths.setdefault(rule['path'], []).append(rule)
+            return paths
+
+    def save(self):
+        """
+        Save the index in ~/.gdauth/acl_index.json
+        """
+        with self.lock:
+            _acl_cache.set(self.ep_uuid, list(self.rules.values()))
+        _acl_cache.save()
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_acl_index(tc, ep_uuid, refresh=False):
+    """
+    Return the access rule index of a collection, fetch the rules with endpoint_acl_list only
+    when the saved index is missing, older than ACL_INDEX_TTL or refresh is True
+
+    Parameters
+    ----------
+    tc      : Transfer client
+    ep_uuid : Collection UUID
+    refresh : Fetch the rules even if the saved index is valid
+
+    Returns
+    -------
+    AclIndex : access rule index of the collection
+    """
+
+    with _indexes_lock:
+        rules = cache.MISSING if refresh else _acl_cache.get(ep_uuid)
+        if rules is cache.MISSING:
+            # the access_list route returns all the rules of the collection in one response
+            rules = list(tc.endpoint_acl_list(ep_uuid))
+            log.info('Collection %s has %d access rules' % (ep_uuid, len(rules)))
+            index = _indexes[ep_uuid] = AclIndex(ep_uuid, rules)
+            index.save()
+        elif ep_uuid not in _indexes:
+            _indexes[ep_uuid] = AclIndex(ep_uuid, rules)
+        return _indexes[ep_uuid]
+
+
+def add_rule(tc, index, ep_uuid, directory, principal, principal_type='identity', permissions='r', email=None, message=''):
+    """
+    Give permissions on directory to a principal, unless the index already has the rule. The rule is
+    recorded in the index, call index.save() once the rules are added.
+
+    Parameters
+    ----------
+    tc             : Transfer client
+    index          : AclIndex of the collection
+    ep_uuid        : Collection UUID
+    directory      : Directory to share
+    principal      : Identity id or group UUID
+    principal_type : 'identity' or 'group'
+    permissions    : 'r' or 'rw'
+    email          : Email address notified of the new rule, group rules notify no one
+    message        : Custom message to include to the email
+
+    Returns
+    -------
+    (status, error) : status is shared, exists or error
+    """
+
+    dir_path = normalize_path(directory)
+    rule_data = {
+      'DATA_TYPE': 'access',
+      'principal_type': principal_type,
+      'principal': principal,
+      'path': dir_path,
+      'permissions': permissions
+    }
+    if email:
+        rule_data['notify_email'] = email
+        rule_data['notify_message'] = message
+    if index.contains(principal, dir_path, permissions):
+        return 'exists', None
+    try:
+        response = tc.add_endpoint_acl_rule(ep_uuid, rule_data)
+        index.add(rule_data, response['access_id'])
+        return 'shared', None
+    except globus_sdk.TransferAPIError as e:
+        if e.code == 'Exists':
+            index.add(rule_data)
+            return 'exists', None
+        return 'error', f"{e.code} - {e.message}"
+
+
+def delete_rule(tc, index, ep_uuid, rule):
+    """
+    Delete an access rule and forget it in the index, call index.save() once the rules are deleted
+
+    Parameters
+    ----------
+    tc      : Transfer client
+    index   : AclIndex of the collection
+    ep_uuid : Collection UUID
+    rule    : Rule of the index, with its id
+
+    Returns
+    -------
+    (status, error) : status is deleted or error, a rule already deleted is reported as deleted
+    """
+
+    try:
+        tc.delete_endpoint_acl_rule(ep_uuid, rule['id'])
+    except globus_sdk.TransferAPIError as e:
+        # e.g. AccessRuleNotFound, the rule was already deleted
+        if not e.code.endswith('NotFound'):
+            return 'error', f"{e.code} - {e.message}"
+    index.remove(rule['id'])
+
+    return 'deleted', None
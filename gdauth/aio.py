@@ -0,0 +1,600 @@
+"""
+asyncio versions of the gdauth.globus functions. Requests are sent with aiohttp on one
+connection pool per AsyncGlobusSession and at most *concurrency* of them are in flight at once.
+The Globus token, the identity, endpoint, folder and listing caches and the access rule index
+are shared with gdauth.globus, so both APIs send the same requests.
+
+"""
+import json
+import time
+import asyncio
+
+from globus_sdk import config as sdk_config
+
+from gdauth import acl
+from gdauth import log
+from gdauth import cache
+from gdauth import globus
+from gdauth import listing
+from gdauth import metrics
+from gdauth import scheduler
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+
+__author__ = "Francesco De Carlo"
+__copyright__ = "Copyright (c) 2024, UChicago Argonne, LLC."
+__docformat__ = 'restructuredtext en'
+__all__ = ['AsyncGlobusSession',
+           'GlobusAPIError',
+           'get_session',
+           'create_dir',
+           'check_folder_exists',
+           'get_user_id',
+           'get_user_ids',
+           'share',
+           'find_endpoints',
+           'get_endpoint_info',
+           'create_links',
+           'iter_links',
+           'find_items',
+           'iter_items',
+           ]
+
+# maximum number of Globus requests in flight per session
+AIO_CONCURRENCY = 32
+
+TRANSFER_API = 'v0.10'
+
+# a token expiring within TOKEN_MARGIN seconds is renewed on a worker thread, not on the event loop
+TOKEN_MARGIN = 300
+
+
+class GlobusAPIError(Exception):
+    """
+    Error returned by the Transfer or the Auth API, same attributes as globus_sdk.GlobusAPIError
+    """
+
+    def __init__(self, http_status, code, message, headers=None):
+        super().__init__(f"{http_status} {code} - {message}")
+        self.http_status = http_status
+        self.code = code
+        self.message = message
+        self.headers = headers or {}
+
+
+class AsyncGlobusSession(object):
+    """
+    Async HTTP transport for one App / Collection pair. The token and the authorizer come from the
+    synchronous GlobusSession, loaded on first use on a worker thread, the requests go through one
+    aiohttp connection pool and an asyncio semaphore limiting the number of requests in flight.
+    Requests share the rate limits and the retries of gdauth.scheduler with the synchronous clients.
+
+    Parameters
+    ----------
+    app_uuid    : Globus App / Client UUID
+    ep_uuid     : Collection UUID
+    concurrency : Maximum number of requests in flight
+    session     : GlobusSession providing the token, default is the shared session for app_uuid / ep_uuid
+    """
+
+    def __init__(self, app_uuid, ep_uuid, concurrency=AIO_CONCURRENCY, session=None):
+
+        if aiohttp is None:
+            raise RuntimeError('gdauth.aio requires aiohttp: pip install aiohttp')
+
+        self.app_uuid  = app_uuid
+        self.ep_uuid   = ep_uuid
+        self.session   = session
+        self.lock      = asyncio.Lock()
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.loop      = asyncio.get_running_loop()
+        self.http      = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=concurrency))
+        self.base_url  = {'transfer': sdk_config.get_service_url('transfer') + TRANSFER_API,
+                          'auth':     sdk_config.get_service_url('auth').rstrip('/')}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def close(self):
+        await self.http.close()
+
+    async def globus_session(self):
+        """
+        GlobusSession providing the token. Loading the token may renew it or ask for a login,
+        so the session is created on a worker thread and the event loop keeps running.
+        """
+        if self.session is None:
+            async with self.lock:
+                if self.session is None:
+                    self.session = await self.loop.run_in_executor(None, globus.get_session, self.app_uuid, self.ep_uuid)
+        return self.session
+
+    async def authorization_header(self):
+        """
+        Authorization header of the requests, a token about to expire is renewed on a worker thread
+        """
+        authorizer = (await self.globus_session()).authorizer
+        expires_at = getattr(authorizer, 'expires_at', None)
+        if expires_at is not None and expires_at - time.time() > TOKEN_MARGIN:
+            return authorizer.get_authorization_header()
+        async with self.lock:
+            return await self.loop.run_in_executor(None, authorizer.get_authorization_header)
+
+    async def request(self, method, service, path, params=None, data=None):
+        """
+        Send one request to the Transfer or the Auth API, retried by gdauth.scheduler on transient errors
+
+        Parameters
+        ----------
+        method  : HTTP method
+        service : 'transfer' or 'auth'
+        path    : Path of the API route
+        params  : Query parameters
+        data    : JSON body
+
+        Returns
+        -------
+        dictionary : JSON response
+        """
+
+        return await scheduler.call_async(service, (GlobusAPIError, aiohttp.ClientError, asyncio.TimeoutError),
+                                          self._request, method, service, path, params, data)
+
+    async def _request(self, method, service, path, params, data):
+
+        headers = {'Authorization': await self.authorization_header()}
+        async with self.semaphore:
+            with metrics.timer(metrics.operation_name(service, method, path)) as t:
+                async with self.http.request(method, self.base_url[service] + path, params=params, json=data, headers=headers) as r:
+                    content = await r.read()
+                    t.nbytes = len(content)
+                    try:
+                        body = json.loads(content) if content else {}
+                    except ValueError:
+                        # e.g. the HTML error page of a proxy, a 2xx without JSON is retried as a bad gateway
+                        text = content.decode(errors='replace').strip()
+                        raise GlobusAPIError(r.status if r.status >= 400 else 502, 'InvalidResponse',
+                                             'Response is not JSON: %s' % (text[:200] or r.reason), r.headers)
+                    if r.status >= 400:
+                        body = body if isinstance(body, dict) else {}
+                        raise GlobusAPIError(r.status, body.get('code', 'Error'), body.get('message', r.reason), r.headers)
+                    return body
+
+
+_sessions = {}
+
+
+def get_session(app_uuid, ep_uuid):
+    """
+    Return the AsyncGlobusSession of the running event loop for an App / Collection pair, create it on first use
+
+    Parameters
+    ----------
+    app_uuid : Globus App / Client UUID
+    ep_uuid  : Collection UUID
+
+    Returns
+    -------
+    AsyncGlobusSession : session shared by all calls for this App / Collection pair
+    """
+
+    key = (app_uuid, ep_uuid)
+    session = _sessions.get(key)
+    if session is None or session.loop is not asyncio.get_running_loop() or session.http.closed:
+        if session is not None:
+            _discard(session)
+        session = _sessions[key] = AsyncGlobusSession(app_uuid, ep_uuid)
+        # asyncio.run cancels this task before closing the loop, which closes the session with its loop
+        session.closer = asyncio.ensure_future(_close_with_loop(session))
+
+    return session
+
+
+async def _close_with_loop(session):
+
+    try:
+        await session.loop.create_future()
+    finally:
+        await session.close()
+
+
+def _discard(session):
+    """
+    Close the connection pool of a session replaced by get_session, on the event loop it belongs to
+    """
+
+    if session.http.closed:
+        return
+    if not session.loop.is_closed():
+        asyncio.run_coroutine_threadsafe(session.close(), session.loop)
+    else:
+        # a loop closed without cancelling its tasks, its connections were lost with it
+        session.http.detach()
+
+
+async def create_dir(directory, app_uuid, ep_uuid, session=None):
+    """
+    Create directory, see gdauth.globus.create_dir
+
+    Parameters
+    ----------
+    directory : Directory to be created in the share
+    app_uuid  : Globus App / Client UUID
+    ep_uuid   : Collection UUID
+    session   : AsyncGlobusSession to reuse, default is the shared session for app_uuid / ep_uuid
+
+    Returns
+    -------
+    Boolean : True if directory is created or already exists
+    """
+
+    session = session or get_session(app_uuid, ep_uuid)
+    dir_path = str(directory) + '/'
+    try:
+        await session.request('POST', 'transfer', f'/operation/endpoint/{ep_uuid}/mkdir', data={'DATA_TYPE': 'mkdir', 'path': dir_path})
+        listing.invalidate(ep_uuid, directory)
+        log.info('*** Created folder: %s' % dir_path)
+    except GlobusAPIError as e:
+        if not e.code.endswith('Exists'):
+            log.error(f"Transfer API Error: {e.code} - {e.message}")
+            return False
+        log.warning('*** Folder %s already exists' % dir_path)
+    globus._dir_cache.set(ep_uuid + ':' + str(directory).rstrip('/'), True)
+    await session.loop.run_in_executor(None, globus._dir_cache.save)
+    log.warning(globus.create_folder_link(directory, app_uuid, ep_uuid))
+
+    return True
+
+
+async def check_folder_exists(directory, app_uuid, ep_uuid, session=None, use_cache=True):
+    """
+    Check if directory exists, answered from the cached listings as gdauth.globus.check_folder_exists
+
+    Parameters
+    ----------
+    directory : Directory to be created in the share
+    app_uuid  : Globus App / Client UUID
+    ep_uuid   : Collection UUID
+    session   : AsyncGlobusSession to reuse, default is the shared session for app_uuid / ep_uuid
+    use_cache : Answer from the cached listings
+
+    Returns
+    -------
+    Boolean : True if directory exists
+    """
+
+    if use_cache:
+        exists = listing.exists(ep_uuid, directory)
+        if exists is not None:
+            return exists
+
+    session = session or get_session(app_uuid, ep_uuid)
+    try:
+        params = {'path': str(directory), 'limit': globus.LS_PAGE_SIZE}
+        response = await session.request('GET', 'transfer', f'/operation/endpoint/{ep_uuid}/ls', params=params)
+        data = response['DATA']
+        if len(data) < globus.LS_PAGE_SIZE or response.get('total') == len(data):
+            listing.set(ep_uuid, directory, [globus._item(entry) for entry in data])
+        return True
+    except GlobusAPIError as e:
+        if e.code == 'ClientError.NotFound':
+            return False
+        raise
+
+
+async def get_user_ids(emails, app_uuid, ep_uuid, session=None, batch_size=globus.IDENTITY_BATCH_SIZE):
+    """
+    Get the user ids of many user emails, see gdauth.globus.get_user_ids. The batches missing
+    from the identity cache are requested concurrently.
+
+    Parameters
+    ----------
+    emails     : List of user email addresses
+    app_uuid   : Globus App / Client UUID
+    ep_uuid    : Collection UUID
+    session    : AsyncGlobusSession to reuse, default is the shared session for app_uuid / ep_uuid
+    batch_size : Number of emails per identities request
+
+    Returns
+    -------
+    dictionary : {email : user id or None}
+    """
+
+    user_ids = {}
+    missing  = []
+    for email in dict.fromkeys(emails):
+        user_id = globus._identity_cache.get(email.lower())
+        if user_id is cache.MISSING:
+            missing.append(email)
+        else:
+            user_ids[email] = user_id
+
+    async def resolve(batch):
+        params = {'usernames': ','.join(batch), 'provision': 'true'}
+        try:
+            r = await session.request('GET', 'auth', '/v2/api/identities', params=params)
+        except GlobusAPIError as e:
+            if len(batch) > 1:
+                return [p for email in batch for p in await resolve([email])]
+            if e.code == 'MISSING_PARAMETERS':
+                log.error(f"Authorization API Error: {e.code} - {e.message}")
+                return [(batch[0], None)]
+            raise
+        identities = r['identities']
+        if len(batch) == 1 and len(identities) == 1:
+            return [(batch[0], identities[0]['id'])]
+        by_username = {identity['username'].lower(): identity['id'] for identity in identities}
+        return [(email, by_username.get(email.lower())) for email in batch]
+
+    if missing:
+        session = session or get_session(app_uuid, ep_uuid)
+        batches = [missing[i:i + batch_size] for i in range(0, len(missing), batch_size)]
+        for batch in await asyncio.gather(*(resolve(b) for b in batches)):
+            for email, user_id in batch:
+                globus._identity_cache.set(email.lower(), user_id, ttl=None if user_id else globus.IDENTITY_NEGATIVE_TTL)
+                user_ids[email] = user_id
+        await session.loop.run_in_executor(None, globus._identity_cache.save)
+
+    return user_ids
+
+
+async def get_user_id(email, app_uuid, ep_uuid, session=None):
+    """
+    Get user id from user email
+
+    Parameters
+    ----------
+    email    : User email address
+    app_uuid : Globus App / Client UUID
+    ep_uuid  : Collection UUID
+    session  : AsyncGlobusSession to reuse, default is the shared session for app_uuid / ep_uuid
+
+    Returns
+    -------
+    string : User ID
+    """
+
+    return (await get_user_ids([email], app_uuid, ep_uuid, session=session))[email]
+
+
+async def share(directory, email, app_uuid, ep_uuid, message='', session=None):
+    """
+    Share an existing globus directory with a Globus user, see gdauth.globus.share. The rule is
+    checked in and added to the access rule index of the collection, loaded on a worker thread.
+
+    Parameters
+    ----------
+    directory : Name of the directory to share
+    email     : Email address to share the Globus directory with
+    app_uuid  : Globus App / Client UUID
+    ep_uuid   : Collection UUID
+    message   : Custom message to include to the email
+    session   : AsyncGlobusSession to reuse, default is the shared session for app_uuid / ep_uuid
+
+    Returns
+    -------
+    Boolean : True if folder is shared
+    """
+
+    session = session or get_session(app_uuid, ep_uuid)
+    tc = (await session.globus_session()).tc
+    index, exists, user_id = await asyncio.gather(session.loop.run_in_executor(None, acl.get_acl_index, tc, ep_uuid),
+                                                  check_folder_exists(directory, app_uuid, ep_uuid, session=session),
+                                                  get_user_id(email, app_uuid, ep_uuid, session=session))
+    if not exists:
+        log.error('Directory does not exist')
+        log.error('Create: %s' % directory)
+        return False
+    if user_id is None:
+        log.error('Invalid user id')
+        return False
+
+    dir_path = acl.normalize_path(directory)
+    rule_data = {
+      'DATA_TYPE': 'access',
+      'principal_type': 'identity',
+      'principal': user_id,
+      'path': dir_path,
+      'permissions': 'r',
+      'notify_email': email,
+      'notify_message': message
+    }
+    if index.contains(user_id, dir_path, 'r'):
+        log.info('*** Path %s is already shared with %s' % (dir_path, email))
+        log.warning(globus.create_folder_link(directory, app_uuid, ep_uuid))
+        return True
+    try:
+        response = await session.request('POST', 'transfer', f'/endpoint/{ep_uuid}/access', data=rule_data)
+        index.add(rule_data, response['access_id'])
+        log.info('*** Path %s has been shared with %s' % (dir_path, email))
+    except GlobusAPIError as e:
+        if e.code != 'Exists':
+            log.error(f"Transfer API Error: {e.code} - {e.message}")
+            return False
+        index.add(rule_data)
+        log.info('*** Path %s is already shared with %s' % (dir_path, email))
+    await session.loop.run_in_executor(None, index.save)
+    log.warning(globus.create_folder_link(directory, app_uuid, ep_uuid))
+
+    return True
+
+
+async def _endpoint_search(session, filter_scope):
+
+    endpoints = []
+    offset = 0
+    while True:
+        r = await session.request('GET', 'transfer', '/endpoint_search', params={'filter_scope': filter_scope, 'offset': offset, 'limit': 100})
+        endpoints.extend(r['DATA'])
+        offset += len(r['DATA'])
+        if not r.get('has_next_page') or not r['DATA']:
+            return endpoints
+
+
+async def find_endpoints(app_uuid, ep_uuid, session=None, use_cache=True):
+    """
+    Find all end points, see gdauth.globus.find_endpoints. The three endpoint searches run concurrently.
+
+    Parameters
+    ----------
+    app_uuid  : Globus App / Client UUID
+    ep_uuid   : Collection UUID
+    session   : AsyncGlobusSession to reuse, default is the shared session for app_uuid / ep_uuid
+    use_cache : Return the endpoint index when it is still valid
+
+    Returns
+    -------
+    dictionaries : my endpoints, endpoints shared with me, endpoints shared by me as {endpoint id : endpoint name}
+    """
+
+    if use_cache:
+        found = globus.cached_endpoints(app_uuid)
+        if found is not None:
+            return found
+
+    session = session or get_session(app_uuid, ep_uuid)
+    results = await asyncio.gather(*(_endpoint_search(session, scope) for scope in globus.ENDPOINT_SCOPES))
+
+    found = []
+    for scope, endpoints in zip(globus.ENDPOINT_SCOPES, results):
+        found.append({ep['id']: ep['display_name'] for ep in endpoints})
+        globus._endpoint_index.set(app_uuid + ':' + scope, found[-1])
+        for ep in endpoints:
+            globus._cache_endpoint_info(ep)
+    await session.loop.run_in_executor(None, globus._endpoint_index.save)
+    await session.loop.run_in_executor(None, globus._endpoint_cache.save)
+
+    return tuple(found)
+
+
+async def get_endpoint_info(app_uuid, ep_uuid, session=None):
+    """
+    Get display name and HTTPS base URL of a collection, see gdauth.globus.get_endpoint_info
+    """
+
+    info = globus._endpoint_cache.get(ep_uuid)
+    if info is cache.MISSING:
+        session = session or get_session(app_uuid, ep_uuid)
+        info = globus._cache_endpoint_info(await session.request('GET', 'transfer', f'/endpoint/{ep_uuid}'))
+        if info is None:
+            raise RuntimeError('Collection %s has no HTTPS server' % ep_uuid)
+        await session.loop.run_in_executor(None, globus._endpoint_cache.save)
+
+    return info
+
+
+async def iter_items(directory, app_uuid, ep_uuid, session=None, page_size=globus.LS_PAGE_SIZE, use_cache=True):
+    """
+    Generate the items (file or folders) present in the directory page by page, see gdauth.globus.iter_items.
+    A listing that fits in one page is cached and reused, as by gdauth.globus.iter_items.
+
+    Parameters
+    ----------
+    directory : Directory to list
+    app_uuid  : Globus App / Client UUID
+    ep_uuid   : Collection UUID
+    session   : AsyncGlobusSession to reuse, default is the shared session for app_uuid / ep_uuid
+    page_size : Number of entries requested per ls call
+    use_cache : Reuse a cached listing, with False the directory is always listed
+
+    Yields
+    ------
+    Item : (name, type, size, last_modified)
+    """
+
+    if use_cache:
+        cached = listing.get(ep_uuid, directory)
+        if cached is not None:
+            for item in cached:
+                yield globus.Item(*item)
+            return
+
+    session = session or get_session(app_uuid, ep_uuid)
+    items = []
+    offset = 0
+    while True:
+        params = {'path': str(directory), 'limit': page_size, 'offset': offset}
+        response = await session.request('GET', 'transfer', f'/operation/endpoint/{ep_uuid}/ls', params=params)
+        data = response['DATA']
+        for entry in data:
+            item = globus._item(entry)
+            if items is not None:
+                items.append(item)
+            yield item
+        offset += len(data)
+        total = response.get('total')
+        if len(data) < page_size or (total is not None and offset >= total):
+            break
+        # only the listings of one page are cached, the longer ones are streamed
+        items = None
+    if items is not None:
+        listing.set(ep_uuid, directory, items)
+
+
+async def find_items(directory, app_uuid, ep_uuid, session=None):
+    """
+    Find items (file or folders) present in the directory
+
+    Returns
+    -------
+    Lists : [files], [folders]
+    """
+
+    files   = []
+    folders = []
+    try:
+        async for item in iter_items(directory, app_uuid, ep_uuid, session=session):
+            if item.type == 'file':
+                files.append(item.name)
+            if item.type == 'dir':
+                folders.append(item.name)
+    except GlobusAPIError as e:
+        log.error(f"Transfer API Error: {e.code} - {e.message}")
+
+    return files, folders
+
+
+async def iter_links(directory, app_uuid, ep_uuid, session=None):
+    """
+    Generate the links for all items (folder and files) listed in the endpoint directory, see gdauth.globus.iter_links
+
+    Yields
+    ------
+    Link : (item, kind, url), kind is 'file' or 'folder'
+    """
+
+    session = session or get_session(app_uuid, ep_uuid)
+    https_server = (await get_endpoint_info(app_uuid, ep_uuid, session=session))['https_server']
+    try:
+        async for item in iter_items(directory, app_uuid, ep_uuid, session=session):
+            if item.type == 'dir':
+                folder_link = 'https://app.globus.org/file-manager?&origin_id=' + ep_uuid + '&origin_path=' + str(directory) + '/' + item.name
+                yield globus.Link(item, 'folder', folder_link)
+            if item.type == 'file' or item.name[-4:] == 'zarr':
+                yield globus.Link(item, 'file', https_server + '/' + str(directory) + '/' + item.name)
+    except GlobusAPIError as e:
+        log.error(f"Transfer API Error: {e.code} - {e.message}")
+
+
+async def create_links(directory, app_uuid, ep_uuid, session=None):
+    """
+    Create the links for all items (folder and files) listed in the endpoint directory
+
+    Returns
+    -------
+    lists : [file url],  [folder url]
+    """
+
+    file_links   = []
+    folder_links = []
+    async for link in iter_links(directory, app_uuid, ep_uuid, session=session):
+        (file_links if link.kind == 'file' else folder_links).append(link.url)
+
+    return file_links, folder_links
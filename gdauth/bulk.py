@@ -0,0 +1,195 @@
+import csv
+import json
+import threading
+import collections
+import globus_sdk
+
+from gdauth.pool import Executor
+
+from gdauth import acl
+from gdauth import log
+from gdauth import globus
+from gdauth import scheduler
+
+
+__author__ = "Francesco De Carlo"
+__copyright__ = "Copyright (c) 2024, UChicago Argonne, LLC."
+__docformat__ = 'restructuredtext en'
+__all__ = ['read_pairs',
+           'share_many',
+           ]
+
+
+def read_pairs(csv_file):
+    """
+    Read (directory, email) pairs from a CSV file. Each row is: directory, email.
+    A header row (dir, email), blank rows and rows starting with # are skipped.
+
+    Parameters
+    ----------
+    csv_file : Name of the CSV file
+
+    Returns
+    -------
+    list : [(directory, email)]
+    """
+
+    pairs = []
+    with open(csv_file, newline='') as f:
+        for row in csv.reader(f):
+            row = [value.strip() for value in row]
+            if len(row) < 2 or row[0] == '' or row[0].startswith('#'):
+                continue
+            if row[0].lower() in ('dir', 'directory') and row[1].lower() == 'email':
+                continue
+            pairs.append((row[0], row[1]))
+
+    return pairs
+
+
+class _Report(object):
+    """
+    Thread safe JSON Lines writer for the per-row results of a bulk operation
+    """
+
+    def __init__(self, report_file):
+        self.lock = threading.Lock()
+        self.f = open(report_file, 'w') if report_file else None
+
+    def write(self, result):
+        if self.f is None:
+            return
+        with self.lock:
+            self.f.write(json.dumps(result) + '\n')
+
+    def close(self):
+        if self.f is not None:
+            self.f.close()
+
+
+# errors of one pair, recorded as its error instead of stopping the whole pool
+_ERRORS = (globus_sdk.GlobusError, scheduler.DeadlineExceeded)
+
+
+def _error(e):
+    if isinstance(e, globus_sdk.GlobusAPIError):
+        return f"{e.code} - {e.message}"
+    return '%s - %s' % (type(e).__name__, e)
+
+
+def _lookup(func, key):
+    """
+    Run a lookup, return (value, error) so that one failure does not stop the whole pool
+    """
+
+    try:
+        return func(key), None
+    except _ERRORS as e:
+        return None, _error(e)
+
+
+def share_many(pairs,          # List of (directory, email) pairs
+               app_uuid,       # Globus App / Client UUID
+               ep_uuid,        # Collection UUID
+               message='',     # Custom message to include to the email
+               workers=8,      # Number of concurrent Globus requests
+               report=None,    # JSON Lines file receiving one result per pair
+               session=None,   # GlobusSession to reuse
+               journal=None):  # Journal recording the pairs done
+    """
+    Share many existing globus directories with many Globus users. Pairs are deduplicated, then the
+    folder checks, the identity lookups and the access rules are run on a pool of *workers* threads.
+    All emails are resolved first with batched, cached identity lookups, and the pairs already present
+    in the collection access rule index are reported as exists without any other request. The folders
+    of the other pairs are checked once each, folders sharing a parent from one listing of the parent.
+
+    Parameters
+    ----------
+    pairs     : List of (directory, email) pairs
+    app_uuid  : Globus App / Client UUID
+    ep_uuid   : Collection UUID
+    message   : Custom message to include to the email
+    workers   : Number of concurrent Globus requests
+    report    : JSON Lines file receiving one result per pair
+    session   : GlobusSession to reuse, default is the shared session for app_uuid / ep_uuid
+    journal   : gdauth.journal.Journal recording the status of each pair, the pairs it records as done are skipped
+
+    Returns
+    -------
+    list : [{'dir', 'email', 'status', 'error', 'link'}], status is one of
+           shared, exists, missing_dir, invalid_user, error
+    """
+
+    session = session or globus.get_session(app_uuid, ep_uuid)
+    pairs   = list(dict.fromkeys((str(d).strip('/'), e.lower()) for d, e in pairs))
+    if journal is not None:
+        todo = [pair for pair in pairs if not journal.done('share', *pair)]
+        if len(todo) < len(pairs):
+            log.info('Skipping %d pairs done in %s' % (len(pairs) - len(todo), journal.file_name))
+        pairs = todo
+    dirs    = list(dict.fromkeys(d for d, e in pairs))
+    emails  = list(dict.fromkeys(e for d, e in pairs))
+    log.info('Sharing %d pairs (%d folders, %d users) with %d workers' % (len(pairs), len(dirs), len(emails), workers))
+
+    out = _Report(report)
+    results = []
+
+    def process(pair):
+        directory, email = pair
+        result = {'dir': directory, 'email': email, 'status': None, 'error': None, 'link': None}
+        user_id, user_error = user_ids[email]
+        if pair in known:
+            result['status'] = 'exists'
+        elif index_error:
+            result['status'], result['error'] = 'error', index_error
+        else:
+            exists, error = dir_exists[directory]
+            if error or user_error:
+                result['status'], result['error'] = 'error', error or user_error
+            elif not exists:
+                result['status'] = 'missing_dir'
+            elif user_id is None:
+                result['status'] = 'invalid_user'
+            else:
+                try:
+                    result['status'], result['error'] = acl.add_rule(session.tc, index, ep_uuid, directory, user_id, email=email, message=message)
+                except _ERRORS as e:
+                    result['status'], result['error'] = 'error', _error(e)
+        if result['status'] in ('shared', 'exists'):
+            result['link'] = globus.create_folder_link(directory, app_uuid, ep_uuid)
+        out.write(result)
+        if journal is not None:
+            journal.record(('share', directory, email), result['status'], result['error'])
+        return result
+
+    index = None
+    try:
+        with Executor(max_workers=workers) as pool:
+            find_dir   = lambda d: globus.check_folder_exists(d, app_uuid, ep_uuid, session=session)
+            find_users = lambda e: globus.get_user_ids(e, app_uuid, ep_uuid, session=session)
+            users      = pool.submit(_lookup, find_users, emails)
+            rules      = pool.submit(_lookup, lambda tc: acl.get_acl_index(tc, ep_uuid), session.tc)
+            ids, error = users.result()
+            user_ids   = {e: (ids.get(e) if ids else None, error) for e in emails}
+            index, index_error = rules.result()
+            # the pairs already shared need no folder check, without the index no pair can be shared
+            known      = set((d, e) for d, e in pairs if index is not None and user_ids[e][0] and index.contains(user_ids[e][0], acl.normalize_path(d), 'r'))
+            check      = list(dict.fromkeys(d for d, e in pairs if (d, e) not in known)) if index is not None else []
+            # check each parent of several folders first: a parent listing that fits in one page is cached
+            # and the checks of its folders are answered from it
+            parents    = collections.Counter(d.rpartition('/')[0] for d in check)
+            find_dirs  = lambda p: globus.check_folder_exists(p or '/', app_uuid, ep_uuid, session=session, use_cache=False)
+            list(pool.map(lambda p: _lookup(find_dirs, p), [p for p, n in parents.items() if n > 1]))
+            dir_exists = dict(zip(check, pool.map(lambda d: _lookup(find_dir, d), check)))
+            results    = list(pool.map(process, pairs))
+    finally:
+        if index is not None:
+            index.save()
+        out.close()
+
+    summary = {}
+    for result in results:
+        summary[result['status']] = summary.get(result['status'], 0) + 1
+    log.info('*** Bulk share: %s' % ', '.join('%s %d' % (k, v) for k, v in sorted(summary.items())))
+
+    return results
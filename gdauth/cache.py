@@ -0,0 +1,216 @@
+import os
+import json
+import time
+import hashlib
+import pathlib
+import tempfile
+import threading
+import collections
+
+from gdauth import log
+
+
+__author__ = "Francesco De Carlo"
+__copyright__ = "Copyright (c) 2024, UChicago Argonne, LLC."
+__docformat__ = 'restructuredtext en'
+__all__ = ['CACHE_DIR',
+           'MISSING',
+           'DiskCache',
+           'LRUCache',
+           'atomic_write',
+           ]
+
+CACHE_DIR = os.path.join(str(pathlib.Path.home()), '.gdauth')
+
+# returned by DiskCache.get when a key is absent or expired, None is a valid cached value
+MISSING = object()
+
+
+def atomic_write(file_name, text, mode=None):
+    """
+    Write text to file_name so that readers see either the old or the new content, never a partial file
+
+    Parameters
+    ----------
+    file_name : Name of the file to write
+    text      : File content
+    mode      : Permissions of the file, default is readable only by the user
+    """
+
+    dir_name = os.path.dirname(os.path.abspath(file_name))
+    os.makedirs(dir_name, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(dir=dir_name, prefix='.' + os.path.basename(file_name) + '.')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        if mode is not None:
+            os.chmod(tmp_name, mode)
+        os.replace(tmp_name, file_name)
+    except:
+        os.unlink(tmp_name)
+        raise
+
+
+class DiskCache(object):
+    """
+    Key / value cache kept in memory and saved as a JSON file in CACHE_DIR.
+    Each entry expires ttl seconds after it is set.
+
+    Parameters
+    ----------
+    name      : Cache name, the file is CACHE_DIR/name.json
+    ttl       : Default time to live of an entry in seconds
+    cache_dir : Directory of the cache file
+    """
+
+    def __init__(self, name, ttl, cache_dir=CACHE_DIR):
+        self.file_name = os.path.join(cache_dir, name + '.json')
+        self.ttl = ttl
+        self.lock = threading.RLock()
+        self.data = None
+
+    def _load(self):
+        if self.data is None:
+            try:
+                with open(self.file_name) as f:
+                    self.data = json.load(f)
+            except FileNotFoundError:
+                self.data = {}
+            except ValueError:
+                log.warning('Ignoring corrupted cache file %s' % self.file_name)
+                self.data = {}
+        return self.data
+
+    def get(self, key):
+        """
+        Return the value cached for key or MISSING if it is absent or expired
+        """
+        with self.lock:
+            entry = self._load().get(key)
+            if entry is None or entry[0] < time.time():
+                return MISSING
+            return entry[1]
+
+    def set(self, key, value, ttl=None):
+        """
+        Cache value for key during ttl seconds, default is the cache ttl
+        """
+        with self.lock:
+            self._load()[key] = [time.time() + (self.ttl if ttl is None else ttl), value]
+
+    def invalidate(self, key=None):
+        """
+        Remove key from the cache, remove all keys if key is None
+        """
+        with self.lock:
+            if key is None:
+                self.data = {}
+            else:
+                self._load().pop(key, None)
+
+    def save(self):
+        """
+        Drop expired entries and save the cache file
+        """
+        with self.lock:
+            now = time.time()
+            self.data = {k: v for k, v in self._load().items() if v[0] >= now}
+            try:
+                atomic_write(self.file_name, json.dumps(self.data))
+            except OSError as e:
+                log.warning('Cannot save cache file %s: %s' % (self.file_name, e))
+
+
+class LRUCache(object):
+    """
+    Key / value cache holding at most size entries in memory, the least recently used entry is dropped
+    first. Each entry expires ttl seconds after it is set. With cache_dir each entry is also saved as
+    one JSON file in cache_dir, so that other processes reuse it; keys and values must then be JSON
+    serializable and a value read back from disk has its tuples converted to lists.
+
+    Parameters
+    ----------
+    size      : Maximum number of entries kept in memory
+    ttl       : Default time to live of an entry in seconds
+    cache_dir : Directory of the entry files, default is memory only
+    """
+
+    def __init__(self, size, ttl, cache_dir=None):
+        self.size = size
+        self.ttl = ttl
+        self.cache_dir = cache_dir
+        self.lock = threading.RLock()
+        self.data = collections.OrderedDict()
+
+    def _file(self, key):
+        return os.path.join(self.cache_dir, hashlib.sha1(json.dumps(key).encode()).hexdigest() + '.json')
+
+    def _read(self, key):
+        try:
+            with open(self._file(key)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _store(self, key, entry):
+        self.data[key] = entry
+        self.data.move_to_end(key)
+        while len(self.data) > self.size:
+            old_key, _ = self.data.popitem(last=False)
+            self._remove(old_key)
+
+    def _remove(self, key):
+        if self.cache_dir is not None:
+            try:
+                os.unlink(self._file(key))
+            except OSError:
+                pass
+
+    def get(self, key):
+        """
+        Return the value cached for key or MISSING if it is absent or expired
+        """
+        with self.lock:
+            entry = self.data.get(key)
+            if entry is None and self.cache_dir is not None:
+                entry = self._read(key)
+                if entry is not None:
+                    self._store(key, entry)
+            if entry is None:
+                return MISSING
+            if entry[0] < time.time():
+                self.data.pop(key, None)
+                self._remove(key)
+                return MISSING
+            self.data.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value, ttl=None):
+        """
+        Cache value for key during ttl seconds, default is the cache ttl
+        """
+        entry = [time.time() + (self.ttl if ttl is None else ttl), value]
+        with self.lock:
+            self._store(key, entry)
+        if self.cache_dir is not None:
+            try:
+                atomic_write(self._file(key), json.dumps(entry))
+            except OSError as e:
+                log.warning('Cannot save cache file %s: %s' % (self._file(key), e))
+
+    def invalidate(self, key=None):
+        """
+        Remove key from the cache, remove all keys if key is None
+        """
+        with self.lock:
+            if key is not None:
+                self.data.pop(key, None)
+                self._remove(key)
+                return
+            self.data.clear()
+            if self.cache_dir is not None and os.path.isdir(self.cache_dir):
+                for name in os.listdir(self.cache_dir):
+                    if name.endswith('.json'):
+                        os.unlink(os.path.join(self.cache_dir, name))
@@ -3,7 +3,6 @@ import sys
 import pathlib
 import argparse
 import configparser
-import numpy as np
 
 from pathlib import Path
 
@@ -43,6 +42,36 @@ SECTIONS['select'] = {
         'default': 'b07f6a40-672c-4ae8-b420-83eb6e925381',
         'type': str,
         'help': "endpoint UUID"},
+    'token-store':{
+        'default': 'json',
+        'type': str,
+        'choices': ['json', 'sqlite'],
+        'help': "Globus token store format"},
+    'token-file':{
+        'default': None,
+        'type': str,
+        'help': "Globus token store file, default is ~/.gdauth/tokens.json or ~/.gdauth/tokens.sqlite",
+        'metavar': 'FILE'},
+    'refresh-margin':{
+        'default': 3600,
+        'type': int,
+        'help': "renew the Globus tokens with their refresh token when they expire within this many seconds"},
+    'background-refresh':{
+        'default': False,
+        'help': "renew the Globus tokens on a background thread before they expire",
+        'action': 'store_true'},
+    }
+
+SECTIONS['login'] = {
+    'collections': {
+        'default': None,
+        'type': str,
+        'nargs': '+',
+        'help': 'other collection UUIDs to request access to in the same login'},
+    'groups': {
+        'default': False,
+        'help': 'also request access to Globus Groups, needed by gdauth migrate to create groups and add their members',
+        'action': 'store_true'},
     }
 
 SECTIONS['path'] = {
@@ -61,13 +90,205 @@ SECTIONS['share'] = {
         'metavar': 'FILE'},
     }
 
-SELECT_PARAMS = ('select',)
-CREATE_PARAMS = ('select', 'path')
-SHARE_PARAMS  = ('select', 'path', 'share')
-LINKS_PARAMS  = ('select', 'path')
+SECTIONS['bulk'] = {
+    'from-csv': {
+        'default': None,
+        'type': str,
+        'help': 'CSV file listing one "directory, email" pair per row to share in bulk',
+        'metavar': 'FILE'},
+    'report': {
+        'default': None,
+        'type': str,
+        'help': 'JSON Lines file receiving one result record per bulk item',
+        'metavar': 'FILE'},
+    }
+
+SECTIONS['concurrency'] = {
+    'workers': {
+        'default': 8,
+        'type': int,
+        'help': 'number of concurrent Globus requests used by bulk and recursive operations'},
+    'pool-size': {
+        'default': None,
+        'type': int,
+        'help': 'number of keep-alive HTTPS connections per Globus host, default is --workers'},
+    }
+
+SECTIONS['walk'] = {
+    'recursive': {
+        'default': False,
+        'help': 'walk all subdirectories of --dir',
+        'action': 'store_true'},
+    'max-depth': {
+        'default': None,
+        'type': int,
+        'help': 'maximum number of directory levels walked below --dir'},
+    'include': {
+        'default': None,
+        'type': str,
+        'nargs': '+',
+        'help': 'only list items whose name or relative path matches one of these wildcard patterns'},
+    'exclude': {
+        'default': None,
+        'type': str,
+        'nargs': '+',
+        'help': 'skip items, and folders content, whose name or relative path matches one of these wildcard patterns'},
+    }
+
+SECTIONS['mkdir'] = {
+    'parents': {
+        'default': False,
+        'help': 'also create the missing parent folders of --dir, like mkdir -p',
+        'action': 'store_true'},
+    'from-file': {
+        'default': None,
+        'type': str,
+        'help': 'text file listing one folder per line to create in bulk, blank lines and lines starting with # are skipped',
+        'metavar': 'FILE'},
+    }
+
+SECTIONS['retry'] = {
+    'transfer-rate': {
+        'default': 20.0,
+        'type': float,
+        'help': 'maximum number of Transfer API requests per second, 0 is no limit'},
+    'auth-rate': {
+        'default': 10.0,
+        'type': float,
+        'help': 'maximum number of Auth API requests per second, 0 is no limit'},
+    'max-retries': {
+        'default': 5,
+        'type': int,
+        'help': 'number of times a request failing with a network error, a 429 or a 5xx status is retried'},
+    'deadline': {
+        'default': None,
+        'type': float,
+        'help': 'stop sending Globus requests this many seconds after the command starts'},
+    }
+
+SECTIONS['export'] = {
+    'output': {
+        'default': None,
+        'type': str,
+        'help': 'write the links to this file instead of the log, - is the standard output',
+        'metavar': 'FILE'},
+    'format': {
+        'default': 'jsonl',
+        'type': str,
+        'choices': ['jsonl', 'csv', 'txt'],
+        'help': 'format of the --output file: one JSON record per line, CSV with a header row or one url per line'},
+    'gzip': {
+        'default': False,
+        'help': 'compress the --output file with gzip',
+        'action': 'store_true'},
+    'since-last': {
+        'default': False,
+        'help': 'only list the links of the items added, changed or removed since the last --since-last run on the same folder',
+        'action': 'store_true'},
+    }
+
+SECTIONS['listing'] = {
+    'listing-ttl': {
+        'default': 60,
+        'type': float,
+        'help': 'seconds a directory listing is reused by existence checks and listings, 0 disables the listing cache'},
+    'listing-cache-size': {
+        'default': 256,
+        'type': int,
+        'help': 'number of directory listings kept in the listing cache'},
+    'listing-cache-disk': {
+        'default': False,
+        'help': 'also keep the directory listings in ~/.gdauth/listings so that the next commands reuse them',
+        'action': 'store_true'},
+    }
+
+SECTIONS['daemon'] = {
+    'socket': {
+        'default': None,
+        'type': str,
+        'help': 'Unix socket of gdauth serve, default is ~/.gdauth/gdauth.sock',
+        'metavar': 'FILE'},
+    'no-daemon': {
+        'default': False,
+        'help': 'run the command in this process even if gdauth serve is running',
+        'action': 'store_true'},
+    }
+
+SECTIONS['profile'] = {
+    'profile': {
+        'default': False,
+        'help': 'log the count, errors, latency and bytes of each Globus API operation at the end of the command',
+        'action': 'store_true'},
+    'profile-json': {
+        'default': None,
+        'type': str,
+        'help': 'save the operation metrics of the command to this JSON file',
+        'metavar': 'FILE'},
+    'prometheus-file': {
+        'default': None,
+        'type': str,
+        'help': 'save the operation metrics of the command to this file in the Prometheus text format, e.g. for the node exporter textfile collector',
+        'metavar': 'FILE'},
+    }
+
+SECTIONS['journal'] = {
+    'journal': {
+        'default': None,
+        'type': str,
+        'help': 'journal of the items done by a bulk create, share, apply or migrate, default is ~/.gdauth/journals/command-date-time.jsonl',
+        'metavar': 'FILE'},
+    'resume': {
+        'default': None,
+        'type': str,
+        'help': 'resume the interrupted run recorded in this journal: skip the items done, retry the others',
+        'metavar': 'FILE'},
+    }
+
+SECTIONS['manifest'] = {
+    'prune': {
+        'default': None,
+        'help': 'also delete the read rules of the manifest folders given to users that are not listed as their readers, default is prune in the manifest',
+        'action': 'store_true'},
+    'no-prune': {
+        'default': None,
+        'dest': 'prune',
+        'help': 'keep the read rules of the users that are not listed, even with prune: true in the manifest',
+        'action': 'store_const',
+        'const': False},
+    }
+
+SECTIONS['groups'] = {
+    'group': {
+        'default': None,
+        'type': str,
+        'help': 'share the folder with all the members of this Globus group instead of --email',
+        'metavar': 'UUID'},
+    }
+
+SECTIONS['migrate'] = {
+    'min-users': {
+        'default': 2,
+        'type': int,
+        'help': 'only migrate the folders shared with at least this number of users'},
+    'dry-run': {
+        'default': False,
+        'help': 'show the groups and the access rules to migrate without changing them',
+        'action': 'store_true'},
+    }
+
+SELECT_PARAMS = ('select', 'retry', 'profile')
+LOGIN_PARAMS  = ('select', 'login', 'profile')
+CREATE_PARAMS = ('select', 'path', 'mkdir', 'journal', 'concurrency', 'retry', 'listing', 'daemon', 'profile')
+SHARE_PARAMS  = ('select', 'path', 'share', 'groups', 'bulk', 'journal', 'concurrency', 'retry', 'listing', 'daemon', 'profile')
+LINKS_PARAMS  = ('select', 'path', 'walk', 'export', 'concurrency', 'retry', 'listing', 'daemon', 'profile')
+DU_PARAMS     = ('select', 'path', 'walk', 'concurrency', 'retry', 'listing', 'daemon', 'profile')
+SERVE_PARAMS  = ('select', 'concurrency', 'retry', 'listing', 'daemon')
+PLAN_PARAMS   = ('select', 'manifest', 'concurrency', 'retry', 'listing', 'profile')
+APPLY_PARAMS  = ('select', 'manifest', 'journal', 'concurrency', 'retry', 'listing', 'profile')
+MIGRATE_PARAMS = ('select', 'migrate', 'journal', 'concurrency', 'retry', 'profile')
 GDAUTH_PARAMS = ('select', 'path', 'share')
 
-NICE_NAMES = ('General', 'Globus', 'Path', 'Share')
+NICE_NAMES = ('General', 'Globus', 'Login', 'Path', 'Share', 'Bulk', 'Concurrency', 'Walk', 'Mkdir', 'Retry', 'Export', 'Listing', 'Daemon', 'Profile', 'Journal', 'Manifest', 'Groups', 'Migrate')
 
 
 def get_config_name():
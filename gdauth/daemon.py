@@ -0,0 +1,273 @@
+"""
+gdauth serve: a daemon keeping the Globus sessions, the caches and the HTTP connection pool of one
+process warm behind a Unix-domain socket. The create, share, links and du commands forward their
+arguments to the daemon when it is running and print the log messages it sends back.
+
+Protocol: the client sends one JSON line {'command', 'args'}, the daemon answers with JSON lines
+{'level', 'message'} and a last {'exit': status} line. Identical requests received while the first
+one is running are coalesced: they receive the output of the first one instead of running again.
+The rate limits, retries, listing cache, connection pool and token store are set once for the whole
+daemon: a request asking for other values gets a single {'local': options} line and the client
+runs the command in its own process. The daemon never starts an interactive login.
+
+"""
+import os
+import json
+import socket
+import logging
+import pathlib
+import argparse
+import threading
+import contextvars
+import socketserver
+
+from gdauth import log
+from gdauth import cache
+
+
+__author__ = "Francesco De Carlo"
+__copyright__ = "Copyright (c) 2024, UChicago Argonne, LLC."
+__docformat__ = 'restructuredtext en'
+__all__ = ['SOCKET_FILE',
+           'FILE_ARGS',
+           'SETTINGS',
+           'forward',
+           'serve',
+           ]
+
+SOCKET_FILE = os.path.join(cache.CACHE_DIR, 'gdauth.sock')
+
+# command arguments naming local files, sent to the daemon as absolute paths
+FILE_ARGS = ('from_csv', 'report', 'from_file', 'output', 'journal', 'resume', 'token_file')
+
+# process wide options set when the daemon starts, a command asking for other values runs locally
+SETTINGS = ('token_store', 'token_file', 'transfer_rate', 'auth_rate', 'max_retries', 'deadline',
+            'listing_ttl', 'listing_cache_size', 'listing_cache_disk', 'pool_size')
+
+# seconds to wait for the daemon to accept a connection before running the command locally
+CONNECT_TIMEOUT = 1
+
+# _Call of the command running in the current context, copied to its worker threads by gdauth.pool.Executor
+_call = contextvars.ContextVar('gdauth_call', default=None)
+
+
+def _connect(socket_file):
+    """
+    Return a socket connected to the daemon, None if no daemon is listening on socket_file
+    """
+
+    if not hasattr(socket, 'AF_UNIX') or not os.path.exists(socket_file):
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(CONNECT_TIMEOUT)
+    try:
+        sock.connect(socket_file)
+    except OSError:
+        sock.close()
+        return None
+    sock.settimeout(None)
+
+    return sock
+
+
+def forward(command, args, socket_file=SOCKET_FILE):
+    """
+    Run a command in the daemon and log the messages it sends back
+
+    Parameters
+    ----------
+    command     : Command name
+    args        : argparse.Namespace of the command
+    socket_file : Socket of the daemon
+
+    Returns
+    -------
+    int : exit status of the command, None if no daemon is running
+    """
+
+    sock = _connect(socket_file)
+    if sock is None:
+        return None
+
+    values = {k: v for k, v in vars(args).items() if not k.startswith('_')}
+    for key in FILE_ARGS:
+        if values.get(key):
+            values[key] = os.path.abspath(values[key])
+    request = json.dumps({'command': command, 'args': values}, default=str)
+
+    with sock, sock.makefile('rwb') as f:
+        f.write(request.encode() + b'\n')
+        f.flush()
+        for line in f:
+            record = json.loads(line)
+            if 'exit' in record:
+                return record['exit']
+            if 'local' in record:
+                log.warning('gdauth serve runs with other %s, running %s in this process' % (', '.join(record['local']), command))
+                return None
+            getattr(log, record['level'], log.info)(record['message'])
+
+    log.error('gdauth serve closed the connection')
+    return 1
+
+
+class _Call(object):
+    """
+    Output of one command run by the daemon, replayed to every client that sent the same request
+    """
+
+    def __init__(self):
+        self.records = []
+        self.cond = threading.Condition()
+
+    def add(self, record):
+        with self.cond:
+            self.records.append(record)
+            self.cond.notify_all()
+
+    def replay(self):
+        i = 0
+        while True:
+            with self.cond:
+                while i >= len(self.records):
+                    self.cond.wait()
+                records = self.records[i:]
+            i += len(records)
+            for record in records:
+                yield record
+                if 'exit' in record:
+                    return
+
+
+class _LogHandler(logging.Handler):
+    """
+    Send the gdauth log records of a command, including the ones of its worker threads, to its _Call
+    """
+
+    def emit(self, record):
+        call = _call.get()
+        if call is not None:
+            call.add({'level': record.levelname.lower(), 'message': record.getMessage()})
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+
+    daemon_threads = True
+
+    def __init__(self, socket_file, commands, settings):
+        self.commands = commands
+        self.settings = settings
+        self.inflight = {}
+        self.inflight_lock = threading.Lock()
+        super().__init__(socket_file, _Handler)
+
+    def run(self, command, values):
+        """
+        Start a command on a new thread, or join the identical one already running, and return its _Call
+        """
+        key = json.dumps([command, values], sort_keys=True)
+        with self.inflight_lock:
+            call = self.inflight.get(key)
+            if call is not None:
+                log.info('Joining running %s request' % command)
+                return call
+            call = self.inflight[key] = _Call()
+        threading.Thread(target=self._run, args=(key, call, command, values), daemon=True).start()
+
+        return call
+
+    def _run(self, key, call, command, values):
+
+        _call.set(call)
+        status = 0
+        try:
+            self.commands[command](_namespace(values))
+        except RuntimeError as e:
+            log.error(str(e))
+            status = 1
+        except Exception as e:
+            log.error('%s failed: %s: %s' % (command, type(e).__name__, e))
+            status = 1
+        finally:
+            _call.set(None)
+            with self.inflight_lock:
+                del self.inflight[key]
+            call.add({'exit': status})
+
+
+class _Handler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        request = json.loads(self.rfile.readline())
+        command = request.get('command')
+        values = request.get('args') or {}
+        differ = [key.replace('_', '-') for key, value in self.server.settings.items() if key in values and values[key] != value]
+        if command not in self.server.commands:
+            records = [{'level': 'error', 'message': 'gdauth serve cannot run %s' % command}, {'exit': 1}]
+        elif differ:
+            records = [{'local': differ}]
+        else:
+            records = self.server.run(command, values).replay()
+        try:
+            for record in records:
+                self.wfile.write(json.dumps(record).encode() + b'\n')
+                self.wfile.flush()
+        except BrokenPipeError:
+            pass
+
+
+def _namespace(values):
+    """
+    Rebuild the argparse.Namespace of a forwarded command, restoring the Path arguments
+    """
+
+    from gdauth import config
+
+    for section in config.SECTIONS.values():
+        for name, opts in section.items():
+            key = name.replace('-', '_')
+            if opts.get('type') is pathlib.Path and values.get(key) is not None:
+                values[key] = pathlib.Path(values[key])
+
+    return argparse.Namespace(**values)
+
+
+def serve(commands, socket_file=SOCKET_FILE, settings=None):
+    """
+    Run the daemon until interrupted
+
+    Parameters
+    ----------
+    commands    : {command name : command function} of the commands run by the daemon
+    socket_file : Socket the daemon listens on, readable only by the user
+    settings    : {option : value} of the SETTINGS options the daemon runs with, the commands
+                  forwarded with other values are run by the client
+    """
+
+    if not hasattr(socket, 'AF_UNIX'):
+        raise RuntimeError('gdauth serve requires Unix domain sockets')
+    sock = _connect(socket_file)
+    if sock is not None:
+        sock.close()
+        raise RuntimeError('gdauth serve is already running on %s' % socket_file)
+    if os.path.exists(socket_file):
+        os.unlink(socket_file)
+    os.makedirs(os.path.dirname(os.path.abspath(socket_file)), exist_ok=True)
+
+    handler = _LogHandler()
+    log.logger.addHandler(handler)
+    umask = os.umask(0o077)
+    try:
+        server = _Server(socket_file, commands, settings or {})
+    finally:
+        os.umask(umask)
+    log.warning('gdauth serve listening on %s, running: %s' % (socket_file, ', '.join(commands)))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        log.warning('gdauth serve stopped')
+    finally:
+        server.server_close()
+        log.logger.removeHandler(handler)
+        if os.path.exists(socket_file):
+            os.unlink(socket_file)
@@ -0,0 +1,161 @@
+import os
+import io
+import csv
+import sys
+import gzip
+import json
+
+from gdauth import log
+
+
+__author__ = "Francesco De Carlo"
+__copyright__ = "Copyright (c) 2024, UChicago Argonne, LLC."
+__docformat__ = 'restructuredtext en'
+__all__ = ['FORMATS',
+           'FIELDS',
+           'link_record',
+           'write_links',
+           ]
+
+FORMATS = ('jsonl', 'csv', 'txt')
+
+# fields of a link record, txt files only hold the url
+FIELDS = ('name', 'type', 'size', 'mtime', 'url')
+
+# records joined and written at once
+WRITE_BATCH = 1000
+# size of the output file buffer in bytes
+BUFFER_SIZE = 1 << 20
+
+
+def link_record(link):
+    """
+    Convert a Link to a record of the link export
+
+    Parameters
+    ----------
+    link : Link as yielded by gdauth.globus.iter_links
+
+    Returns
+    -------
+    dictionary : {'name', 'type', 'size', 'mtime', 'url'}, type is 'file' or 'folder'
+    """
+
+    return {'name': link.item.name, 'type': link.kind, 'size': link.item.size, 'mtime': link.item.last_modified, 'url': link.url}
+
+
+class _CSVLine(object):
+    """
+    Format one CSV row as a string
+    """
+
+    def __init__(self):
+        self.buffer = io.StringIO()
+        self.writer = csv.writer(self.buffer, lineterminator='\n')
+
+    def __call__(self, row):
+        self.buffer.seek(0)
+        self.buffer.truncate()
+        self.writer.writerow(row)
+        return self.buffer.getvalue()
+
+
+class _Output(object):
+    """
+    Buffered, optionally gzip compressed, text output written to a temporary file in the directory
+    of output and renamed to output by commit. The standard output is used when output is -.
+    """
+
+    def __init__(self, output, compress):
+        self.output = output
+        self.tmp_name = None
+        if output == '-':
+            self.raw = sys.stdout.buffer
+        else:
+            dir_name = os.path.dirname(os.path.abspath(output))
+            os.makedirs(dir_name, exist_ok=True)
+            self.tmp_name = os.path.join(dir_name, '.%s.%d.tmp' % (os.path.basename(output), os.getpid()))
+            # created like a regular file, with the permissions allowed by the umask
+            fd = os.open(self.tmp_name, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666)
+            self.raw = os.fdopen(fd, 'wb', buffering=BUFFER_SIZE)
+        self.zip = None
+        if compress:
+            name = os.path.basename(output)
+            self.zip = gzip.GzipFile(fileobj=self.raw, mode='wb', filename=name[:-3] if name.endswith('.gz') else name)
+        self.f = io.TextIOWrapper(self.zip or self.raw, encoding='utf-8', newline='', write_through=True)
+
+    def write(self, text):
+        self.f.write(text)
+
+    def _close(self):
+        self.f.detach()
+        if self.zip is not None:
+            self.zip.close()
+        self.raw.flush()
+
+    def commit(self):
+        self._close()
+        if self.tmp_name is not None:
+            os.fsync(self.raw.fileno())
+            self.raw.close()
+            os.replace(self.tmp_name, self.output)
+
+    def abort(self):
+        if self.tmp_name is not None:
+            try:
+                self._close()
+            except (OSError, ValueError):
+                pass
+            self.raw.close()
+            os.unlink(self.tmp_name)
+
+
+def write_links(links, output, fmt='jsonl', compress=False, record=link_record, fields=FIELDS):
+    """
+    Write links to a file as they are yielded, in batches of WRITE_BATCH records.
+    The file appears under its name only once complete, a failed export leaves any previous file unchanged.
+
+    Parameters
+    ----------
+    links    : Iterable of Link, e.g. gdauth.globus.iter_links or gdauth.walk.walk_links
+    output   : Output file name, - is the standard output
+    fmt      : Record format: jsonl (one JSON object per line), csv (with a header row) or txt (one url per line)
+    compress : Compress the output with gzip
+    record   : Function converting an element of links to a record dictionary
+    fields   : Fields of the records, in the order of the CSV columns
+
+    Returns
+    -------
+    int : number of records written
+    """
+
+    if fmt not in FORMATS:
+        raise RuntimeError('Unknown link format %s, use one of %s' % (fmt, ', '.join(FORMATS)))
+
+    if fmt == 'jsonl':
+        line = lambda values: json.dumps(values) + '\n'
+    elif fmt == 'csv':
+        csv_line = _CSVLine()
+        line = lambda values: csv_line([values[field] for field in fields])
+    else:
+        # the change of a delta record prefixes its url
+        line = lambda values: ' '.join(str(values[field]) for field in fields if field in ('change', 'url')) + '\n'
+
+    f = _Output(output, compress)
+    count = 0
+    try:
+        batch = [','.join(fields) + '\n'] if fmt == 'csv' else []
+        for link in links:
+            batch.append(line(record(link)))
+            count += 1
+            if len(batch) >= WRITE_BATCH:
+                f.write(''.join(batch))
+                batch = []
+        f.write(''.join(batch))
+        f.commit()
+    except:
+        f.abort()
+        raise
+    log.info('*** %d links written to %s' % (count, output))
+
+    return count
@@ -1,91 +1,436 @@
-import os
-import pathlib
 import time
+import threading
+import collections
 import globus_sdk
-import numpy as np
-from globus_sdk.scopes import TransferScopes
 
+from globus_sdk.scopes import GroupsScopes, TransferScopes
+
+from gdauth.pool import Executor
+
+from gdauth import acl
 from gdauth import log
+from gdauth import pool
+from gdauth import listing
+from gdauth import cache
+from gdauth import tokens
+from gdauth import metrics
+from gdauth import scheduler
 
 
 __author__ = "Francesco De Carlo"
 __copyright__ = "Copyright (c) 2024, UChicago Argonne, LLC."
 __docformat__ = 'restructuredtext en'
 __all__ = ['refresh_globus_token',
+           'login',
+           'has_token',
+           'GlobusSession',
+           'get_session',
            'create_clients',
            'create_dir',
+           'create_dirs',
            'check_folder_exists',
            'get_user_id',
+           'get_user_ids',
            'share',
            'find_endpoints',
+           'cached_endpoints',
+           'refresh_endpoints',
+           'get_endpoint_info',
+           'invalidate_endpoint_info',
            'create_folder_link',
            'create_links',
-           'find_items'
+           'iter_links',
+           'item_links',
+           'find_items',
+           'iter_items',
+           'Item',
+           'Link',
            ]
 
+# email -> identity id cache, emails without identity are retried sooner
+IDENTITY_TTL          = 7 * 24 * 3600
+IDENTITY_NEGATIVE_TTL = 3600
+IDENTITY_BATCH_SIZE   = 100
+
+_identity_cache = cache.DiskCache('identities', IDENTITY_TTL)
+
+# collection id -> display name and HTTPS base URL
+ENDPOINT_TTL = 24 * 3600
+
+_endpoint_cache = cache.DiskCache('endpoints', ENDPOINT_TTL)
+
+# endpoint searches run by find_endpoints, results are indexed by endpoint id
+ENDPOINT_SCOPES    = ('my-endpoints', 'shared-with-me', 'shared-by-me')
+ENDPOINT_INDEX_TTL = 24 * 3600
+
+_endpoint_index = cache.DiskCache('endpoint_index', ENDPOINT_INDEX_TTL)
+
+# collection id:directory -> True for the directories known to exist, create_dirs skips them as parents
+DIR_TTL = 24 * 3600
+
+_dir_cache = cache.DiskCache('dirs', DIR_TTL)
+
+# with False a missing or expired token raises RuntimeError instead of asking for a login, e.g. in gdauth serve
+INTERACTIVE_LOGIN = True
+
+# resource server of the Groups API token, requested by login(groups=True)
+GROUPS_RESOURCE_SERVER = 'groups.api.globus.org'
+
+# number of entries requested per operation_ls page
+LS_PAGE_SIZE = 1000
+
+# directory entry as yielded by iter_items
+Item = collections.namedtuple('Item', ['name', 'type', 'size', 'last_modified'])
+
+# download link as yielded by iter_links: kind is 'file' or 'folder'
+Link = collections.namedtuple('Link', ['item', 'kind', 'url'])
+
+
+def _login(app_uuid, ep_uuids, groups=False):
+    """
+    Interactive Globus login requesting the Transfer scope, the HTTPS scope of each collection and,
+    with groups, the Groups scope in one consent
+
+    Returns
+    -------
+    dictionary : {resource server : token data}
+    """
+
+    client = pool.attach(globus_sdk.NativeAppAuthClient(app_uuid))
+    scopes = [TransferScopes.all] + ([GroupsScopes.all] if groups else [])
+    client.oauth2_start_flow(requested_scopes=scopes + ["https://auth.globus.org/scopes/" + ep_uuid + "/https" for ep_uuid in ep_uuids], refresh_tokens=True)
+
+    log.error('Please go to this URL and login:')
+    log.warning('{0}'.format(client.oauth2_get_authorize_url()))
+
+    get_input = getattr(__builtins__, 'raw_input', input)
+    auth_code = get_input('Please enter the code you get after login here: ').strip()
+
+    return tokens.tokens_from_response(client.oauth2_exchange_code_for_tokens(auth_code))
+
+
+def _tokens_valid(globus_tokens, ep_uuid, margin=0):
+    """
+    True if the Transfer and the collection tokens exist and expire in more than margin seconds
+    """
+
+    if 'transfer.api.globus.org' not in globus_tokens or ep_uuid not in globus_tokens:
+        return False
+    globus_token_life = min(globus_tokens[rs]['expires_at_seconds'] for rs in ('transfer.api.globus.org', ep_uuid)) - time.time()
+
+    return globus_token_life > margin
+
 
-def refresh_globus_token(app_uuid, ep_uuid):
+def _refresh(app_uuid, globus_tokens):
+    """
+    Renew all the access tokens that have a refresh token, without user interaction
+
+    Returns
+    -------
+    dictionary : {resource server : token data} of the renewed tokens
+    """
+
+    client = pool.attach(globus_sdk.NativeAppAuthClient(app_uuid))
+    refreshed = {}
+    for resource_server, data in globus_tokens.items():
+        if data.get('refresh_token'):
+            new_tokens = tokens.tokens_from_response(client.oauth2_refresh_token(data['refresh_token']))
+            for new_data in new_tokens.values():
+                new_data['refresh_token'] = new_data['refresh_token'] or data['refresh_token']
+            refreshed.update(new_tokens)
+
+    return refreshed
+
+
+def refresh_globus_token(app_uuid, ep_uuid, store=None, margin=None, interactive=None):
     """
     Verify that existing Globus token exists and it is still valid, 
     if not creates & saves or refresh & save the globus token. 
     The token is valid for 48h.
+    Tokens are kept in a token store (~/.gdauth/tokens.json by default, see gdauth.tokens)
+    with one entry per collection, a login is needed only for a collection never used before.
+    Tokens expiring within margin seconds are renewed ahead of time with their refresh token,
+    the interactive login is only used when there is no token or the refresh token is rejected.
+    The store is locked while a token is created or renewed, so concurrent gdauth processes
+    wait and reuse the token of the first one.
+
+    Parameters
+    ----------
+    app_uuid    : Globus App / Client UUID
+    ep_uuid     : Collection UUID
+    store       : TokenStore, default is tokens.get_token_store()
+    margin      : Renew tokens expiring within margin seconds, default is tokens.REFRESH_MARGIN
+    interactive : If False raise RuntimeError instead of starting an interactive login, default is INTERACTIVE_LOGIN
+
+    Returns
+    -------
+    dictionary : {resource server : {'access_token', 'refresh_token', 'expires_at_seconds', ...}}
+    """
+
+    store  = store or tokens.get_token_store()
+    margin = tokens.REFRESH_MARGIN if margin is None else margin
+    interactive = INTERACTIVE_LOGIN if interactive is None else interactive
+
+    globus_tokens = store.load(app_uuid)
+    if _tokens_valid(globus_tokens, ep_uuid, margin):
+        return globus_tokens
+
+    with store.lock():
+        # another process may have created the token while we were waiting for the lock
+        globus_tokens = store.load(app_uuid) or tokens.import_legacy_token(store, app_uuid)
+        if _tokens_valid(globus_tokens, ep_uuid, margin):
+            return globus_tokens
+
+        if 'transfer.api.globus.org' in globus_tokens and ep_uuid in globus_tokens:
+            try:
+                store.save(app_uuid, _refresh(app_uuid, globus_tokens))
+                globus_tokens = store.load(app_uuid)
+                log.info('Globus tokens renewed')
+            except (globus_sdk.GlobusAPIError, globus_sdk.NetworkError) as e:
+                log.warning('Cannot renew Globus tokens: %s' % e)
+
+        if not _tokens_valid(globus_tokens, ep_uuid):
+            if not interactive:
+                raise RuntimeError('Globus token for %s is missing or expired, run: gdauth login --ep-uuid %s' % (ep_uuid, ep_uuid))
+            if not globus_tokens:
+                log.error('Globus token is missing. Creating one')
+            store.save(app_uuid, _login(app_uuid, [ep_uuid]))
+            globus_tokens = store.load(app_uuid)
+
+    return globus_tokens
+
+
+def login(app_uuid, ep_uuids, store=None, groups=False):
+    """
+    Interactive Globus login requesting the HTTPS scopes of several collections in one consent.
+    The collection tokens are added to the token store next to the ones already there, so
+    switching among these collections never requires a new login.
+
+    Parameters
+    ----------
+    app_uuid : Globus App / Client UUID
+    ep_uuids : List of Collection UUIDs
+    store    : TokenStore, default is tokens.get_token_store()
+    groups   : Also request a Groups API token, needed to create groups and add their members
+
+    Returns
+    -------
+    dictionary : {resource server : token data}
+    """
+
+    store = store or tokens.get_token_store()
+    with store.lock():
+        store.save(app_uuid, _login(app_uuid, ep_uuids, groups))
+
+    return store.load(app_uuid)
+
+
+def has_token(app_uuid, ep_uuid, store=None):
+    """
+    Check if the token store holds a token for a collection, no login or network access
 
     Parameters
     ----------
     app_uuid : Globus App / Client UUID
     ep_uuid  : Collection UUID
+    store    : TokenStore, default is tokens.get_token_store()
 
     Returns
     -------
-    ac, tc tokens : string
+    Boolean : True if the collection token is saved
     """
 
-    globus_token_file=os.path.join(str(pathlib.Path.home()), 'token.npy')
+    store = store or tokens.get_token_store()
 
-    try:
-        token_response = np.load(globus_token_file, allow_pickle='TRUE').item()
-    except FileNotFoundError:
-        log.error('Globus token is missing. Creating one')
-        # Creating new token
-        # --------------------------------------------
-        client = globus_sdk.NativeAppAuthClient(app_uuid)
-        client.oauth2_start_flow(requested_scopes=[TransferScopes.all, "https://auth.globus.org/scopes/" + ep_uuid + "/https"], refresh_tokens=True)
-
-        log.error('Please go to this URL and login:')
-        log.warning('{0}'.format(client.oauth2_get_authorize_url()))
-
-        get_input = getattr(__builtins__, 'raw_input', input)
-        auth_code = get_input('Please enter the code you get after login here: ').strip() # pythn 3
-        # auth_code = raw_input('Please enter the code you get after login here: ').strip() # python 2.7
-        token_response = client.oauth2_exchange_code_for_tokens(auth_code)
-        # --------------------------------------------
-        np.save(globus_token_file, token_response) 
-
-    # let's get stuff for the Globus Transfer service
-    globus_transfer_data = token_response.by_resource_server['transfer.api.globus.org']
-    # the refresh token and access token, often abbr. as RT and AT
-    transfer_rt = globus_transfer_data['refresh_token']
-    transfer_at = globus_transfer_data['access_token']
-    expires_at_s = globus_transfer_data['expires_at_seconds']
-
-    globus_token_life = expires_at_s - time.time()
-    if (globus_token_life < 0):
-        # Creating new token
-        # --------------------------------------------
-        globus_app_id = app_uuid
-        client = globus_sdk.NativeAppAuthClient(globus_app_id)
-        client.oauth2_start_flow(refresh_tokens=True)
-
-        log.error('Please go to this URL and login:')
-        log.warning('{0}'.format(client.oauth2_get_authorize_url()))
-
-        get_input = getattr(__builtins__, 'raw_input', input)
-        auth_code = get_input('Please enter the code you get after login here: ').strip()
-        token_response = client.oauth2_exchange_code_for_tokens(auth_code)
-        # --------------------------------------------
-        np.save(globus_token_file, token_response) 
-
-    return token_response
+    return ep_uuid in store.load(app_uuid)
+
+
+class GlobusSession(object):
+    """
+    Globus token, authorizer, authorize and transfer clients for one App / Collection pair.
+    The token is loaded and the clients are created once and reused for the life of the session.
+    Tokens renewed by the authorizer are saved in the token store. With background_refresh a
+    daemon thread renews the tokens margin seconds before they expire. The requests of both
+    clients go through gdauth.scheduler: rate limited per API and retried on transient errors,
+    and share the keep-alive connections of gdauth.pool with all the other sessions.
+
+    Parameters
+    ----------
+    app_uuid           : Globus App / Client UUID
+    ep_uuid            : Collection UUID
+    background_refresh : Renew the tokens on a background thread, default is tokens.BACKGROUND_REFRESH
+    """
+
+    def __init__(self, app_uuid, ep_uuid, background_refresh=None):
+
+        self.app_uuid = app_uuid
+        self.ep_uuid  = ep_uuid
+
+        with metrics.timer('token load'):
+            globus_tokens = refresh_globus_token(app_uuid, ep_uuid)
+
+        log.warning('wget token: %s' % globus_tokens[ep_uuid]['access_token'])
+        # let's get stuff for the Globus Transfer service
+        globus_transfer_data = globus_tokens['transfer.api.globus.org']
+        # the refresh token and access token, often abbr. as RT and AT
+        transfer_rt = globus_transfer_data['refresh_token']
+        transfer_at = globus_transfer_data['access_token']
+        expires_at_s = globus_transfer_data['expires_at_seconds']
+
+        globus_token_life = expires_at_s - time.time()
+        log.info("Globus access token will expire in %2.2f hours", (globus_token_life/3600))
+
+        with metrics.timer('client setup'):
+            client = pool.attach(globus_sdk.NativeAppAuthClient(app_uuid))
+            client.oauth2_start_flow(requested_scopes=[TransferScopes.all, "https://auth.globus.org/scopes/" + ep_uuid + "/https"], refresh_tokens=True)
+            self.auth_client = client
+
+            # Now we've got the data we need we set the authorizer
+            self.tokens = globus_tokens
+            self.authorizer = globus_sdk.RefreshTokenAuthorizer(transfer_rt, client, access_token=transfer_at, expires_at=expires_at_s,
+                                                                on_refresh=self._save_refreshed)
+
+            self.ac = self._schedule(pool.attach(globus_sdk.AuthClient(authorizer=self.authorizer)), 'auth')
+            self.tc = self._schedule(pool.attach(globus_sdk.TransferClient(authorizer=self.authorizer)), 'transfer')
+
+        self._gc = None
+        self._gc_lock = threading.Lock()
+        self.refresher = None
+        if tokens.BACKGROUND_REFRESH if background_refresh is None else background_refresh:
+            self.start_refresher()
+
+    def _schedule(self, client, api):
+        """
+        Send all the requests of client, including the paginated ones, through scheduler.call.
+        The globus_sdk retries are disabled so that retries follow the rate limit and the command deadline;
+        a 401 response is retried once after the authorizer renews the token. Each request is recorded by gdauth.metrics.
+        """
+        if hasattr(client, 'retry_config'):
+            client.retry_config.max_retries = 0
+        else:
+            client.transport.max_retries = 0
+        send = client.request
+
+        def request(method, path, *args, **kwargs):
+            if not metrics.ENABLED:
+                return send(method, path, *args, **kwargs)
+            with metrics.timer(metrics.operation_name(api, method, path)) as t:
+                response = send(method, path, *args, **kwargs)
+                t.nbytes = int(response.headers.get('Content-Length') or len(getattr(response, 'binary_content', b'')))
+            return response
+
+        def scheduled_request(*args, **kwargs):
+            try:
+                return scheduler.call(api, request, *args, **kwargs)
+            except globus_sdk.GlobusAPIError as e:
+                if e.http_status != 401 or not client.authorizer.handle_missing_authorization():
+                    raise
+            return scheduler.call(api, request, *args, **kwargs)
+
+        client.request = scheduled_request
+        return client
+
+    @property
+    def gc(self):
+        """
+        Groups client, created on first use from the Groups token saved by gdauth login --groups
+        """
+        with self._gc_lock:
+            if self._gc is None:
+                data = self.tokens.get(GROUPS_RESOURCE_SERVER)
+                if data is None:
+                    raise RuntimeError('No Globus Groups token, run: gdauth login --groups')
+                authorizer = globus_sdk.RefreshTokenAuthorizer(data['refresh_token'], self.auth_client, access_token=data['access_token'],
+                                                               expires_at=data['expires_at_seconds'], on_refresh=self._save_refreshed)
+                self._gc = self._schedule(pool.attach(globus_sdk.GroupsClient(authorizer=authorizer)), 'groups')
+            return self._gc
+
+    def _save_refreshed(self, token_response):
+        """
+        Save the tokens renewed by the authorizer so that other processes reuse them
+        """
+        refreshed = tokens.tokens_from_response(token_response)
+        for resource_server, data in refreshed.items():
+            data['refresh_token'] = data['refresh_token'] or self.tokens.get(resource_server, {}).get('refresh_token')
+        tokens.get_token_store().save(self.app_uuid, refreshed)
+        self.tokens = dict(self.tokens, **refreshed)
+
+    def refresh_tokens(self, margin=None):
+        """
+        Renew the tokens expiring within margin seconds and update the authorizer, never asks for an interactive login
+
+        Parameters
+        ----------
+        margin : Renew tokens expiring within margin seconds, default is tokens.REFRESH_MARGIN
+        """
+
+        self.tokens = refresh_globus_token(self.app_uuid, self.ep_uuid, margin=margin, interactive=False)
+        globus_transfer_data = self.tokens['transfer.api.globus.org']
+        if globus_transfer_data['access_token'] != self.authorizer.access_token:
+            self.authorizer.access_token = globus_transfer_data['access_token']
+            self.authorizer.expires_at   = globus_transfer_data['expires_at_seconds']
+
+    def start_refresher(self, margin=None):
+        """
+        Start a daemon thread renewing the tokens margin seconds before they expire
+
+        Parameters
+        ----------
+        margin : Renew tokens expiring within margin seconds, default is tokens.REFRESH_MARGIN
+        """
+
+        margin = tokens.REFRESH_MARGIN if margin is None else margin
+        if self.refresher is not None:
+            return
+        self.refresher_stop = threading.Event()
+
+        def run():
+            while True:
+                expires_at = min(self.tokens[rs]['expires_at_seconds'] for rs in ('transfer.api.globus.org', self.ep_uuid))
+                if self.refresher_stop.wait(max(60, expires_at - margin - time.time())):
+                    return
+                try:
+                    self.refresh_tokens(margin)
+                except Exception as e:
+                    log.error('Background token refresh failed: %s' % e)
+
+        self.refresher = threading.Thread(target=run, name='gdauth-token-refresh', daemon=True)
+        self.refresher.start()
+
+    def stop_refresher(self):
+        """
+        Stop the token refresh thread
+        """
+
+        if self.refresher is not None:
+            self.refresher_stop.set()
+            self.refresher.join()
+            self.refresher = None
+
+
+_sessions      = {}
+_sessions_lock = threading.Lock()
+
+
+def get_session(app_uuid, ep_uuid):
+    """
+    Return the GlobusSession for an App / Collection pair, create it on first use
+
+    Parameters
+    ----------
+    app_uuid : Globus App / Client UUID
+    ep_uuid  : Collection UUID
+
+    Returns
+    -------
+    GlobusSession : session shared by all calls for this App / Collection pair
+    """
+
+    with _sessions_lock:
+        key = (app_uuid, ep_uuid)
+        if key not in _sessions:
+            _sessions[key] = GlobusSession(app_uuid, ep_uuid)
+        return _sessions[key]
 
 
 def create_clients(app_uuid, ep_uuid):
@@ -101,37 +446,49 @@ def create_clients(app_uuid, ep_uuid):
     -------
     ac : Authorize client
     tc : Transfer client
-      
+
     """
 
-    token_response = refresh_globus_token(app_uuid, ep_uuid)
+    session = GlobusSession(app_uuid, ep_uuid)
 
-    log.warning('wget token: %s' % token_response.by_resource_server[ep_uuid]['access_token'])
-    # let's get stuff for the Globus Transfer service
-    globus_transfer_data = token_response.by_resource_server['transfer.api.globus.org']
-    # the refresh token and access token, often abbr. as RT and AT
-    transfer_rt = globus_transfer_data['refresh_token']
-    transfer_at = globus_transfer_data['access_token']
-    expires_at_s = globus_transfer_data['expires_at_seconds']
+    return session.ac, session.tc
 
-    globus_token_life = expires_at_s - time.time()
-    log.info("Globus access token will expire in %2.2f hours", (globus_token_life/3600))
 
-    client = globus_sdk.NativeAppAuthClient(app_uuid)
-    client.oauth2_start_flow(requested_scopes=[TransferScopes.all, "https://auth.globus.org/scopes/" + ep_uuid + "/https"], refresh_tokens=True)
+def _mkdir(tc, ep_uuid, directory):
+    """
+    Create one directory, return (status, error), status is created, exists or error
+    """
 
-    # Now we've got the data we need we set the authorizer
-    authorizer = globus_sdk.RefreshTokenAuthorizer(transfer_rt, client, access_token=transfer_at, expires_at=expires_at_s)
+    try:
+        tc.operation_mkdir(ep_uuid, path=str(directory).rstrip('/') + '/')
+        listing.invalidate(ep_uuid, directory)
+        status = 'created'
+    except globus_sdk.TransferAPIError as e:
+        # e.g. ExternalError.MkdirFailed.Exists
+        if not e.code.endswith('Exists'):
+            return 'error', f"{e.code} - {e.message}"
+        status = 'exists'
+    _dir_cache.set(ep_uuid + ':' + str(directory).rstrip('/'), True)
 
-    ac = globus_sdk.AuthClient(authorizer=authorizer)
-    tc = globus_sdk.TransferClient(authorizer=authorizer)
+    return status, None
 
-    return ac, tc
+
+def _parents(directory):
+    """
+    Ancestors of directory, nearest first: a/b/c -> a/b, a
+    """
+
+    directory = directory.rstrip('/')
+    while '/' in directory.lstrip('/'):
+        directory = directory.rsplit('/', 1)[0]
+        yield directory
 
 
 def create_dir(directory, # Directory to be created in the share
                app_uuid,  # Globus App / Client UUID
-               ep_uuid):  # Collection UUID
+               ep_uuid,   # Collection UUID
+               session=None,   # GlobusSession to reuse
+               parents=False): # Also create the missing parent directories
     """
     Create directory
 
@@ -140,49 +497,154 @@ def create_dir(directory, # Directory to be created in the share
     directory : Directory to be created in the share
     app_uuid  : Globus App / Client UUID
     ep_uuid   : Collection UUID
+    session   : GlobusSession to reuse, default is the shared session for app_uuid / ep_uuid
+    parents   : Also create the missing parent directories, see create_dirs
 
     Returns
     -------
-    Boolean : True if directory is created
-      
+    Boolean : True if directory is created or already exists
+
     """
 
+    if parents:
+        status = create_dirs([directory], app_uuid, ep_uuid, session=session)
+        # the collection root is not a target of create_dirs, it always exists
+        return status.get(str(directory).rstrip('/'), 'exists') in ('created', 'exists', 'cached')
+
     dir_path = str(directory) + '/'
-    ac, tc = create_clients(app_uuid, ep_uuid)
-    try:
-        response = tc.operation_mkdir(ep_uuid, path=dir_path)
-        log.info('*** Created folder: %s' % dir_path)
-        log.warning(create_folder_link(directory, app_uuid, ep_uuid))
-        return True
-    except globus_sdk.TransferAPIError as e:
-        log.warning(f"Transfer API Error: {e.code} - {e.message}")
-        log.warning(create_folder_link(directory, app_uuid, ep_uuid))
-        # log.error(f"Details: {e.raw_text}")
-        return True
-    except:
-        log.error('*** Unknow error')
+    tc = (session or get_session(app_uuid, ep_uuid)).tc
+    status, error = _mkdir(tc, ep_uuid, directory)
+    _dir_cache.save()
+    if status == 'error':
+        log.error(f"Transfer API Error: {error}")
         return False
+    if status == 'created':
+        log.info('*** Created folder: %s' % dir_path)
+    else:
+        log.warning('*** Folder %s already exists' % dir_path)
+    log.warning(create_folder_link(directory, app_uuid, ep_uuid))
+
+    return True
+
+
+def create_dirs(directories,     # Directories to be created in the share
+                app_uuid,        # Globus App / Client UUID
+                ep_uuid,         # Collection UUID
+                parents=True,    # Also create the missing parent directories
+                workers=8,       # Number of directories created concurrently
+                use_cache=True,  # Skip the parents known to exist
+                session=None,    # GlobusSession to reuse
+                journal=None):   # Journal recording the directories done
+    """
+    Create many directories, like mkdir -p. Shared parents are created once, one tree level at a time,
+    and the directories of a level are created concurrently on a pool of *workers* threads.
+    Directories created or found existing are remembered for DIR_TTL seconds in ~/.gdauth/dirs.json
+    and the parents remembered are skipped by the next runs. The directories asked for are always
+    created, so one deleted outside gdauth is created again. The children of a directory that cannot
+    be created are skipped.
 
+    Parameters
+    ----------
+    directories : Directories to be created in the share
+    app_uuid    : Globus App / Client UUID
+    ep_uuid     : Collection UUID
+    parents     : Also create the missing parent directories
+    workers     : Number of directories created concurrently
+    use_cache   : Skip the parents known to exist, with False every parent is created
+    session     : GlobusSession to reuse, default is the shared session for app_uuid / ep_uuid
+    journal     : gdauth.journal.Journal recording the status of each directory, the directories it
+                  records as done are skipped like the cached ones
+
+    Returns
+    -------
+    dictionary : {directory : status}, status is one of created, exists, cached, skipped, error
+    """
 
-def check_folder_exists(directory, app_uuid, ep_uuid):
+    tc = (session or get_session(app_uuid, ep_uuid)).tc
+    targets = set(str(d).rstrip('/') for d in directories if str(d).strip('/'))
+    # a mkdir of a directory that exists is answered with Exists, only the parents are skipped from the cache
+    leaves = set(targets)
+    if parents:
+        targets.update(p for d in list(targets) for p in _parents(d))
+    levels = {}
+    for d in targets:
+        levels.setdefault(d.lstrip('/').count('/'), []).append(d)
+
+    status = {}
+    stale = []
+    with Executor(max_workers=workers) as pool:
+        for depth in sorted(levels):
+            todo = []
+            for d in sorted(levels[depth]):
+                parent = next(_parents(d), None)
+                if status.get(parent) in ('error', 'skipped'):
+                    status[d] = 'skipped'
+                elif use_cache and d not in leaves and _dir_cache.get(ep_uuid + ':' + d) is True:
+                    status[d] = 'cached'
+                elif journal is not None and journal.done('mkdir', d):
+                    status[d] = 'cached'
+                else:
+                    todo.append(d)
+            for d, (result, error) in zip(todo, pool.map(lambda d: _mkdir(tc, ep_uuid, d), todo)):
+                status[d] = result
+                if journal is not None:
+                    journal.record(('mkdir', d), result, error)
+                if error is None:
+                    continue
+                log.error(f"Transfer API Error on {d}: {error}")
+                if 'NotFound' in error and status.get(next(_parents(d), None)) == 'cached':
+                    stale.append(d)
+    _dir_cache.save()
+
+    if stale:
+        # a parent deleted since it was cached: forget the cached parents and create them again
+        log.warning('%d cached parent folders no longer exist, creating them again' % len(stale))
+        for d in stale:
+            for p in _parents(d):
+                _dir_cache.invalidate(ep_uuid + ':' + p)
+        retry = create_dirs(stale, app_uuid, ep_uuid, parents=True, workers=workers, use_cache=False, session=session, journal=journal)
+        status.update((d, s) for d, s in retry.items() if d in status)
+
+    summary = {}
+    for value in status.values():
+        summary[value] = summary.get(value, 0) + 1
+    log.info('*** Create folders: %s' % (', '.join('%s %d' % (k, v) for k, v in sorted(summary.items())) or 'nothing to do'))
+
+    return status
+
+
+def check_folder_exists(directory, app_uuid, ep_uuid, session=None, use_cache=True):
     """
-    Check if directory exists
-    
+    Check if directory exists. The check is answered from the cached listing of the directory or of
+    its parent when there is one, otherwise the first page of the directory listing is requested
+    and, when it holds the whole directory, cached for the next iter_items.
+
     Parameters
     ----------
     directory : Directory to be created in the share
     app_uuid  : Globus App / Client UUID
     ep_uuid   : Collection UUID
+    session   : GlobusSession to reuse, default is the shared session for app_uuid / ep_uuid
+    use_cache : Answer from the cached listings
 
     Returns
     -------
-    Boolean : True if directory exists  
+    Boolean : True if directory exists
     """
 
-    ac, tc = create_clients(app_uuid, ep_uuid)
+    if use_cache:
+        exists = listing.exists(ep_uuid, directory)
+        if exists is not None:
+            return exists
+
+    tc = (session or get_session(app_uuid, ep_uuid)).tc
 
     try:
-        tc.operation_ls(ep_uuid, path=directory)
+        response = tc.operation_ls(ep_uuid, path=directory, limit=LS_PAGE_SIZE)
+        data = response['DATA']
+        # a full page is the whole directory when its total says so
+        if len(data) < LS_PAGE_SIZE or response.get('total') == len(data):
+            listing.set(ep_uuid, directory, [_item(entry) for entry in data])
         return True
     except globus_sdk.TransferAPIError as e:
         if e.code == 'ClientError.NotFound':
@@ -191,46 +653,108 @@ def check_folder_exists(directory, app_uuid, ep_uuid):
             raise e
 
 
-def get_user_id(email, app_uuid, ep_uuid):
+def get_user_id(email, app_uuid, ep_uuid, session=None):
     """
     Get user id from user email
-    
+
     Parameters
     ----------
     email    : User email address
     app_uuid : Globus App / Client UUID
     ep_uuid  : Collection UUID
+    session  : GlobusSession to reuse, default is the shared session for app_uuid / ep_uuid
 
     Returns
     -------
     string : User ID
-      
+
+    """
+
+    return get_user_ids([email], app_uuid, ep_uuid, session=session)[email]
+
+
+def _get_identities(ac, emails):
     """
+    Resolve one batch of emails with a single get_identities request
 
-    ac, tc = create_clients(app_uuid, ep_uuid)
+    Returns
+    -------
+    dictionary : {email : user id or None}
+    """
 
-    
     try:
-        r = ac.get_identities(usernames=email, provision=True)
-        user_id = r['identities'][0]['id']
-        return user_id
+        r = ac.get_identities(usernames=emails, provision=True)
     except globus_sdk.AuthAPIError as e:
+        if len(emails) > 1:
+            # isolate the email that makes the whole batch fail
+            user_ids = {}
+            for email in emails:
+                user_ids.update(_get_identities(ac, [email]))
+            return user_ids
         if e.code == 'MISSING_PARAMETERS':
             log.error(f"Authorization API Error: {e.code} - {e.message}")
-            return None
+            return {emails[0]: None}
         else:
             raise e
 
+    identities = r['identities']
+    if len(emails) == 1 and len(identities) == 1:
+        return {emails[0]: identities[0]['id']}
+    by_username = {identity['username'].lower(): identity['id'] for identity in identities}
+
+    return {email: by_username.get(email.lower()) for email in emails}
+
+
+def get_user_ids(emails, app_uuid, ep_uuid, session=None, batch_size=IDENTITY_BATCH_SIZE):
+    """
+    Get the user ids of many user emails. Emails are first looked up in the identity cache (~/.gdauth/identities.json),
+    the others are resolved with one get_identities request per batch_size emails. Results, including emails
+    without identity, are saved in the cache.
+
+    Parameters
+    ----------
+    emails     : List of user email addresses
+    app_uuid   : Globus App / Client UUID
+    ep_uuid    : Collection UUID
+    session    : GlobusSession to reuse, default is the shared session for app_uuid / ep_uuid
+    batch_size : Number of emails per get_identities request
+
+    Returns
+    -------
+    dictionary : {email : user id or None}
+    """
+
+    user_ids = {}
+    missing  = []
+    for email in dict.fromkeys(emails):
+        user_id = _identity_cache.get(email.lower())
+        if user_id is cache.MISSING:
+            missing.append(email)
+        else:
+            user_ids[email] = user_id
+
+    if missing:
+        ac = (session or get_session(app_uuid, ep_uuid)).ac
+        for i in range(0, len(missing), batch_size):
+            batch = _get_identities(ac, missing[i:i + batch_size])
+            for email, user_id in batch.items():
+                _identity_cache.set(email.lower(), user_id, ttl=None if user_id else IDENTITY_NEGATIVE_TTL)
+            user_ids.update(batch)
+        _identity_cache.save()
+
+    return user_ids
+
 def share(directory,       # Name of the directory to share
           email,           # Email address to share the Globus directory with
           app_uuid,        # Globus App / Client UUID
           ep_uuid,         # Collection UUID
-          message=''       # Custom message to include to the email
-          ):         
+          message='',      # Custom message to include to the email
+          session=None     # GlobusSession to reuse
+          ):
     """
     Share an existing globus directory with a Globus user. The user receives an email with the link to the folder.
     To add a custom message to the email edit the "notify message" field below
- 
+
     Parameters
     ----------
     directory : Name of the directory to share
@@ -238,41 +762,33 @@ def share(directory,       # Name of the directory to share
     app_uuid  : Globus App / Client UUID
     ep_uuid   : Collection UUID
     message   : Custom message to include to the email
+    session   : GlobusSession to reuse, default is the shared session for app_uuid / ep_uuid
 
     Returns
     -------
     Boolean : True if folder is shared
     """
 
-    if check_folder_exists(directory, app_uuid, ep_uuid):
-        ac, tc = create_clients(app_uuid, ep_uuid)
-        user_id = get_user_id(email, app_uuid, ep_uuid)
+    session = session or get_session(app_uuid, ep_uuid)
+
+    if check_folder_exists(directory, app_uuid, ep_uuid, session=session):
+        tc = session.tc
+        user_id = get_user_id(email, app_uuid, ep_uuid, session=session)
         if user_id != None:
-            dir_path = '/' + str(directory) + '/'
-            # Set access control and notify user
-            rule_data = {
-              'DATA_TYPE': 'access',
-              'principal_type': 'identity',
-              'principal': user_id,
-              'path': dir_path,
-              'permissions': 'r',
-              'notify_email': email,
-              'notify_message': message
-            }
-
-            try: 
-                response = tc.add_endpoint_acl_rule(ep_uuid, rule_data)
+            dir_path = acl.normalize_path(directory)
+            # Set access control and notify user, the access rule index answers for the rules already there
+            index = acl.get_acl_index(tc, ep_uuid)
+            status, error = acl.add_rule(tc, index, ep_uuid, directory, user_id, email=email, message=message)
+            if status == 'error':
+                log.error(f"Transfer API Error: {error}")
+                return False
+            index.save()
+            if status == 'shared':
                 log.info('*** Path %s has been shared with %s' % (dir_path, email))
-                log.warning(create_folder_link(directory, app_uuid, ep_uuid))
-                return True
-            except globus_sdk.TransferAPIError as e:
-                if (e.code == 'Exists'):
-                    log.error(f"Transfer API Error: {e.code} - {e.message}")
-                    log.warning(create_folder_link(directory, app_uuid, ep_uuid))
-                    return True
-                else:
-                    log.error(f"Transfer API Error: {e.code} - {e.message}")
-                    return False
+            else:
+                log.info('*** Path %s is already shared with %s' % (dir_path, email))
+            log.warning(create_folder_link(directory, app_uuid, ep_uuid))
+            return True
         else:
             log.error('Invalid user id')
     else:
@@ -280,34 +796,157 @@ def share(directory,       # Name of the directory to share
         log.error('Create: %s' % directory)
 
 
-def find_endpoints(app_uuid, ep_uuid):
+def _search_endpoints(tc, filter_scope):
+    """
+    All pages of one endpoint search as {endpoint id : display name}
+    """
+
+    endpoints = {}
+    for ep in tc.paginated.endpoint_search(filter_scope=filter_scope).items():
+        endpoints[ep['id']] = ep['display_name']
+        _cache_endpoint_info(ep)
+
+    return endpoints
+
+
+def cached_endpoints(app_uuid):
     """
-    Find all end points
+    Endpoints saved in the endpoint index, no network access
+
+    Parameters
+    ----------
+    app_uuid,        # Globus App / Client UUID
+
+    Returns
+    -------
+    dictionaries : as find_endpoints, None if the endpoint index is missing or expired
+    """
+
+    found = [_endpoint_index.get(app_uuid + ':' + scope) for scope in ENDPOINT_SCOPES]
+    if cache.MISSING in found:
+        return None
+
+    return tuple(found)
+
+
+def find_endpoints(app_uuid, ep_uuid, session=None, use_cache=True):
+    """
+    Find all end points. The my-endpoints, shared-with-me and shared-by-me searches run concurrently
+    and their results are kept in the endpoint index (~/.gdauth/endpoint_index.json) for ENDPOINT_INDEX_TTL seconds.
+    Endpoints are keyed by id so that endpoints sharing the same display name are all listed.
+
+    Parameters
+    ----------
+    app_uuid,        # Globus App / Client UUID
+    ep_uuid,         # Collection UUID
+    session,         # GlobusSession to reuse
+    use_cache,       # Return the endpoint index when it is still valid
+
+    Returns
+    -------
+    dictionaries : my endpoints, endpoints shared with me, endpoints shared by me as {endpoint id : endpoint name}
+    """
+
+    if use_cache:
+        found = cached_endpoints(app_uuid)
+        if found is not None:
+            return found
+
+    tc = (session or get_session(app_uuid, ep_uuid)).tc
+    with Executor(max_workers=len(ENDPOINT_SCOPES)) as pool:
+        found = list(pool.map(lambda scope: _search_endpoints(tc, scope), ENDPOINT_SCOPES))
+    for scope, endpoints in zip(ENDPOINT_SCOPES, found):
+        _endpoint_index.set(app_uuid + ':' + scope, endpoints)
+    _endpoint_index.save()
+    _endpoint_cache.save()
+
+    return tuple(found)
+
+
+def refresh_endpoints(app_uuid, ep_uuid, session=None):
+    """
+    Refresh the endpoint index on a background thread
 
     Parameters
     ----------
     app_uuid,        # Globus App / Client UUID
     ep_uuid,         # Collection UUID
+    session,         # GlobusSession to reuse
+
+    Returns
+    -------
+    threading.Thread : thread running the endpoint searches
+    """
+
+    session = session or get_session(app_uuid, ep_uuid)
+
+    def run():
+        try:
+            find_endpoints(app_uuid, ep_uuid, session=session, use_cache=False)
+        except globus_sdk.GlobusAPIError as e:
+            log.error(f"Transfer API Error: {e.code} - {e.message}")
+
+    thread = threading.Thread(target=run, name='gdauth-endpoint-index')
+    thread.start()
+
+    return thread
+
+
+def _cache_endpoint_info(ep):
+    """
+    Save display name and HTTPS base URL of an endpoint document in the endpoint cache
+    """
+
+    if ep.get('tlsftp_server'):
+        https_server = 'https://' + ep['tlsftp_server'][9:-4]
+    elif ep.get('https_server'):
+        https_server = ep['https_server']
+    else:
+        return None
+    info = {'display_name': ep['display_name'], 'https_server': https_server}
+    _endpoint_cache.set(ep['id'], info)
+
+    return info
+
+
+def get_endpoint_info(app_uuid, ep_uuid, session=None):
+    """
+    Get display name and HTTPS base URL of a collection. The values are kept in the endpoint
+    cache (~/.gdauth/endpoints.json) for ENDPOINT_TTL seconds so get_endpoint is called only on a cache miss
+
+    Parameters
+    ----------
+    app_uuid  : Globus App / Client UUID
+    ep_uuid   : Collection UUID
+    session   : GlobusSession to reuse, default is the shared session for app_uuid / ep_uuid
 
     Returns
     -------
-    dictionary : {endpoint name : endpoint id}
+    dictionary : {'display_name' : collection name, 'https_server' : https://host of the collection}
     """
 
-    ac, tc = create_clients(app_uuid, ep_uuid)
-    
-    my_endpoints ={}
-    endpoints_shared_with_me = {}
-    endpoints_shared_by_me = {}
+    info = _endpoint_cache.get(ep_uuid)
+    if info is cache.MISSING:
+        tc = (session or get_session(app_uuid, ep_uuid)).tc
+        info = _cache_endpoint_info(tc.get_endpoint(ep_uuid))
+        if info is None:
+            raise RuntimeError('Collection %s has no HTTPS server' % ep_uuid)
+        _endpoint_cache.save()
 
-    for ep in tc.endpoint_search(filter_scope="my-endpoints"):
-        my_endpoints[ep['display_name']] = ep['id']
-    for ep in tc.endpoint_search(filter_scope="shared-with-me"):
-        endpoints_shared_with_me[ep['display_name']] = ep['id']
-    for ep in tc.endpoint_search(filter_scope="shared-by-me"):
-        endpoints_shared_by_me[ep['display_name']] = ep['id']
+    return info
 
-    return  my_endpoints, endpoints_shared_with_me, endpoints_shared_by_me
+
+def invalidate_endpoint_info(ep_uuid=None):
+    """
+    Remove a collection from the endpoint cache, remove all collections if ep_uuid is None
+
+    Parameters
+    ----------
+    ep_uuid   : Collection UUID
+    """
+
+    _endpoint_cache.invalidate(ep_uuid)
+    _endpoint_cache.save()
 
 
 def create_folder_link(directory, app_uuid, ep_uuid):
@@ -332,7 +971,7 @@ def create_folder_link(directory, app_uuid, ep_uuid):
     return url
 
 
-def create_links(directory, app_uuid, ep_uuid):
+def create_links(directory, app_uuid, ep_uuid, session=None):
     """
     Create the links for all items (folder and files) listed in the endpoint directory
 
@@ -341,6 +980,7 @@ def create_links(directory, app_uuid, ep_uuid):
     directory : Directory to be created in the share
     app_uuid  : Globus App / Client UUID
     ep_uuid   : Collection UUID
+    session   : GlobusSession to reuse, default is the shared session for app_uuid / ep_uuid
 
     Returns
     -------
@@ -350,24 +990,72 @@ def create_links(directory, app_uuid, ep_uuid):
     file_links   = []
     folder_links = []
 
-    ac, tc = create_clients(app_uuid, ep_uuid)
-    files, folders  = find_items(directory, app_uuid, ep_uuid)
+    for link in iter_links(directory, app_uuid, ep_uuid, session=session):
+        if link.kind == 'file':
+            file_links.append(link.url)
+        else:
+            folder_links.append(link.url)
 
-    for file_name in files:
-        file_link = 'https://' + tc.get_endpoint(ep_uuid)['tlsftp_server'][9:-4] + '/' + str(directory) + '/' + file_name
-        file_links.append(file_link)
+    return file_links, folder_links
 
-    for folder in folders:            
-        folder_link = 'https://app.globus.org/file-manager?&origin_id=' + ep_uuid + '&origin_path=' + str(directory) + '/' + folder #+'/&add_identity='+user_id
-        folder_links.append(folder_link)
-        if folder[-4:] == 'zarr':
-            file_link = 'https://' + tc.get_endpoint(ep_uuid)['tlsftp_server'][9:-4] + '/' + str(directory) + '/' + folder
-            file_links.append(file_link)
 
-    return file_links, folder_links
+def iter_links(directory, app_uuid, ep_uuid, session=None):
+    """
+    Generate the links for all items (folder and files) listed in the endpoint directory,
+    links are yielded as the listing pages arrive. A .zarr folder gets both a folder and a file link.
 
+    Parameters
+    ----------
+    directory : Directory to be created in the share
+    app_uuid  : Globus App / Client UUID
+    ep_uuid   : Collection UUID
+    session   : GlobusSession to reuse, default is the shared session for app_uuid / ep_uuid
 
-def find_items(directory, app_uuid, ep_uuid):
+    Yields
+    ------
+    Link : (item, kind, url), kind is 'file' or 'folder'
+    """
+
+    session = session or get_session(app_uuid, ep_uuid)
+
+    try:
+        for item in iter_items(directory, app_uuid, ep_uuid, session=session):
+            yield from item_links(directory, item, app_uuid, ep_uuid, session=session)
+    except globus_sdk.TransferAPIError as e:
+        log.error(f"Transfer API Error: {e.code} - {e.message}")
+
+
+def item_links(directory, item, app_uuid, ep_uuid, session=None):
+    """
+    Create the links of one item listed in the endpoint directory
+
+    Parameters
+    ----------
+    directory : Directory containing the item
+    item      : Item as yielded by iter_items
+    app_uuid  : Globus App / Client UUID
+    ep_uuid   : Collection UUID
+    session   : GlobusSession to reuse, default is the shared session for app_uuid / ep_uuid
+
+    Returns
+    -------
+    list : [Link], a folder link for a folder, a file link for a file, both for a .zarr folder
+    """
+
+    links = []
+    # the items of the collection root have no directory part
+    path = '/'.join(p for p in (str(directory).strip('/'), item.name) if p)
+    if item.type == 'dir':
+        folder_link = 'https://app.globus.org/file-manager?&origin_id=' + ep_uuid + '&origin_path=' + path #+'/&add_identity='+user_id
+        links.append(Link(item, 'folder', folder_link))
+    if item.type == 'file' or item.name[-4:] == 'zarr':
+        https_server = get_endpoint_info(app_uuid, ep_uuid, session=session)['https_server']
+        links.append(Link(item, 'file', https_server + '/' + path))
+
+    return links
+
+
+def find_items(directory, app_uuid, ep_uuid, session=None):
     """
     Find items (file or folders) present in the directory
 
@@ -376,24 +1064,75 @@ def find_items(directory, app_uuid, ep_uuid):
     directory : Directory to be created in the share
     app_uuid  : Globus App / Client UUID
     ep_uuid   : Collection UUID
+    session   : GlobusSession to reuse, default is the shared session for app_uuid / ep_uuid
 
     Returns
     -------
     Lists : [files], [folders]
     """
 
-    ac, tc = create_clients(app_uuid, ep_uuid)
     files   = []
     folders = []
     try:
-        response = tc.operation_ls(ep_uuid, path=directory)
-        for item in response['DATA']:
-            log.info('directory %s contains %s: %s' % (directory, item['type'], item['name']))
-            if item['type'] == 'file':
-                files.append(item['name'])
-            if item['type'] == 'dir':
-                folders.append(item['name'])
+        for item in iter_items(directory, app_uuid, ep_uuid, session=session):
+            if item.type == 'file':
+                files.append(item.name)
+            if item.type == 'dir':
+                folders.append(item.name)
     except globus_sdk.TransferAPIError as e:
         log.error(f"Transfer API Error: {e.code} - {e.message}")
+    log.info('directory %s contains %d files and %d folders' % (directory, len(files), len(folders)))
 
     return files, folders
+
+
+def _item(entry):
+    return Item(entry['name'], entry['type'], entry.get('size'), entry.get('last_modified'))
+
+
+def iter_items(directory, app_uuid, ep_uuid, session=None, page_size=LS_PAGE_SIZE, use_cache=True):
+    """
+    Generate the items (file or folders) present in the directory. The listing is requested
+    page_size entries at a time and the items are yielded as each page arrives, so memory stays flat
+    whatever the size of the directory. A listing that fits in one page is cached and reused for
+    listing.LISTING_TTL seconds, longer listings are not kept.
+
+    Parameters
+    ----------
+    directory : Directory to list
+    app_uuid  : Globus App / Client UUID
+    ep_uuid   : Collection UUID
+    session   : GlobusSession to reuse, default is the shared session for app_uuid / ep_uuid
+    page_size : Number of entries requested per operation_ls call
+    use_cache : Reuse a cached listing, with False the directory is always listed
+
+    Yields
+    ------
+    Item : (name, type, size, last_modified), type is 'file', 'dir' or 'link'
+    """
+
+    if use_cache:
+        cached = listing.get(ep_uuid, directory)
+        if cached is not None:
+            yield from (Item(*item) for item in cached)
+            return
+
+    tc = (session or get_session(app_uuid, ep_uuid)).tc
+    items = []
+    offset = 0
+    while True:
+        response = tc.operation_ls(ep_uuid, path=directory, limit=page_size, offset=offset)
+        data = response['DATA']
+        for entry in data:
+            item = _item(entry)
+            if items is not None:
+                items.append(item)
+            yield item
+        offset += len(data)
+        total = response.get('total')
+        if len(data) < page_size or (total is not None and offset >= total):
+            break
+        # only the listings of one page are cached, the longer ones are streamed
+        items = None
+    if items is not None:
+        listing.set(ep_uuid, directory, items)
@@ -0,0 +1,248 @@
+"""
+Share folders with Globus groups. One group access rule gives a folder to all the members of the
+group, so a folder read by many users needs one rule instead of one rule per user, and a reader
+is added or removed by changing the group membership without touching the access rules.
+
+plan_migration finds the folders whose identity rules can be replaced by group rules: the folders
+with at least min_users identity rules of the same permissions, grouped by their exact set of users
+so that folders with the same readers share one group. migrate creates the groups, or reuses the
+ones created by a previous run, adds the members and verifies them, adds one group rule per folder
+and only then deletes the identity rules of the verified members. A user that cannot be added to
+the group keeps their identity rule, so no reader loses access.
+
+"""
+import hashlib
+import collections
+import globus_sdk
+
+from gdauth.pool import Executor
+
+from gdauth import acl
+from gdauth import log
+from gdauth import globus
+
+
+__author__ = "Francesco De Carlo"
+__copyright__ = "Copyright (c) 2024, UChicago Argonne, LLC."
+__docformat__ = 'restructuredtext en'
+__all__ = ['MigrationGroup',
+           'share',
+           'plan_migration',
+           'migrate',
+           ]
+
+# folders with fewer identity rules of the same permissions are not migrated
+MIGRATE_MIN_USERS = 2
+
+# members added per batch_membership_action request
+MEMBER_BATCH = 100
+
+# prefix of the names of the groups created by migrate
+GROUP_PREFIX = 'gdauth-'
+
+# group to create, members are identity ids, rules are the identity rules of paths it replaces
+MigrationGroup = collections.namedtuple('MigrationGroup', ['name', 'members', 'permissions', 'paths', 'rules'])
+
+
+def share(directory,       # Name of the directory to share
+          group_id,        # Globus group UUID to share the directory with
+          app_uuid,        # Globus App / Client UUID
+          ep_uuid,         # Collection UUID
+          permissions='r', # Permissions given to the group members
+          session=None     # GlobusSession to reuse
+          ):
+    """
+    Share an existing globus directory with all the members of a Globus group. No email is sent,
+    the members find the folder in the Globus web app.
+
+    Parameters
+    ----------
+    directory   : Name of the directory to share
+    group_id    : Globus group UUID to share the directory with
+    app_uuid    : Globus App / Client UUID
+    ep_uuid     : Collection UUID
+    permissions : Permissions given to the group members, r or rw
+    session     : GlobusSession to reuse, default is the shared session for app_uuid / ep_uuid
+
+    Returns
+    -------
+    Boolean : True if folder is shared
+    """
+
+    session = session or globus.get_session(app_uuid, ep_uuid)
+
+    if not globus.check_folder_exists(directory, app_uuid, ep_uuid, session=session):
+        log.error('Directory does not exist')
+        log.error('Create: %s' % directory)
+        return False
+
+    index = acl.get_acl_index(session.tc, ep_uuid)
+    status, error = acl.add_rule(session.tc, index, ep_uuid, directory, group_id, 'group', permissions)
+    index.save()
+    if status == 'error':
+        log.error(f"Transfer API Error: {error}")
+        return False
+    if status == 'exists':
+        log.info('*** Path %s is already shared with group %s' % (acl.normalize_path(directory), group_id))
+    else:
+        log.info('*** Path %s has been shared with group %s' % (acl.normalize_path(directory), group_id))
+    log.warning(globus.create_folder_link(directory, app_uuid, ep_uuid))
+
+    return True
+
+
+def _group_name(ep_uuid, members, permissions):
+    """
+    Name of the group of a set of users: the same users get the same group on every run
+    """
+
+    digest = hashlib.sha1('\n'.join([ep_uuid, permissions] + sorted(members)).encode()).hexdigest()
+
+    return GROUP_PREFIX + digest[:12]
+
+
+def plan_migration(app_uuid, ep_uuid, min_users=MIGRATE_MIN_USERS, session=None):
+    """
+    Find the folders whose identity rules can be replaced by one group rule, from one access rule list
+
+    Parameters
+    ----------
+    app_uuid  : Globus App / Client UUID
+    ep_uuid   : Collection UUID
+    min_users : Only migrate the folders with at least min_users identity rules of the same permissions
+    session   : GlobusSession to reuse, default is the shared session for app_uuid / ep_uuid
+
+    Returns
+    -------
+    list : [MigrationGroup], the groups saving the most rules first
+    """
+
+    session = session or globus.get_session(app_uuid, ep_uuid)
+    index = acl.get_acl_index(session.tc, ep_uuid, True)
+
+    candidates = collections.OrderedDict()
+    for path, rules in sorted(index.by_path().items()):
+        by_permissions = {}
+        for rule in rules:
+            if rule['principal_type'] == 'identity' and rule['id'] is not None:
+                by_permissions.setdefault(rule['permissions'], []).append(rule)
+        for permissions, rules in sorted(by_permissions.items()):
+            if len(rules) < max(1, min_users):
+                continue
+            paths, replaced = candidates.setdefault((frozenset(r['principal'] for r in rules), permissions), ([], []))
+            paths.append(path)
+            replaced.extend(rules)
+
+    groups = [MigrationGroup(_group_name(ep_uuid, members, permissions), sorted(members), permissions, paths, rules)
+              for (members, permissions), (paths, rules) in candidates.items()]
+
+    return sorted(groups, key=lambda g: len(g.paths) - len(g.rules))
+
+
+def _active_members(gc, group_id):
+
+    group = gc.get_group(group_id, include='memberships')
+
+    return set(m['identity_id'] for m in group.get('memberships') or [] if m.get('status') == 'active')
+
+
+def _setup_group(gc, group, group_id, ep_uuid):
+    """
+    Create the group if group_id is None, add the missing members
+
+    Returns
+    -------
+    (group_id, set) : group UUID and identity ids of its active members
+    """
+
+    if group_id is None:
+        group_id = gc.create_group({'name': group.name,
+                                    'description': 'Readers of %d folders of collection %s, created by gdauth migrate' % (len(group.paths), ep_uuid)})['id']
+        log.info('*** Created group %s (%s)' % (group.name, group_id))
+    active = _active_members(gc, group_id)
+    todo = [member for member in group.members if member not in active]
+    for i in range(0, len(todo), MEMBER_BATCH):
+        response = gc.batch_membership_action(group_id, {'add': [{'identity_id': member, 'role': 'member'} for member in todo[i:i + MEMBER_BATCH]]})
+        for error in (response.get('errors') or {}).get('add') or []:
+            log.error('Cannot add %s to group %s: %s' % (error.get('identity_id'), group.name, error.get('detail') or error.get('code')))
+    if todo:
+        # only the memberships the Groups API reports as active give access through the group rule
+        active = _active_members(gc, group_id)
+
+    return group_id, active
+
+
+def migrate(groups, app_uuid, ep_uuid, session=None, workers=8, journal=None):
+    """
+    Replace the identity rules of the planned folders by group rules. The groups are set up first,
+    then each folder gets its group rule and loses the identity rules of the active group members,
+    each step on a pool of *workers* threads. Needs a Groups token: gdauth login --groups.
+
+    Parameters
+    ----------
+    groups   : [MigrationGroup] as returned by plan_migration
+    app_uuid : Globus App / Client UUID
+    ep_uuid  : Collection UUID
+    session  : GlobusSession to reuse, default is the shared session for app_uuid / ep_uuid
+    workers  : Number of concurrent Globus requests
+    journal  : gdauth.journal.Journal recording the status of each folder, the folders it records as done are skipped
+
+    Returns
+    -------
+    list : [{'path', 'group', 'status', 'deleted', 'kept', 'error'}], status is one of
+           migrated, skipped, error; deleted and kept count the identity rules deleted and kept
+    """
+
+    session = session or globus.get_session(app_uuid, ep_uuid)
+    tc, gc = session.tc, session.gc
+    index = acl.get_acl_index(tc, ep_uuid)
+    existing = dict((g['name'], g['id']) for g in gc.get_my_groups() if g['name'].startswith(GROUP_PREFIX))
+
+    def setup(group):
+        try:
+            return _setup_group(gc, group, existing.get(group.name), ep_uuid) + (None,)
+        except globus_sdk.GlobusAPIError as e:
+            return None, set(), f"{e.code} - {e.message}"
+
+    def move(item):
+        group, path, (group_id, active, error) = item
+        result = {'path': path, 'group': group_id, 'status': 'error', 'deleted': 0, 'kept': 0, 'error': error}
+        if journal is not None and journal.done('migrate', path, group.permissions):
+            result['status'] = 'skipped'
+            return result
+        if group_id is not None:
+            status, result['error'] = acl.add_rule(tc, index, ep_uuid, path, group_id, 'group', group.permissions)
+            if status != 'error':
+                result['status'] = 'migrated'
+                for rule in group.rules:
+                    if rule['path'] != path:
+                        continue
+                    if rule['principal'] not in active:
+                        result['kept'] += 1
+                        continue
+                    status, error = acl.delete_rule(tc, index, ep_uuid, rule)
+                    if status == 'error':
+                        result['status'], result['error'] = 'error', error
+                        result['kept'] += 1
+                    else:
+                        result['deleted'] += 1
+        if journal is not None:
+            journal.record(('migrate', path, group.permissions), result['status'], result['error'])
+        return result
+
+    with Executor(max_workers=workers) as pool:
+        setups = list(pool.map(setup, groups))
+        items = [(group, path, s) for group, s in zip(groups, setups) for path in group.paths]
+        results = list(pool.map(move, items))
+    index.save()
+
+    for result in results:
+        if result['error']:
+            log.error('migrate %s: %s' % (result['path'], result['error']))
+    migrated = [r for r in results if r['status'] == 'migrated']
+    log.info('*** Migrate: %d folders migrated, %d skipped, %d errors' % (len(migrated), sum(1 for r in results if r['status'] == 'skipped'),
+                                                                          sum(1 for r in results if r['status'] == 'error')))
+    log.info('*** Access rules: %d identity rules replaced by %d group rules, %d identity rules kept' % (
+             sum(r['deleted'] for r in results), len(migrated), sum(r['kept'] for r in results)))
+
+    return results
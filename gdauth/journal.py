@@ -0,0 +1,226 @@
+"""
+Append-only journal of the items done by a bulk command (create --from-file, share --from-csv, apply, migrate),
+so that an interrupted run can be resumed: with --resume the items recorded as done are skipped and the
+failed ones are tried again. Each line of the journal is one JSON record::
+
+    {"key": ["share", "2025-10/smith", "smith@anl.gov"], "status": "shared", "error": null, "time": 1760000000.0}
+
+Records are queued by the workers and written by a background thread, with one fsync per
+FLUSH_RECORDS records or FLUSH_INTERVAL seconds, so journaling does not slow the worker pool down.
+A crash loses at most the records of the last FLUSH_INTERVAL seconds; those items are done again.
+
+The journals written to JOURNAL_DIR are deleted when every item of the command is done, the others
+are kept for --resume and deleted after JOURNAL_MAX_AGE seconds.
+
+"""
+import os
+import json
+import time
+import threading
+
+from gdauth import log
+from gdauth import cache
+
+
+__author__ = "Francesco De Carlo"
+__copyright__ = "Copyright (c) 2024, UChicago Argonne, LLC."
+__docformat__ = 'restructuredtext en'
+__all__ = ['Journal',
+           'DONE',
+           'load',
+           'open_journal',
+           ]
+
+JOURNAL_DIR = os.path.join(cache.CACHE_DIR, 'journals')
+
+# statuses of the items skipped by a resumed run, the items with another status are tried again
+DONE = ('created', 'exists', 'cached', 'shared', 'deleted', 'migrated')
+
+# the queued records are written and synced once FLUSH_RECORDS are queued or every FLUSH_INTERVAL seconds
+FLUSH_RECORDS  = 1000
+FLUSH_INTERVAL = 1.0
+
+# journals of JOURNAL_DIR older than this are deleted when a bulk command starts a new journal
+JOURNAL_MAX_AGE = 30 * 24 * 3600
+
+
+def load(file_name):
+    """
+    Read a journal, a partial last line left by a crash is ignored
+
+    Parameters
+    ----------
+    file_name : Name of the journal
+
+    Returns
+    -------
+    dictionary : {key : status of the last record of key}, key is a tuple
+    """
+
+    status = {}
+    ignored = 0
+    with open(file_name) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+                status[tuple(record['key'])] = record['status']
+            except (ValueError, KeyError, TypeError):
+                ignored += 1
+    if ignored:
+        log.warning('Ignored %d incomplete records of journal %s' % (ignored, file_name))
+
+    return status
+
+
+class Journal(object):
+    """
+    Append-only journal of the status of each item of a bulk command. record can be called by
+    many threads, the records are written and synced in batches by a background thread.
+    Use as a context manager, or call close, so that the last records are written.
+
+    Parameters
+    ----------
+    file_name : Name of the journal, created if missing, records are appended
+    resume    : Read the records already in the journal, done then skips the items recorded as done
+    temporary : Delete the journal on exit when no exception was raised and every recorded item is done
+    """
+
+    def __init__(self, file_name, resume=False, temporary=False):
+        self.file_name = file_name
+        self.status = load(file_name) if resume else {}
+        self.temporary = temporary
+        self.failed = 0
+        os.makedirs(os.path.dirname(os.path.abspath(file_name)), exist_ok=True)
+        self.f = open(file_name, 'a')
+        self.queue = []
+        self.closed = False
+        self.condition = threading.Condition()
+        self.write_lock = threading.Lock()
+        self.thread = threading.Thread(target=self._run, name='gdauth-journal', daemon=True)
+        self.thread.start()
+
+    def done(self, *key):
+        """
+        True if the journal read on resume records key as done
+        """
+        return self.status.get(key) in DONE
+
+    def count_done(self):
+        """
+        Number of items recorded as done in the journal read on resume
+        """
+        return sum(1 for status in self.status.values() if status in DONE)
+
+    def record(self, key, status, error=None):
+        """
+        Queue the status of an item
+
+        Parameters
+        ----------
+        key    : Tuple identifying the item, e.g. ('share', directory, email)
+        status : Status of the item, the items with a status in DONE are skipped by a resumed run
+        error  : Error message
+        """
+        line = json.dumps({'key': list(key), 'status': status, 'error': error, 'time': round(time.time(), 3)}) + '\n'
+        with self.condition:
+            self.queue.append(line)
+            if status not in DONE:
+                self.failed += 1
+            if len(self.queue) >= FLUSH_RECORDS:
+                self.condition.notify()
+
+    def flush(self):
+        """
+        Write and sync the queued records
+        """
+        with self.condition:
+            lines, self.queue = self.queue, []
+        if lines:
+            with self.write_lock:
+                self.f.write(''.join(lines))
+                self.f.flush()
+                os.fsync(self.f.fileno())
+
+    def _run(self):
+        while True:
+            with self.condition:
+                if not self.closed and len(self.queue) < FLUSH_RECORDS:
+                    self.condition.wait(FLUSH_INTERVAL)
+                closed = self.closed
+            self.flush()
+            if closed:
+                return
+
+    def close(self):
+        """
+        Write the last records and close the journal
+        """
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+        self.thread.join()
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        if exc_type is not None:
+            log.warning('Interrupted, resume with --resume %s' % self.file_name)
+        elif self.failed:
+            log.warning('%d items failed, retry them with --resume %s' % (self.failed, self.file_name))
+        elif self.temporary:
+            os.remove(self.file_name)
+            log.debug('Deleted journal %s, all items are done' % self.file_name)
+
+
+def _prune(max_age=JOURNAL_MAX_AGE):
+    """
+    Delete the journals of JOURNAL_DIR older than max_age seconds
+    """
+
+    if not os.path.isdir(JOURNAL_DIR):
+        return
+    oldest = time.time() - max_age
+    for name in os.listdir(JOURNAL_DIR):
+        file_name = os.path.join(JOURNAL_DIR, name)
+        try:
+            if name.endswith('.jsonl') and os.path.getmtime(file_name) < oldest:
+                os.remove(file_name)
+        except OSError:
+            pass
+
+
+def _in_journal_dir(file_name):
+
+    return os.path.dirname(os.path.abspath(file_name)) == os.path.abspath(JOURNAL_DIR)
+
+
+def open_journal(command, journal=None, resume=None):
+    """
+    Open the journal of a bulk command
+
+    Parameters
+    ----------
+    command : Name of the command, used in the default journal name
+    journal : Name of the journal, default is ~/.gdauth/journals/command-date-time.jsonl,
+              deleted when every item is done
+    resume  : Name of the journal of an interrupted run to resume and append to
+
+    Returns
+    -------
+    Journal : journal of the command
+    """
+
+    if resume:
+        if not os.path.exists(resume):
+            raise RuntimeError('Journal %s not found' % resume)
+        j = Journal(resume, resume=True, temporary=_in_journal_dir(resume))
+        log.info('Resuming %s: %d items done' % (resume, j.count_done()))
+        return j
+    _prune()
+    file_name = journal or os.path.join(JOURNAL_DIR, '%s-%s-%d.jsonl' % (command, time.strftime('%Y%m%d-%H%M%S'), os.getpid()))
+    log.info('Journal %s' % file_name)
+
+    return Journal(file_name, temporary=_in_journal_dir(file_name))
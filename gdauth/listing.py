@@ -0,0 +1,134 @@
+import os
+
+from gdauth import acl
+from gdauth import cache
+
+
+__author__ = "Francesco De Carlo"
+__copyright__ = "Copyright (c) 2024, UChicago Argonne, LLC."
+__docformat__ = 'restructuredtext en'
+__all__ = ['LISTING_TTL',
+           'LISTING_CACHE_SIZE',
+           'LISTING_MAX_ITEMS',
+           'configure',
+           'get',
+           'set',
+           'invalidate',
+           'exists',
+           ]
+
+# directory listings are reused for LISTING_TTL seconds, changes made outside gdauth are seen after at most this delay
+LISTING_TTL = 60
+# number of directory listings kept
+LISTING_CACHE_SIZE = 256
+# listings of directories with more items are not cached
+LISTING_MAX_ITEMS = 100000
+
+LISTING_DIR = os.path.join(cache.CACHE_DIR, 'listings')
+
+_cache = cache.LRUCache(LISTING_CACHE_SIZE, LISTING_TTL)
+
+
+def configure(ttl=None, size=None, disk=None):
+    """
+    Set the listing cache options, the cached listings are dropped
+
+    Parameters
+    ----------
+    ttl  : Seconds a listing is reused, 0 disables the cache
+    size : Number of listings kept
+    disk : Also save the listings in ~/.gdauth/listings so that the next commands reuse them
+    """
+
+    global _cache, LISTING_TTL, LISTING_CACHE_SIZE
+    if ttl is not None:
+        LISTING_TTL = ttl
+    if size is not None:
+        LISTING_CACHE_SIZE = size
+    if disk is None:
+        disk = _cache.cache_dir is not None
+    _cache = cache.LRUCache(LISTING_CACHE_SIZE, LISTING_TTL, LISTING_DIR if disk else None)
+
+
+def _key(ep_uuid, directory):
+    return (ep_uuid, acl.normalize_path(directory))
+
+
+def get(ep_uuid, directory):
+    """
+    Return the cached listing of a directory, None if it is not cached
+
+    Parameters
+    ----------
+    ep_uuid   : Collection UUID
+    directory : Directory
+
+    Returns
+    -------
+    list : [(name, type, size, last_modified)]
+    """
+
+    items = _cache.get(_key(ep_uuid, directory))
+
+    return None if items is cache.MISSING else items
+
+
+def set(ep_uuid, directory, items):
+    """
+    Cache the complete listing of a directory
+
+    Parameters
+    ----------
+    ep_uuid   : Collection UUID
+    directory : Directory
+    items     : List of (name, type, size, last_modified)
+    """
+
+    if LISTING_TTL > 0 and len(items) <= LISTING_MAX_ITEMS:
+        _cache.set(_key(ep_uuid, directory), list(items))
+
+
+def invalidate(ep_uuid=None, directory=None):
+    """
+    Drop the listings of a directory and of its parent after a change made by gdauth, drop all listings if ep_uuid is None
+
+    Parameters
+    ----------
+    ep_uuid   : Collection UUID
+    directory : Directory created, deleted or renamed
+    """
+
+    if ep_uuid is None:
+        _cache.invalidate()
+        return
+    path = acl.normalize_path(directory)
+    _cache.invalidate((ep_uuid, path))
+    if path != '/':
+        _cache.invalidate((ep_uuid, path[:-1].rsplit('/', 1)[0] + '/'))
+
+
+def exists(ep_uuid, directory):
+    """
+    Answer a directory existence check from the cached listings
+
+    Parameters
+    ----------
+    ep_uuid   : Collection UUID
+    directory : Directory
+
+    Returns
+    -------
+    Boolean : True or False if the listing of the directory or of its parent is cached, None otherwise
+    """
+
+    path = acl.normalize_path(directory)
+    if get(ep_uuid, path) is not None:
+        return True
+    if path == '/':
+        return None
+    parent, name = path[:-1].rsplit('/', 1)
+    items = get(ep_uuid, parent + '/')
+    if items is None:
+        return None
+
+    return any(item[0] == name and item[1] == 'dir' for item in items)
@@ -0,0 +1,335 @@
+"""
+Declarative provisioning of a collection. A manifest lists the folders that must exist and the
+users and Globus groups that can read each of them::
+
+    collection: b07f6a40-672c-4ae8-b420-83eb6e925381   # optional, default is --ep-uuid
+    root: 2025-10                                       # optional, prefix of all the folders
+    message: Your data are ready                        # optional, notification message
+    prune: false                                        # optional, same as --prune
+    folders:
+      - path: smith
+        readers: [smith@anl.gov, jones@uchicago.edu]
+      - path: smith/raw
+      - path: shared
+        groups: [6e1e3b38-1d4f-11ee-a1ab-0242ac110002]  # Globus group UUIDs, one rule for all the members
+      - doe                                             # a folder without readers
+
+plan compares the manifest with the collection, read in bulk (one listing per parent folder, one
+access rule list and cached identity lookups), and returns the folders to create, the read rules
+to add and, with prune, the identity and group read rules of the manifest folders to delete.
+apply makes these changes concurrently. Manifests are YAML files, read with PyYAML when it is
+installed, or JSON files. A folder migrated to a group by gdauth migrate must list this group
+in the manifest, otherwise apply shares it again with each reader and prune deletes the group rule.
+
+"""
+import json
+import collections
+import globus_sdk
+
+from gdauth.pool import Executor
+
+from gdauth import acl
+from gdauth import log
+from gdauth import globus
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+
+__author__ = "Francesco De Carlo"
+__copyright__ = "Copyright (c) 2024, UChicago Argonne, LLC."
+__docformat__ = 'restructuredtext en'
+__all__ = ['Manifest',
+           'Share',
+           'GroupShare',
+           'Plan',
+           'load',
+           'plan',
+           'apply',
+           ]
+
+# desired state read from a manifest file: folders is {folder : [reader email]}, groups is {folder : [group UUID]}
+Manifest = collections.namedtuple('Manifest', ['collection', 'folders', 'message', 'prune', 'groups'])
+
+# read rule to add: folder, reader email and identity id
+Share = collections.namedtuple('Share', ['path', 'email', 'user_id'])
+
+# group read rule to add: folder and group UUID
+GroupShare = collections.namedtuple('GroupShare', ['path', 'group_id'])
+
+_PARSE_ERRORS = (ValueError, yaml.YAMLError) if yaml is not None else (ValueError,)
+
+
+def _folder(path, root):
+    return '/'.join(p for p in (str(root or '').strip('/'), str(path).strip('/')) if p)
+
+
+def _names(values, key, folder, file_name):
+    """
+    Normalized reader emails or group UUIDs of a folder, a single string is a list of one
+    """
+
+    if isinstance(values, str):
+        values = [values]
+    if not isinstance(values, list) or not all(isinstance(v, str) and v.strip() for v in values):
+        raise ValueError('Manifest %s: %s of folder %s must be a list of strings, not %r' % (file_name, key, folder, values))
+
+    return [v.strip().lower() for v in values]
+
+
+def load(file_name):
+    """
+    Read a manifest file
+
+    Parameters
+    ----------
+    file_name : Name of the YAML or JSON manifest
+
+    Returns
+    -------
+    Manifest : (collection, folders, message, prune, groups), folders is {folder : [reader email]},
+               groups is {folder : [group UUID]}, folders are relative to the collection root
+               without leading or trailing /
+
+    Raises
+    ------
+    RuntimeError : The manifest is missing, cannot be read or parsed, or a folder is invalid
+    ValueError   : The readers or groups of a folder are not strings
+    """
+
+    try:
+        with open(file_name) as f:
+            text = f.read()
+    except OSError as e:
+        raise RuntimeError('Cannot read manifest %s: %s' % (file_name, e.strerror or e))
+    try:
+        data = yaml.safe_load(text) if yaml is not None else json.loads(text)
+    except _PARSE_ERRORS as e:
+        raise RuntimeError('Cannot read manifest %s: %s%s' % (file_name, e, '' if yaml else ' (YAML manifests need PyYAML: pip install pyyaml)'))
+    if not isinstance(data, dict) or not isinstance(data.get('folders'), list):
+        raise RuntimeError('Manifest %s must have a folders list' % file_name)
+
+    folders = collections.OrderedDict()
+    groups = {}
+    for entry in data['folders']:
+        if isinstance(entry, dict):
+            path, readers, group_ids = entry.get('path'), entry.get('readers') or [], entry.get('groups') or []
+        else:
+            path, readers, group_ids = entry, [], []
+        folder = _folder(path or '', data.get('root'))
+        if not folder:
+            raise RuntimeError('Manifest %s: invalid folder %r' % (file_name, entry))
+        emails = folders.setdefault(folder, [])
+        emails.extend(e for e in _names(readers, 'readers', folder, file_name) if e not in emails)
+        ids = groups.setdefault(folder, [])
+        ids.extend(g for g in _names(group_ids, 'groups', folder, file_name) if g not in ids)
+
+    return Manifest(data.get('collection'), folders, data.get('message') or '', bool(data.get('prune', False)), groups)
+
+
+class Plan(object):
+    """
+    Changes making a collection match a manifest
+
+    Parameters
+    ----------
+    mkdirs       : Folders to create, parents first
+    shares       : Share of each read rule to add
+    unshares     : Access rules to delete, as in the acl.AclIndex
+    unknown      : (folder, email) of the readers without Globus identity
+    index        : acl.AclIndex of the collection
+    group_shares : GroupShare of each group read rule to add
+    """
+
+    def __init__(self, mkdirs, shares, unshares, unknown, index, group_shares=()):
+        self.mkdirs = mkdirs
+        self.shares = shares
+        self.unshares = unshares
+        self.unknown = unknown
+        self.index = index
+        self.group_shares = list(group_shares)
+
+    def __len__(self):
+        return len(self.mkdirs) + len(self.shares) + len(self.group_shares) + len(self.unshares)
+
+    def log(self):
+        """
+        Log the changes and their summary
+        """
+        for folder in self.mkdirs:
+            log.info('  + mkdir   /%s/' % folder)
+        for share in self.shares:
+            log.info('  + share   /%s/ %s' % (share.path, share.email))
+        for share in self.group_shares:
+            log.info('  + share   /%s/ group %s' % (share.path, share.group_id))
+        for rule in self.unshares:
+            log.warning('  - unshare %s %s %s' % (rule['path'], rule['principal_type'], rule['principal']))
+        for folder, email in self.unknown:
+            log.error('  ! no Globus identity for %s, /%s/ not shared' % (email, folder))
+        log.info('*** Plan: %d folders to create, %d rules to add, %d rules to delete' % (len(self.mkdirs), len(self.shares) + len(self.group_shares),
+                                                                                            len(self.unshares)))
+
+
+def _ancestors(folder):
+    while '/' in folder:
+        folder = folder.rsplit('/', 1)[0]
+        yield folder
+
+
+def _subfolders(parent, app_uuid, ep_uuid, session):
+    """
+    Names of the folders in parent, None if parent does not exist
+    """
+
+    try:
+        return set(item.name for item in globus.iter_items(parent or '/', app_uuid, ep_uuid, session=session, use_cache=False)
+                   if item.type == 'dir')
+    except globus_sdk.TransferAPIError as e:
+        if e.code == 'ClientError.NotFound':
+            return None
+        raise
+
+
+def _missing_folders(folders, app_uuid, ep_uuid, session, pool):
+    """
+    Folders, and parents of the folders, that do not exist, parents first. The tree is listed one
+    level at a time and only the parents that exist are listed.
+    """
+
+    targets = set(folders)
+    targets.update(p for f in folders for p in _ancestors(f))
+    levels = {}
+    for f in targets:
+        levels.setdefault(f.count('/'), []).append(f)
+
+    missing = set()
+    for depth in sorted(levels):
+        parents = sorted(set(f.rpartition('/')[0] for f in levels[depth]) - missing)
+        listings = dict(zip(parents, pool.map(lambda p: _subfolders(p, app_uuid, ep_uuid, session), parents)))
+        for f in levels[depth]:
+            parent, _, name = f.rpartition('/')
+            if parent in missing or listings[parent] is None or name not in listings[parent]:
+                missing.add(f)
+
+    return sorted(missing, key=lambda f: (f.count('/'), f))
+
+
+def plan(manifest, app_uuid, ep_uuid, prune=None, session=None, workers=8):
+    """
+    Compare a manifest with the collection. The folders are checked from the listings of their parents,
+    the rules from one access rule list and the emails are resolved with cached, batched identity lookups;
+    these reads run concurrently.
+
+    Parameters
+    ----------
+    manifest : Manifest as returned by load
+    app_uuid : Globus App / Client UUID
+    ep_uuid  : Collection UUID
+    prune    : Delete the read rules of the manifest folders given to identities not listed as readers
+               and to groups not listed in groups, default is manifest.prune
+    session  : GlobusSession to reuse, default is the shared session for app_uuid / ep_uuid
+    workers  : Number of concurrent Globus requests
+
+    Returns
+    -------
+    Plan : changes making the collection match the manifest
+    """
+
+    session = session or globus.get_session(app_uuid, ep_uuid)
+    prune = manifest.prune if prune is None else prune
+    emails = list(dict.fromkeys(e for readers in manifest.folders.values() for e in readers))
+
+    with Executor(max_workers=workers) as pool:
+        rules = pool.submit(acl.get_acl_index, session.tc, ep_uuid, True)
+        users = pool.submit(globus.get_user_ids, emails, app_uuid, ep_uuid, session) if emails else None
+        mkdirs = _missing_folders(list(manifest.folders), app_uuid, ep_uuid, session, pool)
+        index = rules.result()
+        user_ids = users.result() if users else {}
+
+    shares, group_shares, unknown, unshares = [], [], [], []
+    by_path = index.by_path() if prune else {}
+    for folder, readers in manifest.folders.items():
+        for email in readers:
+            if user_ids.get(email) is None:
+                unknown.append((folder, email))
+            elif not index.contains(user_ids[email], '/' + folder + '/', 'r'):
+                shares.append(Share(folder, email, user_ids[email]))
+        group_ids = manifest.groups.get(folder, [])
+        group_shares.extend(GroupShare(folder, g) for g in group_ids if not index.contains(g, '/' + folder + '/', 'r'))
+        principals = {'identity': set(user_ids.get(email) for email in readers), 'group': set(group_ids)}
+        for rule in by_path.get(acl.normalize_path(folder), []):
+            if rule['principal_type'] in principals and rule['principal'] not in principals[rule['principal_type']] and rule['id'] is not None:
+                unshares.append(rule)
+
+    return Plan(mkdirs, shares, unshares, unknown, index, group_shares)
+
+
+def apply(changes, app_uuid, ep_uuid, message='', session=None, workers=8, journal=None):
+    """
+    Make the changes of a plan: create the folders one tree level at a time, then add and delete
+    the rules, each step on a pool of *workers* threads. A rule of a folder that cannot be created
+    is skipped.
+
+    Parameters
+    ----------
+    changes  : Plan as returned by plan
+    app_uuid : Globus App / Client UUID
+    ep_uuid  : Collection UUID
+    message  : Custom message of the notification sent to the new readers
+    session  : GlobusSession to reuse, default is the shared session for app_uuid / ep_uuid
+    workers  : Number of concurrent Globus requests
+    journal  : gdauth.journal.Journal recording the status of each change
+
+    Returns
+    -------
+    list : [{'action', 'path', 'principal', 'status', 'error'}], action is mkdir, share or unshare, principal is an email or a group UUID,
+           status is one of created, exists, shared, deleted, skipped, error
+    """
+
+    session = session or globus.get_session(app_uuid, ep_uuid)
+    tc = session.tc
+    results = []
+
+    status = {}
+    if changes.mkdirs:
+        # the plan holds the missing parents, a cached folder could be stale
+        status = globus.create_dirs(changes.mkdirs, app_uuid, ep_uuid, parents=False, workers=workers, use_cache=False, session=session,
+                                    journal=journal)
+        results += [{'action': 'mkdir', 'path': '/%s/' % f, 'principal': None, 'status': status[f], 'error': None} for f in changes.mkdirs]
+
+    def share(s):
+        group = isinstance(s, GroupShare)
+        if status.get(s.path, 'exists') in ('error', 'skipped'):
+            result, error = 'skipped', None
+        elif group:
+            result, error = acl.add_rule(tc, changes.index, ep_uuid, s.path, s.group_id, 'group')
+        else:
+            result, error = acl.add_rule(tc, changes.index, ep_uuid, s.path, s.user_id, email=s.email, message=message)
+        if journal is not None:
+            journal.record(('share', s.path, s.group_id if group else s.email), result, error)
+        return result, error
+
+    def unshare(rule):
+        result, error = acl.delete_rule(tc, changes.index, ep_uuid, rule)
+        if journal is not None:
+            journal.record(('unshare', rule['path'], rule['principal']), result, error)
+        return result, error
+
+    with Executor(max_workers=workers) as pool:
+        shares = changes.shares + changes.group_shares
+        for s, (result, error) in zip(shares, pool.map(share, shares)):
+            results.append({'action': 'share', 'path': '/%s/' % s.path, 'principal': getattr(s, 'email', None) or s.group_id,
+                            'status': result, 'error': error})
+        for rule, (result, error) in zip(changes.unshares, pool.map(unshare, changes.unshares)):
+            results.append({'action': 'unshare', 'path': rule['path'], 'principal': rule['principal'], 'status': result, 'error': error})
+    changes.index.save()
+
+    for result in results:
+        if result['error']:
+            log.error('%s %s %s: %s' % (result['action'], result['path'], result['principal'] or '', result['error']))
+    summary = collections.Counter('%s %s' % (r['action'], r['status']) for r in results)
+    log.info('*** Apply: %s' % (', '.join('%s %d' % (k, v) for k, v in sorted(summary.items())) or 'nothing to do'))
+
+    return results
@@ -0,0 +1,229 @@
+import re
+import json
+import time
+import bisect
+import threading
+
+from gdauth import log
+from gdauth import cache
+
+
+__author__ = "Francesco De Carlo"
+__copyright__ = "Copyright (c) 2024, UChicago Argonne, LLC."
+__docformat__ = 'restructuredtext en'
+__all__ = ['ENABLED',
+           'BUCKETS',
+           'enable',
+           'record',
+           'timer',
+           'operation_name',
+           'snapshot',
+           'reset',
+           'log_table',
+           'write_json',
+           'write_prometheus',
+           ]
+
+# operations are only recorded once enable() is called
+ENABLED = False
+
+# upper bounds in seconds of the latency histogram buckets, the last bucket is +Inf
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# path segments replaced by {id} in operation names: UUIDs and numbers
+_ID = re.compile(r'^([0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}|\d+)$')
+
+_operations = {}
+_lock = threading.Lock()
+
+
+def enable(enabled=True):
+    """
+    Start or stop recording operations
+    """
+
+    global ENABLED
+    ENABLED = enabled
+
+
+def operation_name(api, method, path):
+    """
+    Name of an API operation with the identifiers of its path replaced by {id}
+
+    Parameters
+    ----------
+    api    : 'transfer' or 'auth'
+    method : HTTP method
+    path   : Path of the API route
+
+    Returns
+    -------
+    string : e.g. 'transfer GET /operation/endpoint/{id}/ls'
+    """
+
+    path = '/'.join('{id}' if _ID.match(segment) else segment for segment in path.split('?')[0].split('/'))
+
+    return '%s %s %s' % (api, method.upper(), path)
+
+
+def record(name, seconds, error=None, nbytes=0):
+    """
+    Record one operation
+
+    Parameters
+    ----------
+    name    : Operation name
+    seconds : Duration of the operation
+    error   : Error code when the operation failed
+    nbytes  : Bytes received
+    """
+
+    if not ENABLED:
+        return
+    with _lock:
+        op = _operations.get(name)
+        if op is None:
+            op = _operations[name] = {'count': 0, 'seconds': 0.0, 'max': 0.0, 'bytes': 0, 'errors': {},
+                                      'buckets': [0] * (len(BUCKETS) + 1)}
+        op['count'] += 1
+        op['seconds'] += seconds
+        op['max'] = max(op['max'], seconds)
+        op['bytes'] += nbytes
+        op['buckets'][bisect.bisect_left(BUCKETS, seconds)] += 1
+        if error is not None:
+            op['errors'][str(error)] = op['errors'].get(str(error), 0) + 1
+
+
+class timer(object):
+    """
+    Context manager recording the duration of an operation, an exception records its code
+    (or its class name) as the error of the operation and is raised again.
+
+    Parameters
+    ----------
+    name : Operation name
+    """
+
+    __slots__ = ('name', 'start', 'nbytes')
+
+    def __init__(self, name):
+        self.name = name
+        self.nbytes = 0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc is not None:
+            error = getattr(exc, 'code', None) or getattr(exc, 'http_status', None) or exc_type.__name__
+        else:
+            error = None
+        record(self.name, time.perf_counter() - self.start, error, self.nbytes)
+
+
+def snapshot():
+    """
+    Copy of the recorded operations
+
+    Returns
+    -------
+    dictionary : {operation : {'count', 'seconds', 'max', 'bytes', 'errors', 'buckets'}}, buckets counts
+                 the operations per BUCKETS interval, the last one above BUCKETS[-1]
+    """
+
+    with _lock:
+        return json.loads(json.dumps(_operations))
+
+
+def reset():
+    """
+    Forget the recorded operations
+    """
+
+    with _lock:
+        _operations.clear()
+
+
+def _quantile(op, q):
+    """
+    Upper bound of the bucket holding the q quantile of the durations
+    """
+
+    rank = q * op['count']
+    seen = 0
+    for bound, n in zip(BUCKETS + (op['max'],), op['buckets']):
+        seen += n
+        if seen >= rank:
+            return min(bound, op['max'])
+
+    return op['max']
+
+
+def log_table():
+    """
+    Log the recorded operations as a table sorted by total time
+    """
+
+    operations = snapshot()
+    if not operations:
+        log.info('No operation recorded')
+        return
+    log.info('{:<56} {:>7} {:>6} {:>9} {:>9} {:>9} {:>9} {:>11}'.format(
+             'operation', 'count', 'errors', 'total s', 'mean ms', 'p95 ms', 'max ms', 'bytes'))
+    for name, op in sorted(operations.items(), key=lambda kv: -kv[1]['seconds']):
+        log.info('{:<56} {:>7} {:>6} {:>9.3f} {:>9.1f} {:>9.1f} {:>9.1f} {:>11}'.format(
+                 name[:56], op['count'], sum(op['errors'].values()), op['seconds'], 1000 * op['seconds'] / op['count'],
+                 1000 * _quantile(op, 0.95), 1000 * op['max'], op['bytes']))
+        for code, n in sorted(op['errors'].items()):
+            log.warning('{:<56} {:>7} error {}'.format('', n, code))
+
+
+def write_json(file_name):
+    """
+    Save the recorded operations as JSON, see snapshot for the content
+
+    Parameters
+    ----------
+    file_name : Name of the JSON file
+    """
+
+    cache.atomic_write(file_name, json.dumps({'buckets': list(BUCKETS), 'operations': snapshot()}, indent=2), mode=0o644)
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def write_prometheus(file_name, prefix='gdauth'):
+    """
+    Save the recorded operations in the Prometheus text format, e.g. for the node exporter textfile collector
+
+    Parameters
+    ----------
+    file_name : Name of the .prom file
+    prefix    : Prefix of the metric names
+    """
+
+    operations = snapshot()
+    lines = ['# HELP {0}_operations_total Operations run by gdauth'.format(prefix),
+             '# TYPE {0}_operations_total counter'.format(prefix)]
+    lines += ['{0}_operations_total{{operation="{1}"}} {2}'.format(prefix, _label(name), op['count']) for name, op in operations.items()]
+    lines += ['# HELP {0}_operation_errors_total Failed operations by error code'.format(prefix),
+              '# TYPE {0}_operation_errors_total counter'.format(prefix)]
+    lines += ['{0}_operation_errors_total{{operation="{1}",code="{2}"}} {3}'.format(prefix, _label(name), _label(code), n)
+              for name, op in operations.items() for code, n in op['errors'].items()]
+    lines += ['# HELP {0}_operation_received_bytes_total Bytes received by the operations'.format(prefix),
+              '# TYPE {0}_operation_received_bytes_total counter'.format(prefix)]
+    lines += ['{0}_operation_received_bytes_total{{operation="{1}"}} {2}'.format(prefix, _label(name), op['bytes']) for name, op in operations.items()]
+    lines += ['# HELP {0}_operation_duration_seconds Duration of the operations'.format(prefix),
+              '# TYPE {0}_operation_duration_seconds histogram'.format(prefix)]
+    for name, op in operations.items():
+        cumulative = 0
+        for bound, n in zip([str(b) for b in BUCKETS] + ['+Inf'], op['buckets']):
+            cumulative += n
+            lines.append('{0}_operation_duration_seconds_bucket{{operation="{1}",le="{2}"}} {3}'.format(prefix, _label(name), bound, cumulative))
+        lines.append('{0}_operation_duration_seconds_sum{{operation="{1}"}} {2}'.format(prefix, _label(name), op['seconds']))
+        lines.append('{0}_operation_duration_seconds_count{{operation="{1}"}} {2}'.format(prefix, _label(name), op['count']))
+
+    cache.atomic_write(file_name, '\n'.join(lines) + '\n', mode=0o644)
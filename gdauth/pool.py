@@ -0,0 +1,100 @@
+import threading
+import contextvars
+
+from concurrent.futures import ThreadPoolExecutor
+
+from gdauth import log
+
+
+__author__ = "Francesco De Carlo"
+__copyright__ = "Copyright (c) 2024, UChicago Argonne, LLC."
+__docformat__ = 'restructuredtext en'
+__all__ = ['POOL_SIZE',
+           'Executor',
+           'configure',
+           'get_http_session',
+           'attach',
+           ]
+
+# keep-alive connections kept open per host (auth.globus.org, transfer.api.globus.org, the
+# collection HTTPS server), at least the number of worker threads sending requests at once
+POOL_SIZE = 8
+# number of hosts with a connection pool
+POOL_HOSTS = 4
+
+_http_session = None
+_http_session_lock = threading.Lock()
+
+
+class Executor(ThreadPoolExecutor):
+    """
+    ThreadPoolExecutor running each task in a copy of the context of the thread submitting it,
+    so the context variables, e.g. the command whose log gdauth serve sends back, reach the workers
+    """
+
+    def submit(self, fn, *args, **kwargs):
+        return super().submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+def configure(pool_size=None):
+    """
+    Set the number of connections kept open per host, call before the first Globus request
+
+    Parameters
+    ----------
+    pool_size : Connections kept open per host, use at least the number of worker threads
+    """
+
+    global POOL_SIZE, _http_session
+    with _http_session_lock:
+        if pool_size is not None and pool_size != POOL_SIZE:
+            POOL_SIZE = pool_size
+            if _http_session is not None:
+                _http_session.close()
+                _http_session = None
+
+
+def get_http_session():
+    """
+    Return the requests.Session shared by all the Globus clients of the process. TLS connections
+    are kept alive and reused by every client and thread instead of being set up by each client.
+
+    Returns
+    -------
+    requests.Session : HTTP session with POOL_SIZE connections per host
+    """
+
+    global _http_session
+    with _http_session_lock:
+        if _http_session is None:
+            import requests
+            import requests.adapters
+
+            _http_session = requests.Session()
+            # retries are done by gdauth.scheduler
+            adapter = requests.adapters.HTTPAdapter(pool_connections=POOL_HOSTS, pool_maxsize=POOL_SIZE, max_retries=0)
+            _http_session.mount('https://', adapter)
+            _http_session.mount('http://', adapter)
+            log.debug('HTTP connection pool of %d connections per host' % POOL_SIZE)
+        return _http_session
+
+
+def attach(client):
+    """
+    Make a globus_sdk client send its requests through the shared HTTP session
+
+    Parameters
+    ----------
+    client : globus_sdk client
+
+    Returns
+    -------
+    client : the same client
+    """
+
+    transport = client.transport
+    if transport.session is not _http_session:
+        transport.session.close()
+        transport.session = get_http_session()
+
+    return client
@@ -0,0 +1,248 @@
+import time
+import random
+import asyncio
+import threading
+import email.utils
+import globus_sdk
+
+from gdauth import log
+from gdauth import metrics
+
+
+__author__ = "Francesco De Carlo"
+__copyright__ = "Copyright (c) 2024, UChicago Argonne, LLC."
+__docformat__ = 'restructuredtext en'
+__all__ = ['TokenBucket',
+           'DeadlineExceeded',
+           'RATE_LIMITS',
+           'MAX_RETRIES',
+           'configure',
+           'get_bucket',
+           'remaining',
+           'call',
+           'call_async',
+           ]
+
+# maximum requests per second sent to each API by this process, None is no limit
+RATE_LIMITS = {'transfer': 20.0, 'auth': 10.0, 'groups': 10.0}
+# a failed request is sent again at most MAX_RETRIES times
+MAX_RETRIES = 5
+# the n-th retry waits a random time between 0 and min(BACKOFF_MAX, BACKOFF_BASE * 2**n) seconds
+BACKOFF_BASE = 0.5
+BACKOFF_MAX  = 30
+# HTTP status of the errors worth a retry, the errors without status are network errors
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# last part of the error codes that are final whatever the status, e.g. a 502 ExternalError.MkdirFailed.Exists
+FINAL_CODES = ('Exists', 'NotFound', 'PermissionDenied')
+
+_deadline = None
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+class DeadlineExceeded(RuntimeError):
+    """
+    Raised instead of sending a request once the command deadline has passed
+    """
+
+
+class TokenBucket(object):
+    """
+    Token bucket rate limiter shared by the threads and the event loops of a process. Each request
+    reserves one token; the bucket refills at rate tokens per second up to burst tokens.
+    A 429 response with Retry-After pauses the bucket, so all the workers slow down at once.
+
+    Parameters
+    ----------
+    rate  : Tokens per second, None is no limit
+    burst : Bucket size, default is rate (one second of requests)
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1, rate or 1)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        """
+        Take one token, return the number of seconds to wait before sending the request
+        """
+        with self.lock:
+            now = time.monotonic()
+            wait = max(0, self.paused_until - now)
+            if self.rate:
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate) - 1
+                self.updated = now
+                wait = max(wait, -self.tokens / self.rate)
+            return wait
+
+    def pause(self, seconds):
+        """
+        Hold all the requests for seconds
+        """
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+def configure(rate_limits=None, max_retries=None, deadline=None):
+    """
+    Set the request rate limits, the retries and the deadline of the running command
+
+    Parameters
+    ----------
+    rate_limits : {api : requests per second}, api is 'transfer', 'auth' or 'groups'
+    max_retries : Maximum number of retries of a failed request
+    deadline    : Seconds from now after which no request is sent, None is no deadline
+    """
+
+    global MAX_RETRIES, _deadline
+    with _buckets_lock:
+        for api, rate in (rate_limits or {}).items():
+            RATE_LIMITS[api] = rate
+            _buckets.pop(api, None)
+    if max_retries is not None:
+        MAX_RETRIES = max_retries
+    _deadline = None if deadline is None else time.monotonic() + deadline
+
+
+def get_bucket(api):
+    """
+    Return the token bucket of an API
+
+    Parameters
+    ----------
+    api : 'transfer' or 'auth'
+
+    Returns
+    -------
+    TokenBucket : rate limiter shared by all the requests to api
+    """
+
+    with _buckets_lock:
+        if api not in _buckets:
+            _buckets[api] = TokenBucket(RATE_LIMITS.get(api))
+        return _buckets[api]
+
+
+def remaining():
+    """
+    Seconds left before the command deadline, None if there is no deadline
+    """
+
+    return None if _deadline is None else _deadline - time.monotonic()
+
+
+def _retry_after(error):
+    """
+    Seconds requested by the Retry-After header of an error response, None if absent
+    """
+
+    value = (getattr(error, 'headers', None) or {}).get('Retry-After')
+    if value is None:
+        return None
+    try:
+        return max(0, float(value))
+    except ValueError:
+        try:
+            return max(0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+
+def _retry_delay(api, error, attempt):
+    """
+    Seconds to wait before retrying a failed request, None if it must not be retried
+    """
+
+    status = getattr(error, 'http_status', None)
+    if attempt >= MAX_RETRIES or (status is not None and status not in RETRY_STATUSES):
+        return None
+    if str(getattr(error, 'code', None)).rsplit('.', 1)[-1] in FINAL_CODES:
+        return None
+    delay = _retry_after(error)
+    if delay is not None and status == 429:
+        get_bucket(api).pause(delay)
+    if delay is None:
+        delay = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+    left = remaining()
+    if left is not None and delay > left:
+        return None
+    log.warning('%s API error %s, retry %d/%d in %.1f s' % (api, status or 'network', attempt + 1, MAX_RETRIES, delay))
+    metrics.record('retry %s' % api, delay, status or 'network')
+
+    return delay
+
+
+def _wait_time(api):
+    """
+    Reserve a token of the api bucket, return the seconds to wait before sending the request
+    """
+
+    wait = get_bucket(api).reserve()
+    if wait > 0:
+        metrics.record('rate limit wait %s' % api, wait)
+    left = remaining()
+    if left is not None and wait >= left:
+        raise DeadlineExceeded('Command deadline exceeded, %s request not sent' % api)
+
+    return wait
+
+
+def call(api, func, *args, **kwargs):
+    """
+    Call func(*args, **kwargs), a function sending one request to api, within the api rate limit.
+    Network errors and the responses with a status in RETRY_STATUSES are retried after the
+    Retry-After delay or a jittered exponential backoff, until MAX_RETRIES or the command deadline.
+
+    Parameters
+    ----------
+    api  : 'transfer', 'auth' or 'groups'
+    func : Function sending the request
+
+    Returns
+    -------
+    value returned by func
+    """
+
+    attempt = 0
+    while True:
+        time.sleep(_wait_time(api))
+        try:
+            return func(*args, **kwargs)
+        except (globus_sdk.GlobusAPIError, globus_sdk.NetworkError) as e:
+            delay = _retry_delay(api, e, attempt)
+            if delay is None:
+                raise
+        time.sleep(delay)
+        attempt += 1
+
+
+async def call_async(api, errors, func, *args, **kwargs):
+    """
+    Await func(*args, **kwargs) with the rate limit and the retries of call
+
+    Parameters
+    ----------
+    api    : 'transfer' or 'auth'
+    errors : Exception classes raised by func for API and network errors
+    func   : Coroutine function sending the request
+
+    Returns
+    -------
+    value returned by func
+    """
+
+    attempt = 0
+    while True:
+        await asyncio.sleep(_wait_time(api))
+        try:
+            return await func(*args, **kwargs)
+        except errors as e:
+            delay = _retry_delay(api, e, attempt)
+            if delay is None:
+                raise
+        await asyncio.sleep(delay)
+        attempt += 1
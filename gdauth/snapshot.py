@@ -0,0 +1,152 @@
+import os
+import json
+import time
+import hashlib
+import collections
+
+from gdauth import log
+from gdauth import cache
+from gdauth import export
+from gdauth import globus
+
+
+__author__ = "Francesco De Carlo"
+__copyright__ = "Copyright (c) 2024, UChicago Argonne, LLC."
+__docformat__ = 'restructuredtext en'
+__all__ = ['Snapshot',
+           'Delta',
+           'DELTA_FIELDS',
+           'delta_record',
+           ]
+
+SNAPSHOT_DIR = os.path.join(cache.CACHE_DIR, 'snapshots')
+
+# link of an item added, changed or removed since the last snapshot
+Delta = collections.namedtuple('Delta', ['change', 'link'])
+
+# fields of a delta record
+DELTA_FIELDS = ('change',) + export.FIELDS
+
+
+def delta_record(delta):
+    """
+    Convert a Delta to a record of the link export
+
+    Parameters
+    ----------
+    delta : Delta as yielded by Snapshot.links
+
+    Returns
+    -------
+    dictionary : {'change', 'name', 'type', 'size', 'mtime', 'url'}, change is added, changed or removed
+    """
+
+    return dict(export.link_record(delta.link), change=delta.change)
+
+
+class Snapshot(object):
+    """
+    Listing of a collection folder (name, type, size, last_modified of each item) saved in
+    ~/.gdauth/snapshots after each run, so that the next run only reports the items added,
+    changed or removed in between. Each folder and set of walk options has its own snapshot.
+
+    Parameters
+    ----------
+    ep_uuid      : Collection UUID
+    directory    : Top directory of the listing
+    options      : Walk options changing the listed items (max_depth, include, exclude)
+    snapshot_dir : Directory of the snapshot files
+    """
+
+    def __init__(self, ep_uuid, directory, options=None, snapshot_dir=SNAPSHOT_DIR):
+        self.ep_uuid = ep_uuid
+        self.top = str(directory).rstrip('/')
+        self.options = options or {}
+        key = json.dumps([ep_uuid, self.top, self.options], sort_keys=True)
+        self.file_name = os.path.join(snapshot_dir, hashlib.sha1(key.encode()).hexdigest() + '.json')
+        self.items = self._load()
+        self.current = None
+
+    def _load(self):
+        try:
+            with open(self.file_name) as f:
+                return json.load(f)['items']
+        except FileNotFoundError:
+            return {}
+        except (ValueError, KeyError):
+            log.warning('Ignoring corrupted snapshot %s' % self.file_name)
+            return {}
+
+    def _path(self, directory, name):
+        return (directory[len(self.top):].strip('/') + '/' + name).strip('/')
+
+    def diff(self, entries):
+        """
+        Compare a listing with the snapshot. Items under a folder that could not be listed are kept as they were.
+
+        Parameters
+        ----------
+        entries : Iterable of WalkEntry as yielded by gdauth.walk.walk
+
+        Yields
+        ------
+        (change, directory, item) : change is added, changed or removed
+        """
+
+        current = {}
+        failed = []
+        for entry in entries:
+            if entry.item is None:
+                failed.append(self._path(entry.directory, ''))
+                continue
+            path = self._path(entry.directory, entry.item.name)
+            state = [entry.item.type, entry.item.size, entry.item.last_modified]
+            current[path] = state
+            previous = self.items.get(path)
+            if previous is None:
+                yield 'added', entry.directory, entry.item
+            elif previous != state:
+                yield 'changed', entry.directory, entry.item
+
+        for path, state in self.items.items():
+            if path in current:
+                continue
+            if any(path.startswith(f + '/') or f == '' for f in failed):
+                current[path] = state
+                continue
+            directory, _, name = (self.top + '/' + path).rpartition('/')
+            yield 'removed', directory, globus.Item(name, *state)
+
+        # save() only replaces the snapshot with a listing compared to the end
+        self.current = current
+
+    def links(self, entries, app_uuid, ep_uuid, session=None):
+        """
+        Links of the items added, changed or removed since the snapshot
+
+        Parameters
+        ----------
+        entries  : Iterable of WalkEntry as yielded by gdauth.walk.walk
+        app_uuid : Globus App / Client UUID
+        ep_uuid  : Collection UUID
+        session  : GlobusSession to reuse, default is the shared session for app_uuid / ep_uuid
+
+        Yields
+        ------
+        Delta : (change, link)
+        """
+
+        for change, directory, item in self.diff(entries):
+            for link in globus.item_links(directory, item, app_uuid, ep_uuid, session=session):
+                yield Delta(change, link)
+
+    def save(self):
+        """
+        Replace the snapshot with the listing compared by the last complete diff, call once its changes are published
+        """
+
+        if self.current is None:
+            return
+        data = {'ep_uuid': self.ep_uuid, 'directory': self.top, 'options': self.options, 'time': time.time(), 'items': self.current}
+        cache.atomic_write(self.file_name, json.dumps(data))
+        self.items, self.current = self.current, None
@@ -0,0 +1,258 @@
+import os
+import json
+import sqlite3
+import threading
+import contextlib
+
+from gdauth import log
+from gdauth import cache
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+
+__author__ = "Francesco De Carlo"
+__copyright__ = "Copyright (c) 2024, UChicago Argonne, LLC."
+__docformat__ = 'restructuredtext en'
+__all__ = ['FileLock',
+           'TokenStore',
+           'JSONTokenStore',
+           'SQLiteTokenStore',
+           'TOKEN_STORES',
+           'REFRESH_MARGIN',
+           'BACKGROUND_REFRESH',
+           'configure',
+           'get_token_store',
+           'import_legacy_token',
+           'tokens_from_response',
+           ]
+
+
+class FileLock(object):
+    """
+    Exclusive inter-process lock held on file_name, also exclusive between the threads of a process.
+    Use as a context manager.
+
+    Parameters
+    ----------
+    file_name : Name of the lock file, created if missing
+    """
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self.thread_lock = threading.RLock()
+        self.f = None
+        self.depth = 0
+
+    def __enter__(self):
+        self.thread_lock.acquire()
+        if self.depth == 0:
+            os.makedirs(os.path.dirname(os.path.abspath(self.file_name)), exist_ok=True)
+            self.f = open(self.file_name, 'a+')
+            if fcntl is not None:
+                fcntl.flock(self.f.fileno(), fcntl.LOCK_EX)
+            else:
+                self.f.seek(0)
+                msvcrt.locking(self.f.fileno(), msvcrt.LK_LOCK, 1)
+        self.depth += 1
+        return self
+
+    def __exit__(self, *exc):
+        self.depth -= 1
+        if self.depth == 0:
+            if fcntl is not None:
+                fcntl.flock(self.f.fileno(), fcntl.LOCK_UN)
+            else:
+                self.f.seek(0)
+                msvcrt.locking(self.f.fileno(), msvcrt.LK_UNLCK, 1)
+            self.f.close()
+            self.f = None
+        self.thread_lock.release()
+
+
+def tokens_from_response(token_response):
+    """
+    Convert a globus_sdk OAuthTokenResponse to the plain dictionary saved in a token store
+
+    Parameters
+    ----------
+    token_response : OAuthTokenResponse
+
+    Returns
+    -------
+    dictionary : {resource server : {'access_token', 'refresh_token', 'expires_at_seconds', 'scope', 'token_type'}}
+    """
+
+    tokens = {}
+    for resource_server, data in token_response.by_resource_server.items():
+        tokens[resource_server] = {key: data.get(key) for key in ('access_token', 'refresh_token', 'expires_at_seconds', 'scope', 'token_type')}
+
+    return tokens
+
+
+class TokenStore(object):
+    """
+    Base class of the token stores. Tokens are saved per App / Client UUID as a dictionary
+    {resource server : token data}. Readers never see a partially written store; a process
+    creating or refreshing tokens holds lock() so that the others wait and reuse its result.
+
+    Parameters
+    ----------
+    file_name : Name of the token file
+    """
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self._lock = FileLock(file_name + '.lock')
+
+    def lock(self):
+        """
+        Inter-process lock to hold while creating or refreshing tokens
+        """
+        return self._lock
+
+    def load(self, app_uuid):
+        """
+        Return the {resource server : token data} dictionary saved for app_uuid, empty if none
+        """
+        raise NotImplementedError
+
+    def save(self, app_uuid, tokens):
+        """
+        Add or replace the tokens of the resource servers in tokens, the other resource servers are kept
+        """
+        raise NotImplementedError
+
+
+class JSONTokenStore(TokenStore):
+    """
+    Token store saved as a JSON file readable only by the user, updated with atomic writes
+    """
+
+    def _read(self):
+        try:
+            with open(self.file_name) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def load(self, app_uuid):
+        return self._read().get(app_uuid, {})
+
+    def save(self, app_uuid, tokens):
+        with self.lock():
+            data = self._read()
+            data.setdefault(app_uuid, {}).update(tokens)
+            cache.atomic_write(self.file_name, json.dumps(data, indent=2))
+
+
+class SQLiteTokenStore(TokenStore):
+    """
+    Token store saved as a SQLite database, one row per App / Client UUID and resource server
+    """
+
+    def _connect(self):
+        """
+        Connection to the database, closed by the caller. A missing database is created readable only by the user.
+        """
+        if not os.path.exists(self.file_name):
+            os.makedirs(os.path.dirname(os.path.abspath(self.file_name)), exist_ok=True)
+            os.close(os.open(self.file_name, os.O_WRONLY | os.O_CREAT, 0o600))
+        connection = sqlite3.connect(self.file_name, timeout=30)
+        connection.execute('CREATE TABLE IF NOT EXISTS tokens (app_uuid TEXT, resource_server TEXT, data TEXT, '
+                           'PRIMARY KEY (app_uuid, resource_server))')
+        return connection
+
+    def load(self, app_uuid):
+        with contextlib.closing(self._connect()) as connection, connection:
+            rows = connection.execute('SELECT resource_server, data FROM tokens WHERE app_uuid = ?', (app_uuid,)).fetchall()
+        return {resource_server: json.loads(data) for resource_server, data in rows}
+
+    def save(self, app_uuid, tokens):
+        with self.lock(), contextlib.closing(self._connect()) as connection, connection:
+            connection.executemany('INSERT OR REPLACE INTO tokens VALUES (?, ?, ?)',
+                                   [(app_uuid, rs, json.dumps(data)) for rs, data in tokens.items()])
+
+
+TOKEN_STORES = {'json':   (JSONTokenStore,   os.path.join(cache.CACHE_DIR, 'tokens.json')),
+                'sqlite': (SQLiteTokenStore, os.path.join(cache.CACHE_DIR, 'tokens.sqlite'))}
+
+# tokens expiring within REFRESH_MARGIN seconds are renewed with their refresh token
+REFRESH_MARGIN = 3600
+# renew the tokens of each GlobusSession on a background thread
+BACKGROUND_REFRESH = False
+
+_store = None
+_store_options = ('json', None)
+
+
+def configure(kind='json', file_name=None, refresh_margin=None, background_refresh=None):
+    """
+    Select the token store used by get_token_store and the token renewal options
+
+    Parameters
+    ----------
+    kind               : 'json' or 'sqlite'
+    file_name          : Name of the token file, default is ~/.gdauth/tokens.json or ~/.gdauth/tokens.sqlite
+    refresh_margin     : Renew tokens expiring within refresh_margin seconds
+    background_refresh : Renew the tokens of each GlobusSession on a background thread
+    """
+
+    global _store, _store_options, REFRESH_MARGIN, BACKGROUND_REFRESH
+    if kind not in TOKEN_STORES:
+        raise RuntimeError('Unknown token store %s, use one of %s' % (kind, ', '.join(TOKEN_STORES)))
+    _store, _store_options = None, (kind, file_name)
+    if refresh_margin is not None:
+        REFRESH_MARGIN = refresh_margin
+    if background_refresh is not None:
+        BACKGROUND_REFRESH = background_refresh
+
+
+def get_token_store():
+    """
+    Return the token store selected with configure
+
+    Returns
+    -------
+    TokenStore : token store
+    """
+
+    global _store
+    if _store is None:
+        kind, file_name = _store_options
+        store_class, default_file_name = TOKEN_STORES[kind]
+        _store = store_class(file_name or default_file_name)
+    return _store
+
+
+def import_legacy_token(store, app_uuid, legacy_file=os.path.join(os.path.expanduser('~'), 'token.npy')):
+    """
+    Import the tokens of the pickled ~/token.npy file written by older gdauth versions, numpy is only
+    needed for this one time conversion
+
+    Parameters
+    ----------
+    store       : TokenStore receiving the tokens
+    app_uuid    : Globus App / Client UUID
+    legacy_file : Name of the legacy token file
+
+    Returns
+    -------
+    dictionary : imported tokens, empty if there is no legacy token file
+    """
+
+    if not os.path.exists(legacy_file):
+        return {}
+    try:
+        import numpy as np
+        tokens = tokens_from_response(np.load(legacy_file, allow_pickle=True).item())
+    except Exception as e:
+        log.warning('Cannot import legacy token file %s: %s' % (legacy_file, e))
+        return {}
+    store.save(app_uuid, tokens)
+    log.info('Imported %s into %s' % (legacy_file, store.file_name))
+
+    return tokens
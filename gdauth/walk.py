@@ -0,0 +1,162 @@
+import fnmatch
+import collections
+import globus_sdk
+
+from concurrent.futures import wait, FIRST_COMPLETED
+
+from gdauth.pool import Executor
+
+from gdauth import log
+from gdauth import globus
+
+
+__author__ = "Francesco De Carlo"
+__copyright__ = "Copyright (c) 2024, UChicago Argonne, LLC."
+__docformat__ = 'restructuredtext en'
+__all__ = ['walk',
+           'walk_links',
+           'disk_usage',
+           'WalkEntry',
+           ]
+
+# item found by walk: directory is the folder containing the item, depth is 1 for the items of
+# the top directory. When listing a directory fails item is None and error holds the message.
+WalkEntry = collections.namedtuple('WalkEntry', ['directory', 'depth', 'item', 'error'])
+
+
+def _matches(patterns, directory, name, top):
+    """
+    True if the item name or its path relative to the top directory matches one of the patterns
+    """
+
+    relative = (directory[len(top):].strip('/') + '/' + name).strip('/')
+    return any(fnmatch.fnmatch(name, p) or fnmatch.fnmatch(relative, p) for p in patterns)
+
+
+def _list(directory, app_uuid, ep_uuid, session, use_cache):
+    """
+    List one directory, return (items, error) so that one failing directory does not stop the walk
+    """
+
+    try:
+        return list(globus.iter_items(directory, app_uuid, ep_uuid, session=session, use_cache=use_cache)), None
+    except globus_sdk.TransferAPIError as e:
+        log.error(f"Transfer API Error on {directory}: {e.code} - {e.message}")
+        return [], f"{e.code} - {e.message}"
+
+
+def walk(directory,        # Top directory of the tree
+         app_uuid,         # Globus App / Client UUID
+         ep_uuid,          # Collection UUID
+         max_depth=None,   # Maximum number of levels listed below the top directory
+         include=None,     # Only yield items matching one of these patterns
+         exclude=None,     # Skip items, and folders content, matching one of these patterns
+         workers=8,        # Number of directories listed concurrently
+         session=None,     # GlobusSession to reuse
+         use_cache=True):  # Reuse the cached directory listings
+    """
+    Walk a collection tree, the subdirectories are listed concurrently on a pool of *workers* threads
+    and the items are yielded as soon as their directory listing completes (the order is not defined).
+    Patterns are shell wildcards matched against the item name and against its path relative to directory.
+    A directory that cannot be listed yields a single WalkEntry with its error and the walk continues.
+
+    Parameters
+    ----------
+    directory : Top directory of the tree
+    app_uuid  : Globus App / Client UUID
+    ep_uuid   : Collection UUID
+    max_depth : Maximum number of levels listed below the top directory, default is no limit
+    include   : Only yield items matching one of these patterns, folders are always walked
+    exclude   : Skip items, and folders content, matching one of these patterns
+    workers   : Number of directories listed concurrently
+    session   : GlobusSession to reuse, default is the shared session for app_uuid / ep_uuid
+    use_cache : Reuse the cached directory listings, with False every directory is listed
+
+    Yields
+    ------
+    WalkEntry : (directory, depth, item, error)
+    """
+
+    session = session or globus.get_session(app_uuid, ep_uuid)
+    # an empty path is the default directory of the collection, not its root
+    top = str(directory).rstrip('/') or '/'
+    include = include or []
+    exclude = exclude or []
+
+    with Executor(max_workers=workers) as pool:
+        pending = {pool.submit(_list, top, app_uuid, ep_uuid, session, use_cache): (top, 1)}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                parent, depth = pending.pop(future)
+                items, error = future.result()
+                if error:
+                    yield WalkEntry(parent, depth, None, error)
+                for item in items:
+                    if exclude and _matches(exclude, parent, item.name, top):
+                        continue
+                    if item.type == 'dir' and (max_depth is None or depth < max_depth):
+                        subdir = parent.rstrip('/') + '/' + item.name
+                        pending[pool.submit(_list, subdir, app_uuid, ep_uuid, session, use_cache)] = (subdir, depth + 1)
+                    if not include or _matches(include, parent, item.name, top):
+                        yield WalkEntry(parent, depth, item, None)
+
+
+def walk_links(directory, app_uuid, ep_uuid, session=None, **kwargs):
+    """
+    Create the links for all items (folder and files) of a collection tree, see walk for the options
+
+    Parameters
+    ----------
+    directory : Top directory of the tree
+    app_uuid  : Globus App / Client UUID
+    ep_uuid   : Collection UUID
+    session   : GlobusSession to reuse, default is the shared session for app_uuid / ep_uuid
+
+    Yields
+    ------
+    Link : (item, kind, url), kind is 'file' or 'folder'
+    """
+
+    session = session or globus.get_session(app_uuid, ep_uuid)
+    for entry in walk(directory, app_uuid, ep_uuid, session=session, **kwargs):
+        if entry.item is not None:
+            yield from globus.item_links(entry.directory, entry.item, app_uuid, ep_uuid, session=session)
+
+
+def disk_usage(directory, app_uuid, ep_uuid, session=None, **kwargs):
+    """
+    Count files, folders and bytes of a collection tree, see walk for the options
+
+    Parameters
+    ----------
+    directory : Top directory of the tree
+    app_uuid  : Globus App / Client UUID
+    ep_uuid   : Collection UUID
+    session   : GlobusSession to reuse, default is the shared session for app_uuid / ep_uuid
+
+    Returns
+    -------
+    dictionary : {top level folder or '.' : {'files', 'folders', 'bytes', 'errors'}}, the
+                 '.' entry holds the totals of the whole tree, a top level folder is counted
+                 in '.' and its entry counts its content
+    """
+
+    top = str(directory).rstrip('/') or '/'
+    usage = collections.defaultdict(lambda: {'files': 0, 'folders': 0, 'bytes': 0, 'errors': 0})
+    for entry in walk(top, app_uuid, ep_uuid, session=session, **kwargs):
+        relative = entry.directory[len(top):].strip('/')
+        if entry.item is not None and entry.depth == 1 and entry.item.type == 'dir':
+            # an empty top level folder is listed too
+            usage[entry.item.name]
+        keys = ['.', relative.split('/')[0]] if relative else ['.']
+        for key in keys:
+            if entry.item is None:
+                usage[key]['errors'] += 1
+            elif entry.item.type == 'dir':
+                usage[key]['folders'] += 1
+            else:
+                usage[key]['files'] += 1
+                usage[key]['bytes'] += entry.item.size or 0
+
+    return dict(usage)
@@ -7,6 +7,7 @@ setup(
     description = 'Globus Data Management Tool.',
     packages = find_packages(),
     entry_points={'console_scripts':['gdauth = gdauth.__main__:main'],},
+    extras_require={'aio': ['aiohttp'], 'yaml': ['pyyaml']},
     version = open('VERSION').read().strip(),
     zip_safe = False,
     url='http://gdauth.readthedocs.org',
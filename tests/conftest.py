@@ -0,0 +1,44 @@
+"""
+Fixtures running the gdauth command line against the fake Globus server of benchmarks/fake_globus.py,
+each test in its own home directory so that the gdauth caches start empty.
+
+"""
+import os
+import sys
+import subprocess
+import collections
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+from fake_globus import FakeGlobus, seed_tokens, APP_UUID, EP_UUID
+
+
+@pytest.fixture
+def fake():
+    with FakeGlobus() as server:
+        yield server
+
+
+@pytest.fixture
+def gdauth(fake, tmp_path):
+    """
+    Run a gdauth command, return (completed process, Globus requests made by the command)
+    """
+
+    home = str(tmp_path)
+    seed_tokens(os.path.join(home, '.gdauth', 'tokens.json'))
+    env = dict(os.environ, HOME=home, PYTHONPATH=ROOT, **fake.env())
+
+    def run(*argv):
+        before = collections.Counter(fake.counts)
+        process = subprocess.run([sys.executable, '-m', 'gdauth'] + list(argv) +
+                                 ['--config', os.path.join(home, 'gdauth.conf'), '--app-uuid', APP_UUID, '--ep-uuid', EP_UUID],
+                                 env=env, cwd=home, capture_output=True, text=True, timeout=120)
+        return process, collections.Counter(fake.counts) - before
+
+    run.home = home
+    return run
@@ -0,0 +1,50 @@
+import json
+
+LS = 'GET /operation/endpoint/{id}/ls'
+ACCESS = 'POST /endpoint/{id}/access'
+
+
+def _pairs(gdauth, pairs):
+    csv_file = gdauth.home + '/pairs.csv'
+    with open(csv_file, 'w') as f:
+        f.write(''.join('%s,%s\n' % pair for pair in pairs))
+    return csv_file
+
+
+def test_share_from_csv_again_uses_access_rule_index(fake, gdauth):
+    for i in range(5):
+        fake.add_tree('/data/%d' % i)
+    csv_file = _pairs(gdauth, [('data/%d' % i, 'user%d@anl.gov' % i) for i in range(5)])
+
+    process, counts = gdauth('share', '--from-csv', csv_file)
+    assert process.returncode == 0, process.stderr
+    assert counts[ACCESS] == 5
+
+    # every pair is in the access rule index: no folder check and no new rule
+    process, counts = gdauth('share', '--from-csv', csv_file)
+    assert process.returncode == 0, process.stderr
+    assert counts[LS] == 0
+    assert counts[ACCESS] == 0
+    assert 'exists 5' in process.stderr
+
+
+def test_share_from_csv_records_every_pair_past_the_deadline(fake, gdauth):
+    for i in range(20):
+        fake.add_tree('/data/%d' % i)
+    csv_file = _pairs(gdauth, [('data/%d' % i, 'user%d@anl.gov' % i) for i in range(20)])
+    report = gdauth.home + '/report.jsonl'
+    fake.latency = 0.1
+
+    # the requests still to send once the deadline has passed fail one pair each, not the whole run
+    process, counts = gdauth('share', '--from-csv', csv_file, '--report', report, '--workers', '1', '--deadline', '1')
+    with open(report) as f:
+        results = [json.loads(line) for line in f]
+
+    assert 'Traceback' not in process.stderr
+    assert len(results) == 20
+    assert any(r['status'] == 'shared' for r in results)
+    assert any(r['status'] == 'error' and 'DeadlineExceeded' in r['error'] for r in results)
+    # the rules added before the deadline are saved in the access rule index
+    with open(gdauth.home + '/.gdauth/acl_index.json') as f:
+        index = f.read()
+    assert all(fake.identity(r['email']) in index for r in results if r['status'] == 'shared')
@@ -0,0 +1,36 @@
+LS = 'GET /operation/endpoint/{id}/ls'
+MKDIR = 'POST /operation/endpoint/{id}/mkdir'
+
+
+def test_share_from_csv_full_page_parent(fake, gdauth):
+    # exactly one page of entries: the parent listing holds the whole directory and answers every folder check
+    fake.add_tree('/data', folders=1000)
+    csv_file = gdauth.home + '/pairs.csv'
+    with open(csv_file, 'w') as f:
+        f.write(''.join('data/folder_%06d,user%d@anl.gov\n' % (i, i) for i in range(0, 1000, 100)))
+
+    process, counts = gdauth('share', '--from-csv', csv_file)
+
+    assert process.returncode == 0, process.stderr
+    assert counts[LS] == 1
+    assert len(fake.rules) == 10
+
+
+def test_create_from_file_recreates_deleted_leaf(fake, gdauth):
+    dirs_file = gdauth.home + '/dirs.txt'
+    with open(dirs_file, 'w') as f:
+        f.write('data/a/leaf\n')
+
+    process, counts = gdauth('create', '--from-file', dirs_file, '--parents')
+    assert process.returncode == 0, process.stderr
+    assert counts[MKDIR] == 3
+
+    # the leaf is deleted outside gdauth while it is in the cache of the existing folders
+    with fake.lock:
+        del fake.tree['/data/a/leaf/']
+        del fake.tree['/data/a/']['leaf']
+
+    process, counts = gdauth('create', '--from-file', dirs_file, '--parents')
+    assert process.returncode == 0, process.stderr
+    assert counts[MKDIR] == 1
+    assert '/data/a/leaf/' in fake.tree
@@ -0,0 +1,22 @@
+import json
+
+
+def test_plan_missing_manifest(fake, gdauth):
+    process, counts = gdauth('plan', gdauth.home + '/missing.yaml')
+
+    assert process.returncode == 1
+    assert 'Traceback' not in process.stderr
+    assert 'Cannot read manifest %s/missing.yaml: No such file or directory' % gdauth.home in process.stderr
+    assert not counts
+
+
+def test_plan_invalid_readers(fake, gdauth):
+    manifest = gdauth.home + '/manifest.json'
+    with open(manifest, 'w') as f:
+        json.dump({'folders': [{'path': 'data', 'readers': [123]}]}, f)
+
+    process, counts = gdauth('plan', manifest)
+
+    assert process.returncode == 1
+    assert 'Traceback' not in process.stderr
+    assert 'readers of folder data must be a list of strings' in process.stderr
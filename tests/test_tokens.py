@@ -0,0 +1,23 @@
+import os
+import stat
+import sqlite3
+
+import pytest
+
+from gdauth import tokens
+
+
+def test_sqlite_token_store_closes_connections(tmp_path, monkeypatch):
+    connections = []
+    connect = sqlite3.connect
+    monkeypatch.setattr(sqlite3, 'connect', lambda *args, **kwargs: connections.append(connect(*args, **kwargs)) or connections[-1])
+    store = tokens.SQLiteTokenStore(str(tmp_path / 'tokens.sqlite'))
+
+    store.save('app', {'transfer.api.globus.org': {'access_token': 'token'}})
+    assert store.load('app') == {'transfer.api.globus.org': {'access_token': 'token'}}
+
+    assert len(connections) == 2
+    for connection in connections:
+        with pytest.raises(sqlite3.ProgrammingError):
+            connection.execute('SELECT 1')
+    assert stat.S_IMODE(os.stat(store.file_name).st_mode) == 0o600
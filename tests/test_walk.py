@@ -0,0 +1,36 @@
+import re
+
+
+def _usage(stderr):
+    # "{bytes} bytes {files} files {folders} folders  name" lines of gdauth du
+    return dict((m.group(4), tuple(int(g) for g in m.groups()[:3]))
+                for m in re.finditer(r'(\d+) bytes +(\d+) files +(\d+) folders  ([^\s\x1b]+)', stderr))
+
+
+def test_du_collection_root(fake, gdauth):
+    fake.add_tree('/home/gdauth', files=5)
+    fake.default_directory = '/home/gdauth/'
+    fake.add_tree('/a', files=2, folders=1)
+    fake.add_tree('/b')
+
+    process, counts = gdauth('du', '--dir', '/', '--recursive')
+
+    assert process.returncode == 0, process.stderr
+    usage = _usage(process.stderr)
+    # a top level folder is a folder of the root, not of itself
+    assert usage['a'] == (2048, 2, 1)
+    assert usage['b'] == (0, 0, 0)
+    assert usage['/'] == (7168, 7, 5)
+
+
+def test_links_recursive_collection_root(fake, gdauth):
+    fake.add_tree('/a', files=1)
+    fake.default_directory = '/a/'
+
+    process, counts = gdauth('links', '--dir', '/', '--recursive')
+
+    assert process.returncode == 0, process.stderr
+    assert 'origin_path=a\x1b' in process.stderr
+    assert 'data.globus.org/a/file_000000.h5' in process.stderr
+    assert 'origin_path=/' not in process.stderr
+    assert '.org//' not in process.stderr